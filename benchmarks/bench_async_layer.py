@@ -0,0 +1,174 @@
+"""
+Measures throughput and tail latency of weather and geocoding clients against the
+local stand-in server of benchmarks/fake_api_server.py, started in this process
+unless --server-url of an already running one is given.
+
+Usage:
+    python -m benchmarks.bench_async_layer [--cities 10000] [--hotels 10000]
+        [--latency lognormal] [--latency-mean 0.05] [--error-rate 0.0]
+        [--rate-limit 500] [--server-url http://127.0.0.1:8080]
+"""
+
+import argparse
+import asyncio
+import time
+from functools import partial
+from typing import List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from benchmarks.fake_api_server import (
+    LATENCY_DISTRIBUTIONS,
+    FakeApiServer,
+    make_latency_sampler,
+)
+from utils.async_utils import (
+    HereBackend,
+    RequestCoalescer,
+    get_addresses,
+    get_weather,
+    make_geocoding_rate_limiter,
+)
+from utils.http_utils import make_client_session
+
+
+class TimedHereBackend(HereBackend):
+    """HereBackend recording the latency of every request"""
+
+    def __init__(self, session=None, base_url=None, latencies: List[float] = None):
+        super().__init__(session, base_url=base_url)
+        self.latencies = latencies
+
+    async def reverse(self, lat: float, lon: float):
+        start = time.perf_counter()
+        try:
+            return await super().reverse(lat, lon)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def describe(name: str, count: int, elapsed: float, latencies: List[float]) -> str:
+    """Makes a line of the results table, latencies are in milliseconds"""
+    percentiles = np.percentile(latencies, [50, 95, 99, 100]) * 1000
+    return "\t".join(
+        [name, str(count), f"{elapsed:.2f}", f"{count / elapsed:.1f}"]
+        + [f"{value:.1f}" for value in percentiles]
+    )
+
+
+async def bench_weather(base_url: str, cities: int, args) -> str:
+    rng = np.random.default_rng(0)
+    coords = np.column_stack(
+        [rng.uniform(-60, 60, cities), rng.uniform(-180, 180, cities)]
+    ).round(4)
+    latencies = []
+    failures = 0
+
+    async def timed_get_weather(lat, lon, session, coalescer):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await get_weather(
+                lat, lon, session, coalescer=coalescer, base_url=f"{base_url}/data/2.5"
+            )
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with make_client_session(
+        limit=args.http_connections, limit_per_host=args.http_connections
+    ) as session:
+        coalescer = RequestCoalescer()
+        await asyncio.gather(
+            *[timed_get_weather(lat, lon, session, coalescer) for lat, lon in coords]
+        )
+    elapsed = time.perf_counter() - start
+    print(f"Weather: {failures} cities failed, {coalescer.stats()}")  # noqa: T001
+    return describe("weather", cities, elapsed, latencies)
+
+
+async def bench_geocoding(base_url: str, hotels: int, args) -> str:
+    rng = np.random.default_rng(1)
+    coords = list(zip(rng.uniform(-60, 60, hotels), rng.uniform(-180, 180, hotels)))
+    latencies = []
+    rate_limiter = make_geocoding_rate_limiter(
+        args.geocoding_rate,
+        max_in_flight=args.http_connections,
+        max_rate=args.geocoding_rate,
+    )
+
+    start = time.perf_counter()
+    async with make_client_session(
+        limit=args.http_connections, limit_per_host=args.http_connections
+    ) as session:
+        await get_addresses(
+            coords,
+            rate_limiter=rate_limiter,
+            session=session,
+            backend_factory=partial(
+                TimedHereBackend, base_url=base_url, latencies=latencies
+            ),
+        )
+    elapsed = time.perf_counter() - start
+    print(f"Geocoding rate limiter: {rate_limiter.stats()}")  # noqa: T001
+    return describe("geocoding", hotels, elapsed, latencies)
+
+
+async def run(args) -> None:
+    runner = None
+    base_url: Optional[str] = args.server_url
+    server = None
+    if base_url is None:
+        server = FakeApiServer(
+            latency=make_latency_sampler(
+                args.latency, args.latency_mean, args.latency_sigma
+            ),
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit,
+        )
+        runner = web.AppRunner(server.make_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        base_url = f"http://{host}:{port}"
+
+    try:
+        lines = []
+        if args.cities:
+            lines.append(await bench_weather(base_url, args.cities, args))
+        if args.hotels:
+            lines.append(await bench_geocoding(base_url, args.hotels, args))
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+    print(  # noqa: T001
+        "client\tcount\tseconds\tper second\tp50 ms\tp95 ms\tp99 ms\tmax ms"
+    )
+    for line in lines:
+        print(line)  # noqa: T001
+    if server is not None:
+        print(f"Server responses: {dict(server.responses)}")  # noqa: T001
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=10_000)
+    parser.add_argument("--hotels", type=int, default=10_000)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=0.05)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--geocoding-rate", type=float, default=1000.0)
+    parser.add_argument("--http-connections", type=int, default=100)
+    parser.add_argument("--server-url", type=str, default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
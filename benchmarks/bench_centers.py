@@ -0,0 +1,53 @@
+"""
+Measures computation time of every city center method for many cities.
+
+Usage:
+    python -m benchmarks.bench_centers [--cities 50000] [--hotels-per-city 10]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.center_utils import CENTER_METHODS, compute_city_centers
+
+
+def generate_cities(cities: int, hotels_per_city: int, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    city_ids = np.repeat(np.arange(cities), hotels_per_city)
+    rows = len(city_ids)
+    return pd.DataFrame(
+        {
+            "Country": pd.Categorical(city_ids % 200),
+            "City": pd.Categorical(city_ids),
+            "Latitude": rng.uniform(-60, 60, cities)[city_ids]
+            + rng.normal(0, 0.05, rows),
+            "Longitude": np.mod(
+                rng.uniform(-180, 180, cities)[city_ids]
+                + rng.normal(0, 0.05, rows)
+                + 180,
+                360,
+            )
+            - 180,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=50_000)
+    parser.add_argument("--hotels-per-city", type=int, default=10)
+    args = parser.parse_args()
+
+    hotels = generate_cities(args.cities, args.hotels_per_city)
+    print("method\tseconds")  # noqa: T001
+    for method in CENTER_METHODS:
+        start = time.perf_counter()
+        compute_city_centers(hotels, method=method)
+        print(f"{method}\t{time.perf_counter() - start:.3f}")  # noqa: T001
+
+
+if __name__ == "__main__":
+    main()
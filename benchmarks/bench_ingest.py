@@ -0,0 +1,48 @@
+"""
+Measures how ingest of a hotels archive scales with the number of archive parts and
+worker processes.
+
+Usage:
+    python -m benchmarks.bench_ingest [--rows 1000000] [--parts 1 4 16 32]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_data import generate_hotels_zip
+from utils.dataframe_utils import refine_data
+from utils.file_utils import read_csv_from_zipfile, read_csv_from_zipfile_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--parts", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    args = parser.parse_args()
+
+    print("parts\tworkers\tseconds")  # noqa: T001
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for parts in args.parts:
+            zip_path = Path(tmp_dir) / f"hotels_{parts}.zip"
+            generate_hotels_zip(zip_path, args.rows, parts=parts)
+
+            for workers in sorted(set(args.workers)):
+                start = time.perf_counter()
+                if workers == 1:
+                    refine_data(read_csv_from_zipfile(zip_path))
+                else:
+                    read_csv_from_zipfile_parallel(
+                        zip_path, workers=workers, transform=refine_data
+                    )
+                elapsed = time.perf_counter() - start
+                print(f"{parts}\t{workers}\t{elapsed:.3f}")  # noqa: T001
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares memory usage and cleaning time of the hotels table read with plain object
+columns against the one read with HOTELS_CSV_SCHEMA.
+
+Usage:
+    python -m benchmarks.bench_schema [--rows 1000000]
+"""
+
+import argparse
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_hotels_zip
+from utils.dataframe_utils import memory_usage_mb, refine_data
+from utils.file_utils import concat_dataframes, read_csv_from_zipfile
+
+
+def read_without_schema(zipfile_path: Path) -> pd.DataFrame:
+    with zipfile.ZipFile(zipfile_path) as zip_file:
+        return concat_dataframes(
+            pd.read_csv(zip_file.open(name), dtype=str) for name in zip_file.namelist()
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print("reader\traw MB\trefined MB\trefine seconds")  # noqa: T001
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = Path(tmp_dir) / "hotels.zip"
+        generate_hotels_zip(zip_path, args.rows)
+
+        for reader_name, reader in [
+            ("object", read_without_schema),
+            ("schema", read_csv_from_zipfile),
+        ]:
+            dataframe = reader(zip_path)
+            raw_memory = memory_usage_mb(dataframe)
+            start = time.perf_counter()
+            dataframe = refine_data(dataframe)
+            elapsed = time.perf_counter() - start
+            print(  # noqa: T001
+                f"{reader_name}\t{raw_memory:.1f}\t"
+                f"{memory_usage_mb(dataframe):.1f}\t{elapsed:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Runs every offline stage of the pipeline on synthetic hotel archives of several
+sizes, measuring time and peak memory of each stage, and writes the results as
+JSON. Results of an earlier run may be passed as a baseline, then stages slower
+than the baseline by more than the tolerance are reported and the exit code is 1.
+
+Peak memory of a stage is the maximum of memory allocated by Python and numpy
+while the stage runs, traced by tracemalloc in a separate run of the stage, so
+tracing does not distort the timing.
+
+Usage:
+    python -m benchmarks.bench_suite [--rows 10000 100000 1000000]
+        [--countries 20] [--cities-per-country 10] [--parts 5]
+        [--invalid-fraction 0.01] [--repeat 3] [--output bench_results.json]
+        [--baseline old_results.json] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_hotels_zip, generate_weather_dict
+from utils.center_utils import compute_city_centers
+from utils.dataframe_utils import (
+    accumulate_city_stats,
+    find_max_temp_city,
+    find_max_temp_delta_city,
+    find_max_temp_diff,
+    find_min_temp_city,
+    refine_data,
+    select_hotels_in_cities,
+    select_most_hoteled_cities,
+    select_top_cities,
+)
+from utils.file_utils import (
+    assemble_dataframe,
+    iter_csv_chunks_from_zipfile,
+    read_csv_from_zipfile,
+    save_dataframe_as_csv_splitted,
+    unpack_csv_from_zipfile,
+)
+
+
+def measure_stage(func: Callable, repeat: int, trace_memory: bool) -> Dict:
+    """
+    Runs a stage several times
+    Args:
+        func: a function without arguments running the stage
+        repeat: amount of timed runs, the fastest one is taken
+        trace_memory: whether to run the stage once more under tracemalloc
+
+    Returns:
+    A dictionary with "seconds", "peak_mb" and "result" of the last run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return {"seconds": min(timings), "peak_mb": peak_mb, "result": result}
+
+
+def read_two_pass(zip_path: Path) -> pd.DataFrame:
+    """
+    Reads hotels of the most hoteled cities out of core, like main.py does with
+    "--ingest two-pass". Its peak memory is to be compared with the one of the
+    in-memory stages from unpacking to select_hotels_in_cities.
+    """
+    city_stats = accumulate_city_stats(
+        refine_data(chunk) for chunk in iter_csv_chunks_from_zipfile(zip_path)
+    )
+    cities = select_top_cities(city_stats.set_index(["Country", "City"])["Hotels"])
+    return read_csv_from_zipfile(
+        zip_path,
+        transform=lambda chunk: select_hotels_in_cities(refine_data(chunk), cities),
+    )
+
+
+def run_pipeline(
+    work_dir: Path, args: argparse.Namespace, rows: int, trace_memory=True
+) -> List[Dict]:
+    """
+    Generates an archive and runs all the stages one after another
+    Args:
+        work_dir: an empty directory for the archive and the outputs
+        args: parsed command line arguments
+        rows: amount of hotels in the archive
+        trace_memory: whether to measure peak memory of stages
+
+    Returns:
+    Measurements of every stage in the pipeline order
+    """
+    zip_path = work_dir / "hotels.zip"
+    generate_hotels_zip(
+        zip_path,
+        rows,
+        parts=args.parts,
+        countries=args.countries,
+        cities_per_country=args.cities_per_country,
+        invalid_fraction=args.invalid_fraction,
+    )
+    extract_dir = work_dir / "extracted"
+    save_dir = work_dir / "output"
+    save_dir.mkdir()
+
+    data = {}
+    stages = [
+        (
+            "unpack_csv_from_zipfile",
+            lambda: unpack_csv_from_zipfile(zip_path, extract_dir),
+        ),
+        ("assemble_dataframe", lambda: assemble_dataframe(extract_dir)),
+        ("refine_data", lambda: refine_data(data["assemble_dataframe"])),
+        (
+            "select_most_hoteled_cities",
+            lambda: select_most_hoteled_cities(data["refine_data"]),
+        ),
+        (
+            "select_hotels_in_cities",
+            lambda: select_hotels_in_cities(
+                data["refine_data"], data["select_most_hoteled_cities"]
+            ),
+        ),
+        (
+            "compute_city_centers",
+            lambda: compute_city_centers(data["select_hotels_in_cities"]),
+        ),
+        ("read_two_pass", lambda: read_two_pass(zip_path)),
+    ]
+    stage_results = []
+    for name, func in stages:
+        measured = measure_stage(func, args.repeat, trace_memory)
+        data[name] = measured.pop("result")
+        stage_results.append({"stage": name, **measured})
+
+    weather_dict = generate_weather_dict(data["compute_city_centers"], date.today())
+    for name, func in [
+        ("find_max_temp_city", lambda: find_max_temp_city(weather_dict)),
+        ("find_min_temp_city", lambda: find_min_temp_city(weather_dict)),
+        ("find_max_temp_diff", lambda: find_max_temp_diff(weather_dict)),
+        ("find_max_temp_delta_city", lambda: find_max_temp_delta_city(weather_dict)),
+        (
+            "save_dataframe_as_csv_splitted",
+            lambda: save_dataframe_as_csv_splitted(
+                data["select_hotels_in_cities"], save_dir, name_prefix="hotels"
+            ),
+        ),
+    ]:
+        measured = measure_stage(func, args.repeat, trace_memory)
+        measured.pop("result")
+        stage_results.append({"stage": name, **measured})
+
+    for stage in stage_results:
+        if stage["stage"] in data and hasattr(data[stage["stage"]], "__len__"):
+            stage["rows_out"] = len(data[stage["stage"]])
+    return stage_results
+
+
+def find_regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compares stage timings with the ones of a baseline run
+    Args:
+        results: results of this run
+        baseline: results of an earlier run, only stages of the same row counts
+            are compared
+        tolerance: allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+    Human-readable descriptions of stages slower than allowed
+    """
+    baseline_seconds = {
+        (run["rows"], stage["stage"]): stage["seconds"]
+        for run in baseline["runs"]
+        for stage in run["stages"]
+    }
+    regressions = []
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            old_seconds = baseline_seconds.get((run["rows"], stage["stage"]))
+            if old_seconds is not None and stage["seconds"] > old_seconds * (
+                1 + tolerance
+            ):
+                regressions.append(
+                    f"{stage['stage']} on {run['rows']} rows: "
+                    f"{stage['seconds']:.3f} s against {old_seconds:.3f} s"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--cities-per-country", type=int, default=10)
+    parser.add_argument("--parts", type=int, default=5)
+    parser.add_argument("--invalid-fraction", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Do not measure peak memory"
+    )
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "parameters": {
+            "countries": args.countries,
+            "cities_per_country": args.cities_per_country,
+            "parts": args.parts,
+            "invalid_fraction": args.invalid_fraction,
+            "repeat": args.repeat,
+        },
+        "runs": [],
+    }
+
+    print("rows\tstage\tseconds\tpeak MB")  # noqa: T001
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stages = run_pipeline(
+                Path(tmp_dir), args, rows, trace_memory=not args.no_memory
+            )
+        for stage in stages:
+            peak = "-" if stage["peak_mb"] is None else f"{stage['peak_mb']:.1f}"
+            print(  # noqa: T001
+                f"{rows}\t{stage['stage']}\t{stage['seconds']:.3f}\t{peak}"
+            )
+        results["runs"].append({"rows": rows, "stages": stages})
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["max_rss_mb"] = max_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results are written to {args.output}")  # noqa: T001
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = find_regressions(
+            results, json.load(baseline_file), args.tolerance
+        )
+    for regression in regressions:
+        print(f"Regression: {regression}")  # noqa: T001
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
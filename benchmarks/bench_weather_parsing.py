@@ -0,0 +1,98 @@
+"""
+Compares decoding and parsing time of openweathermap.org responses done one
+response at a time against the batch parsers, and weather tables built city by
+city, as get_weather() does, against all the cities at once, as
+get_weather_bulk() does. Responses are copies of tests/test_data/forecast.json
+and history.json.
+
+Usage:
+    python -m benchmarks.bench_weather_parsing [--cities 2000] [--history-depth 4]
+"""
+
+import argparse
+import json
+import time
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from utils import json_utils
+from utils.async_utils import (
+    parse_forecasted_batch,
+    parse_forecasted_data,
+    parse_historic_batch,
+    parse_historic_data,
+    parse_weather_batch,
+)
+
+TEST_DATA_DIR = Path(__file__).parent.parent / "tests" / "test_data"
+
+
+def parse_one_by_one(forecasts, histories):
+    forecast_frames = [parse_forecasted_data(data) for data in forecasts]
+    history_frame = pd.DataFrame(map(parse_historic_data, histories))
+    return forecast_frames, history_frame
+
+
+def parse_in_batches(forecasts, histories):
+    return parse_forecasted_batch(forecasts), parse_historic_batch(histories)
+
+
+def tables_per_city(responses, today):
+    return [
+        parse_weather_batch([city_responses], today) for city_responses in responses
+    ]
+
+
+def measure(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cities", type=int, default=2000)
+    parser.add_argument("--history-depth", type=int, default=4)
+    args = parser.parse_args()
+
+    forecast_body = (TEST_DATA_DIR / "forecast.json").read_bytes()
+    history_body = (TEST_DATA_DIR / "history.json").read_bytes()
+    forecast_bodies = [forecast_body] * args.cities
+    history_bodies = [history_body] * (args.cities * args.history_depth)
+    bodies = forecast_bodies + history_bodies
+
+    print("stage\tseconds")  # noqa: T001
+    print(  # noqa: T001
+        f"decode json\t{measure(lambda: [json.loads(body) for body in bodies]):.3f}"
+    )
+    print(  # noqa: T001
+        "decode json_utils\t"
+        f"{measure(lambda: [json_utils.loads(body) for body in bodies]):.3f}"
+    )
+
+    forecasts = [json_utils.loads(body) for body in forecast_bodies]
+    histories = [json_utils.loads(body) for body in history_bodies]
+    print(  # noqa: T001
+        f"parse one by one\t{measure(parse_one_by_one, forecasts, histories):.3f}"
+    )
+    print(  # noqa: T001
+        f"parse in batches\t{measure(parse_in_batches, forecasts, histories):.3f}"
+    )
+
+    today = date(2021, 7, 4)
+    responses = [
+        (forecast, histories[idx * args.history_depth : (idx + 1) * args.history_depth])
+        for idx, forecast in enumerate(forecasts)
+    ]
+    print(  # noqa: T001
+        f"tables per city\t{measure(tables_per_city, responses, today):.3f}"
+    )
+    print(  # noqa: T001
+        "tables of all cities\t" f"{measure(parse_weather_batch, responses, today):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+A local stand-in for OpenWeatherMap and HERE reverse geocoding APIs, which makes
+load tests of the async layer possible without spending API quota. Weather
+responses replay tests/test_data/forecast.json and history.json moved to the
+requested place and dates, addresses are made up out of coordinates.
+
+Every response is delayed by a latency drawn from a configurable distribution, a
+share of requests fails, and requests above the rate limit are answered with 429.
+
+Point the clients at it with get_weather(base_url=...) and
+HereBackend(base_url=...), or --weather-api-url and --here-api-url of main.py,
+e.g. "http://127.0.0.1:8080/data/2.5" and "http://127.0.0.1:8080".
+
+Usage:
+    python -m benchmarks.fake_api_server [--port 8080] [--latency lognormal]
+        [--latency-mean 0.05] [--latency-sigma 0.5] [--error-rate 0.01]
+        [--rate-limit 100]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import math
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from aiohttp import web
+
+TEST_DATA_DIR = Path(__file__).parent.parent / "tests" / "test_data"
+LATENCY_DISTRIBUTIONS = ["constant", "uniform", "exponential", "lognormal"]
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Paths of the real APIs, so the clients only need a different scheme and host
+FORECAST_PATH = "/data/2.5/onecall"
+HISTORY_PATH = "/data/2.5/onecall/timemachine"
+REVERSE_GEOCODING_PATH = "/6.2/reversegeocode.json"
+
+
+def make_latency_sampler(
+    distribution="constant", mean=0.0, sigma=0.5, seed=0
+) -> Callable[[], float]:
+    """
+    Makes a function drawing response latencies
+    Args:
+        distribution: one of LATENCY_DISTRIBUTIONS:
+            "constant" - always mean
+            "uniform" - uniform between 0 and 2 * mean
+            "exponential" - exponential with the given mean
+            "lognormal" - log-normal with the given mean and the standard
+                deviation sigma of the underlying normal distribution, which gives
+                a heavy tail
+        mean: mean latency in seconds
+        sigma: shape of the log-normal distribution
+        seed: random seed
+
+    Returns:
+    A function without arguments returning a latency in seconds
+    """
+    rng = random.Random(seed)
+    if distribution == "constant":
+        return lambda: mean
+    if distribution == "uniform":
+        return lambda: rng.uniform(0, 2 * mean)
+    if distribution == "exponential":
+        return lambda: rng.expovariate(1 / mean) if mean > 0 else 0.0
+    if distribution == "lognormal":
+        # exp(mu + sigma^2 / 2) is the mean of a log-normal distribution
+        mu = math.log(mean) - sigma ** 2 / 2 if mean > 0 else -math.inf
+        return lambda: rng.lognormvariate(mu, sigma) if mean > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution '{distribution}'")
+
+
+class FakeApiServer:
+    """
+    Serves OpenWeatherMap "onecall" and "onecall/timemachine" requests and HERE
+    reverse geocoding requests. Counters of answered requests are kept in
+    "responses" by status code.
+
+    Args:
+        latency: a function drawing the latency of every response in seconds,
+            see make_latency_sampler()
+        error_rate: share of requests answered with error_status
+        error_status: HTTP status of failed requests. geopy turns 503 into
+            GeocoderUnavailable, which is retried by the geocoding rate limiter.
+        rate_limit: maximal amount of requests per second answered without 429,
+            None for no limit
+        burst: amount of requests answered at once above the rate limit
+        seed: random seed of errors
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Callable[[], float]] = None,
+        error_rate=0.0,
+        error_status=503,
+        rate_limit: Optional[float] = None,
+        burst=10,
+        seed=0,
+    ):
+        self.latency = latency or make_latency_sampler()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.responses = Counter()
+
+        self._rng = random.Random(seed)
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        with open(TEST_DATA_DIR / "forecast.json") as json_file:
+            self._forecast = json.load(json_file)
+        with open(TEST_DATA_DIR / "history.json") as json_file:
+            self._history = json.load(json_file)
+
+    def make_app(self) -> web.Application:
+        """Creates an aiohttp application serving the APIs"""
+        app = web.Application()
+        app.router.add_get(FORECAST_PATH, self._handle_forecast)
+        app.router.add_get(HISTORY_PATH, self._handle_history)
+        app.router.add_get(REVERSE_GEOCODING_PATH, self._handle_reverse_geocoding)
+        return app
+
+    async def _respond(self, make_payload: Callable[[], dict]) -> web.Response:
+        """Applies the rate limit, the latency and errors to a response"""
+        if not self._take_token():
+            self.responses[429] += 1
+            return web.json_response(
+                {"cod": 429, "message": "Too many requests"},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+
+        await asyncio.sleep(self.latency())
+        if self._rng.random() < self.error_rate:
+            self.responses[self.error_status] += 1
+            return web.json_response(
+                {"cod": self.error_status, "message": "Injected error"},
+                status=self.error_status,
+            )
+        self.responses[200] += 1
+        return web.json_response(make_payload())
+
+    def _take_token(self) -> bool:
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit
+        )
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def _handle_forecast(self, request: web.Request) -> web.Response:
+        def make_payload():
+            payload = copy.deepcopy(self._forecast)
+            # The first forecasted day becomes today
+            today = datetime.now(timezone.utc).timestamp() // SECONDS_PER_DAY
+            shift = (today - payload["daily"][0]["dt"] // SECONDS_PER_DAY) * (
+                SECONDS_PER_DAY
+            )
+            for day_data in payload["daily"]:
+                day_data["dt"] += int(shift)
+            return _move_to(payload, request)
+
+        return await self._respond(make_payload)
+
+    async def _handle_history(self, request: web.Request) -> web.Response:
+        def make_payload():
+            payload = copy.deepcopy(self._history)
+            shift = int(request.query["dt"]) - payload["current"]["dt"]
+            payload["current"]["dt"] += shift
+            for hour_data in payload["hourly"]:
+                hour_data["dt"] += shift
+            return _move_to(payload, request)
+
+        return await self._respond(make_payload)
+
+    async def _handle_reverse_geocoding(self, request: web.Request) -> web.Response:
+        def make_payload():
+            lat, lon = (float(value) for value in request.query["prox"].split(",")[:2])
+            return {
+                "Response": {
+                    "View": [
+                        {
+                            "Result": [
+                                {
+                                    "Location": {
+                                        "Address": {"Label": f"{lat:.5f}, {lon:.5f}"},
+                                        "DisplayPosition": {
+                                            "Latitude": lat,
+                                            "Longitude": lon,
+                                        },
+                                    }
+                                }
+                            ]
+                        }
+                    ]
+                }
+            }
+
+        return await self._respond(make_payload)
+
+
+def _move_to(payload: dict, request: web.Request) -> dict:
+    """Sets the place of a weather payload to the requested one"""
+    payload["lat"] = float(request.query["lat"])
+    payload["lon"] = float(request.query["lon"])
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="constant")
+    parser.add_argument("--latency-mean", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeApiServer(
+        latency=make_latency_sampler(
+            args.latency, args.latency_mean, args.latency_sigma, seed=args.seed
+        ),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit=args.rate_limit,
+        burst=args.burst,
+        seed=args.seed,
+    )
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""This module contains a deterministic generator of synthetic hotel archives"""
+
+import zipfile
+from datetime import date, timedelta
+from os import PathLike
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Coordinates refine_data() must drop: missing, malformed and out of range ones
+INVALID_COORDINATES = ["", "n/a", "195.1234567", "-200.5"]
+
+
+def generate_hotels_dataframe(
+    rows: int, countries=20, cities_per_country=10, seed=0, invalid_fraction=0.0
+) -> pd.DataFrame:
+    """
+    Generates a DataFrame shaped like the hotels data shipped in data/hotels.zip
+    Args:
+        rows: amount of hotels
+        countries: amount of distinct countries
+        cities_per_country: amount of distinct cities in every country
+        seed: random seed, the same seed always gives the same data
+        invalid_fraction: share of hotels with one of INVALID_COORDINATES as their
+            latitude or longitude
+
+    Returns:
+    DataFrame with "Id", "Name", "Country", "City", "Latitude" and "Longitude"
+        columns. Coordinates are stored as strings, like in the real input.
+    """
+    rng = np.random.default_rng(seed)
+    country_idx = rng.integers(0, countries, rows)
+    city_idx = rng.integers(0, cities_per_country, rows)
+
+    # Every city gets its own center, hotels are scattered around it
+    centers_lat = rng.uniform(-60, 60, (countries, cities_per_country))
+    centers_lon = rng.uniform(-170, 170, (countries, cities_per_country))
+    latitudes = centers_lat[country_idx, city_idx] + rng.normal(0, 0.05, rows)
+    longitudes = centers_lon[country_idx, city_idx] + rng.normal(0, 0.05, rows)
+    coordinates = {
+        "Latitude": latitudes.round(7).astype(str).astype(object),
+        "Longitude": longitudes.round(7).astype(str).astype(object),
+    }
+
+    invalid_rows = int(rows * invalid_fraction)
+    if invalid_rows:
+        positions = rng.choice(rows, invalid_rows, replace=False)
+        spoiled_columns = rng.integers(0, 2, invalid_rows)
+        values = rng.integers(0, len(INVALID_COORDINATES), invalid_rows)
+        for column_idx, column in enumerate(["Latitude", "Longitude"]):
+            spoiled = spoiled_columns == column_idx
+            coordinates[column][positions[spoiled]] = np.array(
+                INVALID_COORDINATES, dtype=object
+            )[values[spoiled]]
+
+    return pd.DataFrame(
+        {
+            "Id": np.arange(rows),
+            "Name": [f"Hotel {idx}" for idx in range(rows)],
+            "Country": [f"C{idx:03d}" for idx in country_idx],
+            "City": [f"City {idx:03d}" for idx in city_idx],
+            **coordinates,
+        }
+    )
+
+
+def generate_hotels_zip(
+    zipfile_path: Union[str, PathLike],
+    rows: int,
+    parts=5,
+    countries=20,
+    cities_per_country=10,
+    seed=0,
+    invalid_fraction=0.0,
+):
+    """
+    Writes a synthetic hotels archive split into several "part-XXXXX.csv" members
+    Args:
+        zipfile_path: path of the archive to be created
+        rows: total amount of hotels
+        parts: amount of CSV members
+        countries: amount of distinct countries
+        cities_per_country: amount of distinct cities in every country
+        seed: random seed
+        invalid_fraction: share of hotels with invalid coordinates
+
+    Returns:
+        None
+    """
+    dataframe = generate_hotels_dataframe(
+        rows,
+        countries=countries,
+        cities_per_country=cities_per_country,
+        seed=seed,
+        invalid_fraction=invalid_fraction,
+    )
+    with zipfile.ZipFile(zipfile_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for idx, part in enumerate(np.array_split(dataframe, parts)):
+            zip_file.writestr(f"part-{idx:05d}-c000.csv", part.to_csv(index=False))
+
+
+def generate_weather_dict(
+    cities: pd.DataFrame, today: date, history_depth=4, forecast_days=7, seed=0
+) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """
+    Generates weather of many cities shaped like results of async_utils.get_weather
+    Args:
+        cities: a DataFrame with "Country" and "City" columns
+        today: the date of day 0
+        history_depth: amount of days before today
+        forecast_days: amount of days after today
+        seed: random seed
+
+    Returns:
+    A dictionary of {(country, city): weather_in_city_df}
+    """
+    rng = np.random.default_rng(seed)
+    day_numbers = np.arange(-history_depth, forecast_days + 1)
+    dates = [today + timedelta(days=int(day)) for day in day_numbers]
+    min_temps = rng.normal(15, 8, (len(cities), len(day_numbers))).round(2)
+    max_temps = (min_temps + rng.uniform(2, 12, min_temps.shape)).round(2)
+
+    return {
+        (country, city): pd.DataFrame(
+            {"date": dates, "max_temp": max_temps[idx], "min_temp": min_temps[idx]},
+            index=day_numbers,
+        )
+        for idx, (country, city) in enumerate(zip(cities["Country"], cities["City"]))
+    }
@@ -1,31 +1,31 @@
 import argparse
-import asyncio
-import os
 import shutil
-import zipfile
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 
-import pandas as pd
-
-from utils.async_utils import get_addresses, get_weather_bulk
-from utils.dataframe_utils import (
-    draw_and_save_temp_graph,
-    find_max_temp_city,
-    find_max_temp_delta_city,
-    find_max_temp_diff,
-    find_min_temp_city,
-    refine_data,
-    select_most_hoteled_cities,
-)
-from utils.file_utils import (
-    assemble_dataframe,
-    save_dataframe_as_csv_splitted,
-    unpack_csv_from_zipfile,
-)
+# Only light modules are imported here, so that --help and argument errors are
+# fast. Heavy dependencies are imported by the stages using them.
+from utils.metrics_utils import METRICS, run_profiled
 
+if TYPE_CHECKING:
+    from utils.geocoder_utils import GeocoderBackend
 
-def main():
+GEOCODERS = ["fake", "here", "offline"]
+# The same as center_utils.CENTER_METHODS, which would import numpy and pandas
+CENTER_METHODS = ["bbox", "centroid", "minimax"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parses command line arguments
+    Args:
+        argv: a list of arguments, sys.argv is used if None
+
+    Returns:
+    Parsed arguments
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "input_path",
@@ -45,10 +45,293 @@ def main():
         type=int,
         nargs="?",
         default=1,
-        help="Number of requests sent per second while getting geocoding data",
+        help="Initial number of requests sent per second while getting geocoding "
+        "data. The rate adapts to throttling and latency afterwards",
+    )
+    parser.add_argument(
+        "--max-request-rate",
+        type=float,
+        default=50.0,
+        help="Maximal number of geocoding requests sent per second",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=10,
+        help="Maximal number of geocoding requests awaiting response at once",
+    )
+    parser.add_argument(
+        "--ingest",
+        choices=["stream", "extract", "two-pass"],
+        default="stream",
+        help="How to read input CSVs: 'stream' reads them right from the archive, "
+        "'extract' unpacks them into a temporary directory first, 'two-pass' "
+        "streams the archive twice, counting hotels per city first and keeping "
+        "hotels of the selected cities only then, so that memory usage does not "
+        "grow with the archive size",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="Number of CSV rows read from the archive at once in 'stream' and "
+        "'two-pass' modes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes parsing archive members in 'stream' mode and "
+        "rendering charts",
+    )
+    parser.add_argument(
+        "--writer-threads",
+        type=int,
+        default=8,
+        help="Number of threads writing output files",
+    )
+    parser.add_argument(
+        "--top-cities",
+        type=int,
+        default=1,
+        help="Number of cities with the most hotels selected in every country",
+    )
+    parser.add_argument(
+        "--city-center",
+        choices=CENTER_METHODS,
+        default="bbox",
+        help="City center: the midpoint of the bounding box of hotels, their "
+        "spherical centroid or the point minimizing the distance to the farthest "
+        "of the extreme hotels",
+    )
+    parser.add_argument(
+        "--geocoding-cache-ttl",
+        type=float,
+        default=30,
+        help="Days a cached hotel address stays valid",
+    )
+    parser.add_argument(
+        "--geocoding-cache-size",
+        type=int,
+        default=1_000_000,
+        help="Maximal amount of addresses kept in the geocoding cache",
     )
+    parser.add_argument(
+        "--weather-cache-ttl",
+        type=float,
+        default=3,
+        help="Hours cached current and forecasted weather stays valid. "
+        "History of past days is cached forever",
+    )
+    parser.add_argument(
+        "--no-weather-cache",
+        action="store_true",
+        help="Do not read or update the weather cache in the output directory",
+    )
+    parser.add_argument(
+        "--geocoder",
+        choices=GEOCODERS,
+        default="here",
+        help="Geocoding service: HERE geocoding API, the nearest place of a local "
+        "gazetteer (see --gazetteer) or an offline fake one making up addresses "
+        "out of coordinates. Services supporting batch requests are sent hotels "
+        "in batches",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        type=str,
+        default=None,
+        help="CSV file of places with 'latitude' and 'longitude' columns and the "
+        "columns set by --gazetteer-columns. Required by the offline geocoder; "
+        "with HERE it is used while HERE is throttling or unavailable. Addresses "
+        "taken from it are not cached and are geocoded again by the next run",
+    )
+    parser.add_argument(
+        "--gazetteer-columns",
+        type=str,
+        default="name",
+        help="Comma-separated gazetteer columns making up an address",
+    )
+    parser.add_argument(
+        "--gazetteer-max-distance",
+        type=float,
+        default=None,
+        help="Kilometers beyond which gazetteer places are not taken as addresses",
+    )
+    parser.add_argument(
+        "--snap-tolerance",
+        type=float,
+        default=0.0,
+        help="Hotels closer than this amount of degrees share a single geocoding "
+        "request, 0 merges exact duplicates only",
+    )
+    parser.add_argument(
+        "--no-geocoding-cache",
+        action="store_true",
+        help="Do not read or update the geocoding cache in the output directory",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore outputs of a previous run and process every city anew. By "
+        "default unchanged cities are skipped, only new or changed hotels are "
+        "geocoded and weather fetched today is reused",
+    )
+    parser.add_argument(
+        "--weather-api-url",
+        type=str,
+        default=None,
+        help="Root URL of an OpenWeatherMap compatible API, e.g. the one of "
+        "benchmarks/fake_api_server.py. The public API is used by default",
+    )
+    parser.add_argument(
+        "--here-api-url",
+        type=str,
+        default=None,
+        help="Scheme and host of a HERE compatible reverse geocoding API, e.g. the "
+        "one of benchmarks/fake_api_server.py. The public API is used by default",
+    )
+    parser.add_argument(
+        "--http-connections",
+        type=int,
+        default=100,
+        help="Maximal number of simultaneously open HTTP connections, 0 for no limit",
+    )
+    parser.add_argument(
+        "--http-connections-per-host",
+        type=int,
+        default=20,
+        help="Maximal number of simultaneously open HTTP connections to a single "
+        "host, 0 for no limit",
+    )
+    parser.add_argument(
+        "--dns-cache-ttl",
+        type=int,
+        default=300,
+        help="Seconds resolved host addresses are cached for",
+    )
+    parser.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=30,
+        help="Seconds an idle HTTP connection is kept open for reuse",
+    )
+    parser.add_argument(
+        "--http-timeout",
+        type=float,
+        default=30,
+        help="Total timeout of a single HTTP request in seconds",
+    )
+
+    parser.add_argument(
+        "--prometheus-textfile",
+        type=str,
+        default=None,
+        help="Also write run metrics into this file in the Prometheus text format, "
+        "e.g. for the node exporter textfile collector. Metrics are always written "
+        "into metrics.json in the output directory",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Run under cProfile and tracemalloc and save their reports into the "
+        "output directory",
+    )
+
+    args = parser.parse_args(argv)
+    if args.geocoder == "offline" and args.gazetteer is None:
+        parser.error("the offline geocoder requires --gazetteer")
+    return args
+
+
+def make_backend_factory(
+    args: argparse.Namespace,
+) -> Callable[..., "GeocoderBackend"]:
+    """
+    Makes a factory of the geocoding service chosen on the command line
+    Args:
+        args: parsed command line arguments
+
+    Returns:
+    A factory for async_utils.get_addresses()
+    """
+    from utils.async_utils import HereBackend
+    from utils.geocoder_utils import (
+        FakeGeocoderBackend,
+        FallbackGeocoderBackend,
+        OfflineGeocoderBackend,
+        load_gazetteer,
+    )
+
+    if args.geocoder == "fake":
+        return FakeGeocoderBackend
+    here_factory = HereBackend
+    if args.here_api_url is not None:
+        here_factory = partial(HereBackend, base_url=args.here_api_url)
+    if args.gazetteer is None:
+        return here_factory
+
+    gazetteer = load_gazetteer(
+        args.gazetteer, address_columns=args.gazetteer_columns.split(",")
+    )
+    print(f"Loaded {len(gazetteer)} gazetteer places")  # noqa: T001
+    offline_factory = partial(
+        OfflineGeocoderBackend,
+        gazetteer=gazetteer,
+        max_distance=args.gazetteer_max_distance,
+    )
+    if args.geocoder == "offline":
+        return offline_factory
+    return partial(
+        FallbackGeocoderBackend,
+        primary_factory=here_factory,
+        fallback_factory=offline_factory,
+    )
+
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_path)
+
+    try:
+        if args.profile:
+            run_profiled(run, output_dir, args)
+            print(f"Profiles are saved to {output_dir}")  # noqa: T001
+        else:
+            run(args)
+    finally:
+        # Metrics of a failed run are saved too, they show where it failed
+        output_dir.mkdir(parents=True, exist_ok=True)
+        METRICS.save_json(output_dir / "metrics.json")
+        if args.prometheus_textfile is not None:
+            METRICS.save_prometheus(args.prometheus_textfile)
+
+
+def run(args: argparse.Namespace):
+    """
+    Runs the whole processing
+    Args:
+        args: parsed command line arguments
 
-    args = parser.parse_args()
+    Returns:
+        None
+    """
+    from utils.center_utils import compute_city_centers
+    from utils.dataframe_utils import (
+        accumulate_city_stats,
+        memory_usage_mb,
+        refine_data,
+        select_hotels_in_cities,
+        select_most_hoteled_cities,
+        select_top_cities,
+    )
+    from utils.file_utils import (
+        assemble_dataframe,
+        iter_csv_chunks_from_zipfile,
+        read_csv_from_zipfile,
+        read_csv_from_zipfile_parallel,
+        unpack_csv_from_zipfile,
+    )
 
     input_file = Path(args.input_path)
     output_dir = Path(args.output_path)
@@ -57,121 +340,203 @@ def main():
 
     date_today = datetime.utcnow().date()
 
-    # Error checking
-    if not zipfile.is_zipfile(input_file):
-        raise zipfile.BadZipfile(f"File '{input_file}' is not a proper ZIP")
-
-    unpack_csv_from_zipfile(input_file, extraction_dir)
-
-    main_dataframe = assemble_dataframe(extraction_dir)
+    # Reading and cleaning invalid data, searching cities with the most hotels
+    if args.ingest == "two-pass":
+        # The first pass keeps hotel counts per city and the second one hotels of
+        # the selected cities only, so the whole table is never held in memory
+        with METRICS.stage("scan") as stage:
+            city_stats = accumulate_city_stats(
+                refine_data(chunk)
+                for chunk in iter_csv_chunks_from_zipfile(
+                    input_file, chunksize=args.chunk_size
+                )
+            )
+            stage["rows"] += int(city_stats["Hotels"].sum())
+        with METRICS.stage("select", rows=len(city_stats)):
+            most_hoteled_cities_df = select_top_cities(
+                city_stats.set_index(["Country", "City"])["Hotels"],
+                top_k=args.top_cities,
+            )
+        with METRICS.stage("assemble") as stage:
+            hotels_of_interest = read_csv_from_zipfile(
+                input_file,
+                chunksize=args.chunk_size,
+                transform=lambda chunk: select_hotels_in_cities(
+                    refine_data(chunk), most_hoteled_cities_df
+                ),
+            ).reset_index(drop=True)
+            stage["rows"] += len(hotels_of_interest)
+        print(  # noqa: T001
+            f"Hotels table: {stage['rows']} of {city_stats['Hotels'].sum()} rows "
+            f"kept, {memory_usage_mb(hotels_of_interest):.1f} MB"
+        )
+    else:
+        if args.ingest == "stream" and args.workers > 1:
+            # Members are refined by the workers, so refining is a part of
+            # assembling
+            with METRICS.stage("assemble") as stage:
+                main_dataframe = read_csv_from_zipfile_parallel(
+                    input_file, workers=args.workers, transform=refine_data
+                )
+                stage["rows"] += len(main_dataframe)
+        elif args.ingest == "stream":
+            with METRICS.stage("assemble") as stage:
+                main_dataframe = read_csv_from_zipfile(
+                    input_file, chunksize=args.chunk_size
+                )
+                stage["rows"] += len(main_dataframe)
+            with METRICS.stage("refine", rows=len(main_dataframe)):
+                main_dataframe = refine_data(main_dataframe)
+        else:
+            with METRICS.stage("unzip"):
+                unpack_csv_from_zipfile(input_file, extraction_dir)
+            with METRICS.stage("assemble") as stage:
+                main_dataframe = assemble_dataframe(extraction_dir)
+                shutil.rmtree(extraction_dir)
+                stage["rows"] += len(main_dataframe)
+            with METRICS.stage("refine", rows=len(main_dataframe)):
+                main_dataframe = refine_data(main_dataframe)
+        print(  # noqa: T001
+            f"Hotels table: {len(main_dataframe)} rows, "
+            f"{memory_usage_mb(main_dataframe):.1f} MB"
+        )
 
-    shutil.rmtree(extraction_dir)
+        # Searching cities with the most hotels
+        with METRICS.stage("select", rows=len(main_dataframe)):
+            most_hoteled_cities_df = select_most_hoteled_cities(
+                main_dataframe, top_k=args.top_cities
+            )
+            hotels_of_interest = select_hotels_in_cities(
+                main_dataframe, most_hoteled_cities_df
+            ).reset_index(drop=True)
 
-    # Cleaning invalid data
-    main_dataframe = refine_data(main_dataframe)
+    # Computing city centers' coords
+    with METRICS.stage("centers", rows=len(hotels_of_interest)):
+        city_coords = compute_city_centers(hotels_of_interest, method=args.city_center)
+    most_hoteled_cities_df = most_hoteled_cities_df.merge(
+        city_coords, on=["Country", "City"]
+    )[["Country", "City", "Latitude", "Longitude"]]
 
-    # Searching cities with the most hotels
-    most_hoteled_cities_df = select_most_hoteled_cities(main_dataframe)
+    # Fetching weather and hotels' addresses, saving the outputs of every city as
+    # soon as its data is complete. The network stack and API keys are only loaded
+    # here.
+    import asyncio
 
-    hotels_of_interest = pd.merge(
-        most_hoteled_cities_df, main_dataframe, on=["Country", "City"]
+    from utils.async_utils import RequestCoalescer, make_geocoding_rate_limiter
+    from utils.cache_utils import GeocodingCache, WeatherCache
+    from utils.pipeline_utils import process_cities
+    from utils.weather_utils import (
+        build_weather_table,
+        compute_weather_statistics,
+        crop_weather_table,
     )
 
-    # Computing city centers' coords
-    city_coords = hotels_of_interest.groupby(["Country", "City"], as_index=False).agg(
-        min_lat=("Latitude", min),
-        max_lat=("Latitude", max),
-        min_lon=("Longitude", min),
-        max_lon=("Longitude", max),
+    output_dir.mkdir(parents=True, exist_ok=True)
+    weather_cache = None
+    # Responses of stand-in servers must never be mixed with real ones
+    if not args.no_weather_cache and args.weather_api_url is None:
+        weather_cache = WeatherCache(
+            output_dir / "weather_cache.sqlite",
+            ttl=args.weather_cache_ttl * 60 * 60,
+        )
+    geocoding_cache = None
+    # Made up addresses must never be mixed with real ones, and offline ones are
+    # cheaper to find again than to cache
+    if (
+        not args.no_geocoding_cache
+        and args.geocoder == "here"
+        and args.here_api_url is None
+    ):
+        geocoding_cache = GeocodingCache(
+            output_dir / "geocoding_cache.sqlite",
+            ttl=args.geocoding_cache_ttl * 24 * 60 * 60,
+            max_entries=args.geocoding_cache_size,
+        )
+    weather_coalescer = RequestCoalescer()
+    weather_kwargs = {"cache": weather_cache, "coalescer": weather_coalescer}
+    if args.weather_api_url is not None:
+        weather_kwargs["base_url"] = args.weather_api_url
+    rate_limiter = make_geocoding_rate_limiter(
+        requests_per_second,
+        max_in_flight=args.max_in_flight,
+        max_rate=args.max_request_rate,
     )
-    city_coords["Latitude"] = city_coords[["max_lat", "min_lat"]].mean(axis=1)
-    city_coords["Longitude"] = city_coords[["max_lon", "min_lon"]].mean(axis=1)
-
-    most_hoteled_cities_df = pd.merge(
-        most_hoteled_cities_df, city_coords, on=["Country", "City"]
-    )[["Country", "City", "Latitude", "Longitude"]]
 
-    # Fetching weather for cities
-    weather_per_city = asyncio.run(
-        get_weather_bulk(most_hoteled_cities_df[["Latitude", "Longitude"]].values)
+    weather_per_city, chart_times = asyncio.run(
+        process_cities(
+            hotels_of_interest,
+            most_hoteled_cities_df,
+            output_dir,
+            date_today,
+            session_settings={
+                "limit": args.http_connections,
+                "limit_per_host": args.http_connections_per_host,
+                "dns_ttl": args.dns_cache_ttl,
+                "keepalive_timeout": args.keepalive_timeout,
+                "timeout": args.http_timeout,
+            },
+            weather_kwargs=weather_kwargs,
+            geocoding_kwargs={
+                "cache": geocoding_cache,
+                "snap_tolerance": args.snap_tolerance,
+                "rate_limiter": rate_limiter,
+                "backend_factory": make_backend_factory(args),
+            },
+            writer_threads=args.writer_threads,
+            workers=args.workers,
+            resume=not args.no_resume,
+        )
     )
 
-    # Cropping weather data with a 5-day window for history and forecast data
-    weather_per_city = [
-        city_weather[abs(city_weather["date"] - date_today) <= timedelta(days=5)]
-        for city_weather in weather_per_city
-    ]
-
-    # Constructing a dictionary with temperature for each city
-    weather_per_city = {
-        (row["Country"], row["City"]): weather
-        for weather, (_, row) in zip(
-            weather_per_city, most_hoteled_cities_df.iterrows()
+    print(f"Weather requests: {weather_coalescer.stats()}")  # noqa: T001
+    print(f"Geocoding rate limiter: {rate_limiter.stats()}")  # noqa: T001
+    if args.geocoder == "here":
+        METRICS.add_retries("here_reverse", rate_limiter.retries)
+    for cache_name, cache in [
+        ("Weather", weather_cache),
+        ("Geocoding", geocoding_cache),
+    ]:
+        if cache is not None:
+            print(f"{cache_name} cache: {cache.stats()}")  # noqa: T001
+            cache.close()
+    if chart_times:
+        print(  # noqa: T001
+            f"Rendered {len(chart_times)} charts in {sum(chart_times):.2f} s: "
+            f"{sum(chart_times) / len(chart_times):.3f} s per chart on average, "
+            f"{max(chart_times):.3f} s at most"
         )
-    }
+
+    # Stacking weather of all the cities into a single table and cropping it with
+    # a 5-day window for history and forecast data
+    weather_table = build_weather_table(weather_per_city)
+    weather_table = crop_weather_table(weather_table, date_today, days=5)
 
     # Computing and printing data statistics
+    weather_stats = compute_weather_statistics(weather_table)
     print("Max temperature")  # noqa: T001
-    for _, row in find_max_temp_city(weather_per_city).iterrows():
+    for _, row in weather_stats.max_temp.iterrows():
         print(  # noqa: T001
-            f"\t{row['City']} ({row['Country']}): {row['temp']:.2f} C at {row['date']}"
+            f"\t{row['City']} ({row['Country']}): "
+            f"{row['temp']:.2f} C at {row['date'].date()}"
         )
     print("Min temperature")  # noqa: T001
-    for _, row in find_min_temp_city(weather_per_city).iterrows():
+    for _, row in weather_stats.min_temp.iterrows():
         print(  # noqa: T001
-            f"\t{row['City']} ({row['Country']}): {row['temp']:.2f} C at {row['date']}"
+            f"\t{row['City']} ({row['Country']}): "
+            f"{row['temp']:.2f} C at {row['date'].date()}"
         )
     print("Max daily temperature difference")  # noqa: T001
-    for _, row in find_max_temp_diff(weather_per_city).iterrows():
+    for _, row in weather_stats.max_temp_diff.iterrows():
         print(  # noqa: T001
             f"\t{row['City']} ({row['Country']}): "
-            f"{row['temp_diff']:.2f} C at {row['date']}"
+            f"{row['temp_diff']:.2f} C at {row['date'].date()}"
         )
     print("Max temperature change over current period")  # noqa: T001
-    for _, row in find_max_temp_delta_city(weather_per_city).iterrows():
+    for _, row in weather_stats.max_temp_delta.iterrows():
         print(  # noqa: T001
             f"\t{row['City']} ({row['Country']}): {row['temp_delta']:.2f} C"
         )
 
-    # Getting hotels' addresses
-    addresses = asyncio.run(
-        get_addresses(
-            hotels_of_interest[["Latitude", "Longitude"]].values,
-            req_per_sec=requests_per_second,
-        )
-    )
-    hotels_of_interest["Address"] = addresses
-
-    # Saving data
-    for _, row in most_hoteled_cities_df.iterrows():
-        save_dir = output_dir / f"{row['City']}_{row['Country']}"
-        if not os.path.exists(save_dir):
-            os.mkdir(save_dir)
-
-        curr_city_hotels = hotels_of_interest[
-            (hotels_of_interest["City"] == row["City"])
-            & (hotels_of_interest["Country"] == row["Country"])
-        ]
-        curr_city_hotels.reset_index(inplace=True, drop=True)
-
-        save_dataframe_as_csv_splitted(
-            curr_city_hotels[["Name", "Address", "Latitude", "Longitude"]],
-            save_dir,
-            name_prefix="hotels",
-        )
-
-        draw_and_save_temp_graph(
-            weather_per_city[(row["Country"], row["City"])],
-            save_dir,
-            f"{row['City']}_{row['Country']}",
-            datetime.utcnow().date(),
-        )
-
-        most_hoteled_cities_df[
-            (most_hoteled_cities_df["City"] == row["City"])
-            & (most_hoteled_cities_df["Country"] == row["Country"])
-        ][["Latitude", "Longitude"]].to_csv(save_dir / "center_coords.csv", index=None)
-
 
 if __name__ == "__main__":
     main()
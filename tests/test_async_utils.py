@@ -1,21 +1,45 @@
+import asyncio
 import json
 import random
+from datetime import date, datetime, timedelta
+from functools import partial
+
 import aiohttp
+import pandas as pd
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from asyncmock import AsyncMock
-from datetime import date, datetime
-
-import pandas as pd
+from geopy.exc import GeocoderRateLimited
 
+from benchmarks.fake_api_server import FakeApiServer
+from utils import async_utils
 from utils.async_utils import (
-    get_adress_by_coordinates,
+    HereBackend,
+    RequestCoalescer,
+    WeatherBatcher,
+    date_range,
     get_addresses,
+    get_adress_by_coordinates,
     get_weather,
     get_weather_bulk,
+    iter_addresses,
+    make_cached_requests,
+    make_geocoding_rate_limiter,
+    parse_forecasted_batch,
     parse_forecasted_data,
+    parse_historic_batch,
     parse_historic_data,
-    date_range
+    parse_weather_batch,
+)
+from utils.cache_utils import GeocodingCache, WeatherCache
+from utils.geocoder_utils import (
+    FakeGeocoderBackend,
+    FallbackAddress,
+    FallbackGeocoderBackend,
+    GeocoderBackend,
 )
+from utils.rate_limit_utils import AdaptiveRateLimiter
 
 
 @pytest.mark.asyncio
@@ -40,6 +64,232 @@ async def test_get_addresses(mocker):
     assert res == ["Address"] * test_size
 
 
+@pytest.mark.asyncio
+async def test_get_addresses_geocodes_duplicates_once(mocker):
+    coords = [(1.0, 1.0), (2.0, 2.0), (1.0, 1.0), (2.00001, 2.00001)]
+
+    mock_get_address = mocker.patch(
+        "utils.async_utils.get_adress_by_coordinates",
+        side_effect=lambda lat, lon, _: f"{lat}, {lon}",
+    )
+    res = await get_addresses(coords, 10, snap_tolerance=0.001)
+
+    assert res == ["1.0, 1.0", "2.0, 2.0", "1.0, 1.0", "2.0, 2.0"]
+    assert mock_get_address.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_addresses_with_cache(mocker, tmp_path):
+    coords = [(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]
+    cache = GeocodingCache(tmp_path / "cache.sqlite")
+    cache.set(cache.coords_key(2.0, 2.0), "Cached address")
+
+    mock_get_address = mocker.patch(
+        "utils.async_utils.get_adress_by_coordinates", return_value="Address"
+    )
+    res = await get_addresses(coords, 10, cache=cache)
+
+    assert res == ["Address", "Cached address", "Address"]
+    assert mock_get_address.call_count == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    res = await get_addresses(coords, 10, cache=cache)
+
+    assert res == ["Address", "Cached address", "Address"]
+    assert mock_get_address.call_count == 2
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_iter_addresses_keeps_bounded_window(mocker):
+    test_size = 50
+    window = 4
+    consumed = []
+    in_flight = []
+
+    def coords():
+        for idx in range(test_size):
+            consumed.append(idx)
+            yield float(idx), float(idx)
+
+    async def fake_get_address(lat, lon, _):
+        in_flight.append(lat)
+        # Input is not read far ahead of the coordinates being geocoded
+        assert len(consumed) - int(lat) <= 3 * window + 1
+        await asyncio.sleep(random.random() / 100)
+        in_flight.remove(lat)
+        return f"{lat}, {lon}"
+
+    mocker.patch(
+        "utils.async_utils.get_adress_by_coordinates", side_effect=fake_get_address
+    )
+    max_in_flight = 0
+    res = {}
+    async for idx, address in iter_addresses(coords(), 1000, window=window):
+        max_in_flight = max(max_in_flight, len(in_flight))
+        res[idx] = address
+
+    assert res == {idx: f"{float(idx)}, {float(idx)}" for idx in range(test_size)}
+    assert max_in_flight <= window
+
+
+@pytest.mark.asyncio
+async def test_iter_addresses_from_async_iterator_with_cache(mocker, tmp_path):
+    async def coords():
+        for point in [(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]:
+            yield point
+
+    cache = GeocodingCache(tmp_path / "cache.sqlite")
+    cache.set(cache.coords_key(2.0, 2.0), "Cached address")
+    mock_get_address = mocker.patch(
+        "utils.async_utils.get_adress_by_coordinates", return_value="Address"
+    )
+
+    res = dict(
+        [item async for item in iter_addresses(coords(), 10, cache=cache, window=2)]
+    )
+
+    assert res == {0: "Address", 1: "Cached address", 2: "Address"}
+    assert mock_get_address.call_count == 2
+    assert cache.get(cache.coords_key(3.0, 3.0)) == "Address"
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_iter_addresses_raises_errors(mocker):
+    mocker.patch(
+        "utils.async_utils.get_adress_by_coordinates", side_effect=ValueError("Failed")
+    )
+
+    with pytest.raises(ValueError, match="Failed"):
+        async for _ in iter_addresses([(1.0, 1.0), (2.0, 2.0)], 10, window=2):
+            pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch_size, expected_requests", [(None, 25), (10, 3)])
+async def test_get_addresses_with_backend(batch_size, expected_requests):
+    coords = [(float(idx), -float(idx)) for idx in range(25)]
+    backends = []
+
+    def backend_factory(session):
+        backends.append(FakeGeocoderBackend(session, batch_size=batch_size))
+        return backends[-1]
+
+    res = await get_addresses(coords, 1000, backend_factory=backend_factory)
+
+    assert res == [f"{lat:.5f}, {lon:.5f}" for lat, lon in coords]
+    assert backends[0].requests == expected_requests
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "points, batch_size, expected_window",
+    [(3, None, 3), (250, 100, 3), (500, None, 100)],
+)
+async def test_get_addresses_caps_workers(mocker, points, batch_size, expected_window):
+    spy = mocker.spy(async_utils, "_geocode_stream")
+    coords = [(float(idx % 90), float(idx // 90)) for idx in range(points)]
+
+    res = await get_addresses(
+        coords,
+        window=100,
+        rate_limiter=make_geocoding_rate_limiter(1e6, max_in_flight=100, max_rate=1e6),
+        backend_factory=lambda session: FakeGeocoderBackend(batch_size=batch_size),
+    )
+
+    assert len(res) == points
+    assert spy.call_args.args[3] == expected_window
+
+
+@pytest.mark.asyncio
+async def test_iter_addresses_in_batches(tmp_path):
+    coords = [(float(idx), -float(idx)) for idx in range(25)]
+    cache = GeocodingCache(tmp_path / "cache.sqlite")
+    cache.set(cache.coords_key(*coords[3]), "Cached address")
+    backend = FakeGeocoderBackend(batch_size=10)
+
+    res = dict(
+        [
+            item
+            async for item in iter_addresses(
+                coords,
+                1000,
+                cache=cache,
+                window=2,
+                backend_factory=lambda session: backend,
+            )
+        ]
+    )
+
+    assert res == {
+        idx: "Cached address" if idx == 3 else f"{lat:.5f}, {lon:.5f}"
+        for idx, (lat, lon) in enumerate(coords)
+    }
+    assert (backend.requests, backend.points) == (3, 24)
+    assert len(cache) == 25
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_fallback_addresses_are_not_cached(mocker, tmp_path):
+    coords = [(float(idx), -float(idx)) for idx in range(5)]
+    cache = GeocodingCache(tmp_path / "cache.sqlite")
+    primary = GeocoderBackend()
+    primary.reverse = mocker.AsyncMock(side_effect=GeocoderRateLimited("Throttled"))
+    backend_factory = partial(
+        FallbackGeocoderBackend,
+        primary_factory=lambda session: primary,
+        fallback_factory=FakeGeocoderBackend,
+    )
+
+    res = await get_addresses(
+        coords, 1000, cache=cache, backend_factory=backend_factory
+    )
+    streamed = [
+        item
+        async for item in iter_addresses(
+            coords, 1000, cache=cache, backend_factory=backend_factory
+        )
+    ]
+
+    assert res == [f"{lat:.5f}, {lon:.5f}" for lat, lon in coords]
+    assert all(isinstance(address, FallbackAddress) for address in res)
+    assert len(streamed) == len(coords)
+    assert len(cache) == 0
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_fallback_requests_skip_rate_limiter(mocker):
+    coords = [(float(idx), -float(idx)) for idx in range(5)]
+    primary = GeocoderBackend()
+    primary.reverse = mocker.AsyncMock(side_effect=GeocoderRateLimited("Throttled"))
+
+    def local_fallback(session):
+        fallback = FakeGeocoderBackend(session)
+        fallback.rate_limited = False
+        return fallback
+
+    backend_factory = partial(
+        FallbackGeocoderBackend,
+        primary_factory=lambda session: primary,
+        fallback_factory=local_fallback,
+    )
+    limiter = AdaptiveRateLimiter(initial_rate=1, max_in_flight=1)
+
+    res = await asyncio.wait_for(
+        get_addresses(
+            coords, rate_limiter=limiter, backend_factory=backend_factory, window=1
+        ),
+        timeout=0.5,
+    )
+
+    # Only the request failing on the primary service takes a token
+    assert res == [f"{lat:.5f}, {lon:.5f}" for lat, lon in coords]
+    assert limiter.requests == 1
+
+
 @pytest.mark.asyncio
 async def test_get_weather(mocker):
     with open("tests/test_data/forecast.json") as json_file:
@@ -87,14 +337,205 @@ async def test_get_weather(mocker):
 
 
 @pytest.mark.asyncio
-async def test_get_weather_bulk(mocker):
-    test_length = 10
+async def test_get_weather_with_cache(mocker, tmp_path):
+    with open("tests/test_data/forecast.json") as json_file:
+        test_curr_forecast_data = json.loads(json_file.read())
+
+    with open("tests/test_data/history.json") as json_file:
+        test_historical_data = json.loads(json_file.read())
+
     test_history_depth = 4
-    mock_get_weather = mocker.patch("utils.async_utils.get_weather", return_value="Weather")
-    test_coords = [(random.random(), random.random()) for _ in range(test_length)]
+    side_effects = [test_curr_forecast_data] + [
+        test_historical_data
+    ] * test_history_depth
+    mock_make_request = mocker.patch(
+        "utils.async_utils.make_request", side_effect=side_effects * 2
+    )
+    cache = WeatherCache(tmp_path / "cache.sqlite", ttl=-1)
+
+    async with aiohttp.ClientSession() as test_session:
+        expected_res = await get_weather(
+            2.22, 2.55, test_session, test_history_depth, cache
+        )
+        # The forecast has already expired, while history is cached forever
+        actual_res = await get_weather(
+            2.221, 2.549, test_session, test_history_depth, cache
+        )
+
+    assert mock_make_request.call_count == test_history_depth + 2
+    assert (cache.hits, cache.misses) == (test_history_depth, test_history_depth + 2)
+    pd.testing.assert_frame_equal(expected_res, actual_res)
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_make_cached_requests_does_not_cache_errors(tmp_path):
+    async def handle_unauthorized(request):
+        return web.json_response({"cod": 401, "message": "Invalid API key"}, status=401)
+
+    app = web.Application()
+    app.router.add_get("/onecall/timemachine", handle_unauthorized)
+    cache = WeatherCache(tmp_path / "cache.sqlite")
+
+    async with TestServer(app) as server, aiohttp.ClientSession() as test_session:
+        with pytest.raises(aiohttp.ClientResponseError):
+            await make_cached_requests(
+                [str(server.make_url("/onecall/timemachine"))],
+                ["key"],
+                test_session,
+                cache,
+                ttl=None,
+            )
+
+    assert cache.get_many(["key"]) == {}
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_get_weather_bulk(mocker):
+    with open("tests/test_data/forecast.json") as json_file:
+        test_curr_forecast_data = json.loads(json_file.read())
+    with open("tests/test_data/history.json") as json_file:
+        test_historical_data = json.loads(json_file.read())
+
+    async def fake_request(req, session):
+        return test_historical_data if "timemachine" in req else test_curr_forecast_data
+
+    mock_make_request = mocker.patch(
+        "utils.async_utils.make_request", side_effect=fake_request
+    )
+    test_coords = [(random.random(), random.random()) for _ in range(10)]
+    async with aiohttp.ClientSession() as test_session:
+        expected_res = await get_weather(*test_coords[0], test_session)
 
-    res = await get_weather_bulk(test_coords, history_depth=test_history_depth)
-    assert res == ["Weather"] * 10
+        forecast_spy = mocker.spy(async_utils, "parse_forecasted_batch")
+        history_spy = mocker.spy(async_utils, "parse_historic_batch")
+        res = await get_weather_bulk(test_coords, session=test_session)
+
+    # Responses of all the places are parsed at once
+    assert (forecast_spy.call_count, history_spy.call_count) == (1, 1)
+    assert len(res) == 10
+    for weather in res:
+        pd.testing.assert_frame_equal(weather, expected_res)
+    assert mock_make_request.call_args.args[1] is test_session
+
+    assert len(await get_weather_bulk(test_coords[:2], history_depth=2)) == 2
+    assert await get_weather_bulk([]) == []
+
+
+@pytest.mark.asyncio
+async def test_weather_batcher(mocker):
+    async def fake_bulk(coords, session, **kwargs):
+        await asyncio.sleep(0.01)
+        if (0.0, 0.0) in coords:
+            raise ValueError("Failed")
+        return [f"Weather {lat}" for lat, _ in coords]
+
+    get_bulk = mocker.patch("utils.async_utils.get_weather_bulk", side_effect=fake_bulk)
+    batcher = WeatherBatcher("Session", history_depth=2)
+
+    res = await asyncio.gather(*[batcher(float(lat), 1.0) for lat in range(1, 4)])
+    assert res == ["Weather 1.0", "Weather 2.0", "Weather 3.0"]
+    assert get_bulk.call_count == batcher.batches == 1
+    assert get_bulk.call_args.kwargs == {"session": "Session", "history_depth": 2}
+
+    # A failed batch fails all of its callers
+    res = await asyncio.gather(
+        batcher(0.0, 0.0), batcher(1.0, 1.0), return_exceptions=True
+    )
+    assert all(isinstance(err, ValueError) for err in res)
+    assert await batcher(5.0, 1.0) == "Weather 5.0"
+    assert batcher.batches == 3
+
+
+@pytest.mark.asyncio
+async def test_request_coalescer():
+    calls = []
+
+    async def fetch(url):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        if url == "bad":
+            raise ValueError(url)
+        return {"url": url}
+
+    coalescer = RequestCoalescer()
+    res = await asyncio.gather(
+        *[coalescer(url, fetch, url) for url in ["a", "b", "a", "a"]],
+        coalescer("bad", fetch, "bad"),
+        coalescer("bad", fetch, "bad"),
+        return_exceptions=True,
+    )
+
+    assert res[:4] == [{"url": "a"}, {"url": "b"}, {"url": "a"}, {"url": "a"}]
+    assert all(isinstance(err, ValueError) for err in res[4:])
+    assert sorted(calls) == ["a", "b", "bad"]
+    assert (coalescer.issued, coalescer.coalesced) == (3, 3)
+
+    # Finished requests are sent again
+    assert await coalescer("a", fetch, "a") == {"url": "a"}
+    assert coalescer.issued == 4
+
+
+@pytest.mark.asyncio
+async def test_get_weather_bulk_coalesces_requests(mocker):
+    with open("tests/test_data/forecast.json") as json_file:
+        test_curr_forecast_data = json.loads(json_file.read())
+    with open("tests/test_data/history.json") as json_file:
+        test_historical_data = json.loads(json_file.read())
+
+    async def fake_request(req, session):
+        await asyncio.sleep(0.01)
+        return test_historical_data if "timemachine" in req else test_curr_forecast_data
+
+    mock_make_request = mocker.patch(
+        "utils.async_utils.make_request", side_effect=fake_request
+    )
+    coalescer = RequestCoalescer()
+
+    res = await get_weather_bulk(
+        [(2.22, 2.55), (3.0, 3.0), (2.22, 2.55)], history_depth=4, coalescer=coalescer
+    )
+
+    assert mock_make_request.call_count == 10
+    assert (coalescer.issued, coalescer.coalesced) == (10, 5)
+    pd.testing.assert_frame_equal(res[0], res[2])
+
+
+@pytest.mark.asyncio
+async def test_clients_with_fake_api_server():
+    # The server answers 5 requests and throttles the rest
+    server = FakeApiServer(rate_limit=1e-9, burst=5)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    base_url = f"http://{host}:{port}"
+
+    try:
+        (weather,) = await get_weather_bulk(
+            [(48.85, 2.35)], history_depth=2, base_url=f"{base_url}/data/2.5"
+        )
+        addresses = await get_addresses(
+            [(48.85, 2.35), (40.0, -3.5)],
+            req_per_sec=1000,
+            backend_factory=partial(HereBackend, base_url=base_url),
+        )
+
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await get_weather_bulk([(1.0, 1.0)], base_url=f"{base_url}/data/2.5")
+    finally:
+        await runner.cleanup()
+
+    today = datetime.utcnow().date()
+    assert weather.index.tolist() == [-2, -1, 0, 1, 2, 3, 4, 5, 6, 7]
+    assert weather["date"].tolist() == [
+        today + timedelta(days=day) for day in weather.index
+    ]
+    assert addresses == ["48.85000, 2.35000", "40.00000, -3.50000"]
+    assert error.value.status == 429
+    assert server.responses[200] == 5
 
 
 def test_parse_forecast():
@@ -141,6 +582,52 @@ def test_history_data_parsing():
     pd.testing.assert_series_equal(expected_res, actual_res, check_category_order=False)
 
 
+def test_parse_batches():
+    with open("tests/test_data/forecast.json") as json_file:
+        forecast = json.loads(json_file.read())
+    with open("tests/test_data/history.json") as json_file:
+        history = json.loads(json_file.read())
+    empty_history = {"current": history["current"], "hourly": []}
+
+    forecasts = parse_forecasted_batch([forecast, {"daily": []}, forecast])
+    assert forecasts["response_id"].tolist() == [0] * 8 + [2] * 8
+    assert forecasts["date"].iloc[8] == pd.Timestamp(2021, 7, 4)
+    pd.testing.assert_frame_equal(
+        forecasts.iloc[8:].reset_index(drop=True),
+        forecasts.iloc[:8].assign(response_id=2),
+    )
+
+    histories = parse_historic_batch([history, empty_history, history])
+    expected_res = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2021-07-04"] * 3),
+            "max_temp": [27.29, float("nan"), 27.29],
+            "min_temp": [16.12, float("nan"), 16.12],
+        }
+    )
+    pd.testing.assert_frame_equal(expected_res, histories)
+
+
+def test_parse_weather_batch():
+    with open("tests/test_data/forecast.json") as json_file:
+        forecast = json.loads(json_file.read())
+    with open("tests/test_data/history.json") as json_file:
+        history = json.loads(json_file.read())
+
+    res = parse_weather_batch(
+        [(forecast, [history] * 2), ({"daily": []}, []), (forecast, [history])],
+        date(2021, 7, 4),
+    )
+
+    assert [len(weather) for weather in res] == [10, 0, 9]
+    assert res[0].index.tolist() == [0, 0, 0, 1, 2, 3, 4, 5, 6, 7]
+    assert res[0]["date"].iloc[-1] == date(2021, 7, 11)
+    pd.testing.assert_frame_equal(res[0].iloc[1:], res[2])
+    pd.testing.assert_frame_equal(
+        res[2], parse_weather_batch([(forecast, [history])], date(2021, 7, 4))[0]
+    )
+
+
 def test_date_range():
     res = [date for date in date_range(date(2019, 1, 1), date(2019, 1, 5))]
     expected_res = [
@@ -0,0 +1,60 @@
+from utils.cache_utils import GeocodingCache, SqliteCache
+
+
+def test_cache_get_and_set(tmp_path):
+    with SqliteCache(tmp_path / "cache.sqlite") as cache:
+        cache.set("key", {"value": [1, 2]})
+
+        assert cache.get("key") == {"value": [1, 2]}
+        assert cache.get("missing") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_is_persistent(tmp_path):
+    with SqliteCache(tmp_path / "cache.sqlite") as cache:
+        cache.set("key", "value")
+
+    with SqliteCache(tmp_path / "cache.sqlite") as cache:
+        assert cache.get("key") == "value"
+
+
+def test_cache_ttl(tmp_path):
+    with SqliteCache(tmp_path / "cache.sqlite", ttl=-1) as cache:
+        cache.set("expired", "value")
+        cache.set("eternal", "value", ttl=None)
+
+        assert cache.get_many(["expired", "eternal"]) == {"eternal": "value"}
+        assert len(cache) == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path, mocker):
+    mock_time = mocker.patch("utils.cache_utils.time.time")
+    with SqliteCache(tmp_path / "cache.sqlite", max_entries=2) as cache:
+        mock_time.return_value = 1
+        cache.set_many({"first": 1, "second": 2})
+        mock_time.return_value = 2
+        cache.get("first")
+        mock_time.return_value = 3
+        cache.set("third", 3)
+
+        assert cache.get_many(["first", "second", "third"]) == {"first": 1, "third": 3}
+
+
+def test_cache_eviction_uses_indexes(tmp_path):
+    with SqliteCache(tmp_path / "cache.sqlite", max_entries=2) as cache:
+        plans = [
+            cache._connection.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+            for query in [
+                "DELETE FROM cache WHERE expires_at <= 0",
+                "SELECT key FROM cache ORDER BY accessed_at LIMIT 1",
+            ]
+        ]
+
+    assert "USING INDEX cache_expires_at" in str(plans[0])
+    assert "USING INDEX cache_accessed_at" in str(plans[1])
+
+
+def test_geocoding_cache_rounds_coordinates(tmp_path):
+    with GeocodingCache(tmp_path / "cache.sqlite", precision=3) as cache:
+        assert cache.coords_key(48.85341, 2.34881) == cache.coords_key(48.8534, 2.3488)
+        assert cache.coords_key(-0.00001, 0.0) == "0.000,0.000"
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.center_utils import compute_city_centers
+
+hotels = pd.DataFrame(
+    {
+        "Country": ["FI", "FJ", "FI", "FJ", "FJ", "FI", "US"],
+        "City": ["Helsinki", "Suva", "Helsinki", "Suva", "Suva", "Helsinki", "Boston"],
+        "Latitude": [60.0, -16.0, 61.0, -17.0, -16.5, 60.2, 42.36],
+        "Longitude": [24.0, 179.0, 26.0, -179.0, 179.5, 24.1, -71.06],
+    }
+)
+
+
+def test_bbox_centers():
+    centers = compute_city_centers(hotels)
+
+    expected = pd.DataFrame(
+        {
+            "Country": ["FI", "FJ", "US"],
+            "City": ["Helsinki", "Suva", "Boston"],
+            # Suva straddles the antimeridian
+            "Latitude": [60.5, -16.5, 42.36],
+            "Longitude": [25.0, -180.0, -71.06],
+        }
+    )
+    pd.testing.assert_frame_equal(centers, expected)
+
+
+def test_centroid_centers():
+    centers = compute_city_centers(hotels, method="centroid")
+
+    assert centers["City"].tolist() == ["Helsinki", "Suva", "Boston"]
+    np.testing.assert_allclose(
+        centers[["Latitude", "Longitude"]].iloc[[0, 2]],
+        [[60.4, 24.7], [42.36, -71.06]],
+        atol=0.05,
+    )
+    assert centers["Latitude"][1] == pytest.approx(-16.5, abs=0.01)
+    assert abs(centers["Longitude"][1]) > 179.5
+
+
+def test_minimax_centers():
+    square = pd.DataFrame(
+        {
+            "Country": ["XX"] * 5,
+            "City": ["Square"] * 5,
+            "Latitude": [-1.0, -1.0, 1.0, 1.0, 0.1],
+            "Longitude": [-1.0, 1.0, -1.0, 1.0, 0.1],
+        }
+    )
+    centers = compute_city_centers(pd.concat([hotels, square]), method="minimax")
+
+    assert centers["City"].tolist() == ["Helsinki", "Suva", "Boston", "Square"]
+    np.testing.assert_allclose(
+        centers.iloc[3][["Latitude", "Longitude"]].to_numpy(float), [0, 0], atol=1e-9
+    )
+    np.testing.assert_allclose(
+        centers.iloc[2][["Latitude", "Longitude"]].to_numpy(float), [42.36, -71.06]
+    )
+    # The center is closer to the farthest hotel than the centroid is
+    helsinki = hotels[hotels["City"] == "Helsinki"]
+    farthest = {}
+    for method in ["minimax", "centroid"]:
+        center = compute_city_centers(helsinki, method=method).iloc[0]
+        farthest[method] = np.hypot(
+            (helsinki["Longitude"] - center["Longitude"]) * np.cos(np.radians(60.5)),
+            helsinki["Latitude"] - center["Latitude"],
+        ).max()
+    assert farthest["minimax"] < farthest["centroid"]
+
+
+def test_unknown_center_method():
+    with pytest.raises(ValueError):
+        compute_city_centers(hotels, method="median")
@@ -1,10 +1,15 @@
 from datetime import date
 
 import pandas as pd
+from matplotlib import pyplot as plt
 
 from utils.dataframe_utils import (
+    accumulate_city_stats,
+    draw_and_save_temp_graph_timed,
     refine_data,
+    select_hotels_in_cities,
     select_most_hoteled_cities,
+    select_top_cities,
     find_max_temp_city,
     find_max_temp_delta_city,
     find_max_temp_diff,
@@ -128,6 +133,20 @@ def test_refine_data():
     pd.testing.assert_frame_equal(hotels_data_refined, actual_res, check_index_type=False)
 
 
+def test_refine_data_keeps_only_used_categories():
+    hotels_data_categorical = hotels_data_raw.astype(
+        {"Country": "category", "City": "category"}
+    )
+    actual_res = refine_data(hotels_data_categorical)
+
+    assert list(actual_res["City"].cat.categories) == ["Helsinki", "Washington"]
+    pd.testing.assert_frame_equal(
+        hotels_data_refined,
+        actual_res.astype({"Country": object, "City": object}),
+        check_index_type=False,
+    )
+
+
 def test_select_most_hoteled_cities_for_single_country():
     actual_res = select_most_hoteled_cities(hotels_data_for_aggregation_for_single_res)
     pd.testing.assert_frame_equal(hotels_data_for_aggregation_for_single_res_exp, actual_res, check_index_type=False)
@@ -138,6 +157,124 @@ def test_select_most_hoteled_cities_for_multiple_counties():
     pd.testing.assert_frame_equal(hotels_data_for_aggregation_for_multiple_res_exp, actual_res, check_index_type=False)
 
 
+def test_select_most_hoteled_cities_top_k():
+    actual_res = select_most_hoteled_cities(
+        hotels_data_for_aggregation_for_multiple_res, top_k=2
+    )
+    expected_res = pd.DataFrame(
+        {
+            "Country": ["FI", "FI"],
+            "City": ["City1", "City2"]
+        }
+    )
+    pd.testing.assert_frame_equal(expected_res, actual_res)
+
+    actual_res = select_most_hoteled_cities(
+        hotels_data_for_aggregation_for_multiple_res, top_k=3
+    )
+    expected_res = pd.DataFrame(
+        {
+            "Country": ["FI", "FI", "FI"],
+            "City": ["City1", "City2", "City3"]
+        }
+    )
+    pd.testing.assert_frame_equal(expected_res, actual_res)
+
+
+def test_select_most_hoteled_cities_for_categorical_columns():
+    hotels_data_categorical = hotels_data_for_aggregation_for_multiple_res.astype(
+        {"Country": "category", "City": "category"}
+    )
+    actual_res = select_most_hoteled_cities(hotels_data_categorical)
+    pd.testing.assert_frame_equal(
+        hotels_data_for_aggregation_for_multiple_res_exp,
+        actual_res.astype(object),
+        check_index_type=False,
+    )
+
+
+def test_select_most_hoteled_cities_sorts_categorical_columns_by_name():
+    hotels = pd.DataFrame(
+        {
+            "Country": pd.Categorical(
+                ["US", "FI", "AT", "US"], categories=["US", "FI", "AT"]
+            ),
+            "City": pd.Categorical(
+                ["Boston", "Helsinki", "Vienna", "Austin"],
+                categories=["Vienna", "Helsinki", "Boston", "Austin"],
+            ),
+        }
+    )
+
+    actual_res = select_most_hoteled_cities(hotels)
+
+    assert actual_res.values.tolist() == [
+        ["AT", "Vienna"],
+        ["FI", "Helsinki"],
+        ["US", "Austin"],
+        ["US", "Boston"],
+    ]
+
+
+def test_select_hotels_in_cities():
+    actual_res = select_hotels_in_cities(
+        hotels_data_for_aggregation_for_multiple_res,
+        hotels_data_for_aggregation_for_multiple_res_exp,
+    )
+    pd.testing.assert_frame_equal(
+        hotels_data_for_aggregation_for_multiple_res.iloc[:4], actual_res
+    )
+
+
+def test_accumulate_city_stats():
+    hotels = pd.DataFrame(
+        {
+            "Country": ["FI", "FI", "US", "FI", "US"],
+            "City": ["Helsinki", "Espoo", "Boston", "Helsinki", "Boston"],
+            "Latitude": [60.17, 60.21, 42.36, 60.16, 42.35],
+            "Longitude": [24.94, 24.66, -71.06, 24.95, -71.05],
+        }
+    ).astype({"Country": "category", "City": "category"})
+    # Chunks with different categories
+    chunks = [hotels.iloc[:2], hotels.iloc[2:]]
+    chunks = [
+        chunk.assign(City=chunk["City"].cat.remove_unused_categories())
+        for chunk in chunks
+    ]
+
+    actual_res = accumulate_city_stats(chunks)
+
+    expected_res = pd.DataFrame(
+        {
+            "Country": ["FI", "FI", "US"],
+            "City": ["Espoo", "Helsinki", "Boston"],
+            "Hotels": [1, 2, 2],
+        }
+    )
+    pd.testing.assert_frame_equal(expected_res, actual_res)
+    pd.testing.assert_frame_equal(
+        expected_res.iloc[:0], accumulate_city_stats([]), check_index_type=False
+    )
+
+
+def test_select_top_cities_matches_select_most_hoteled_cities():
+    hotels_per_city = accumulate_city_stats(
+        [
+            hotels_data_for_aggregation_for_multiple_res.assign(
+                Latitude=0.0, Longitude=0.0
+            )
+        ]
+    ).set_index(["Country", "City"])["Hotels"]
+
+    for top_k in [1, 2]:
+        pd.testing.assert_frame_equal(
+            select_most_hoteled_cities(
+                hotels_data_for_aggregation_for_multiple_res, top_k=top_k
+            ),
+            select_top_cities(hotels_per_city, top_k=top_k),
+        )
+
+
 # Testing find_XXX_temperature methods
 
 def test_find_max_temperature_single_result():
@@ -252,3 +389,16 @@ def test_find_max_change_over_time_multiple_result():
     )
     actual_res = find_max_temp_delta_city(city_weather_dict_for_multiple_result)
     pd.testing.assert_frame_equal(expected_res, actual_res, check_like=True, check_dtype=False)
+
+
+def test_draw_and_save_temp_graph_timed(tmp_path):
+    for chart in [
+        (kuopio_weather, tmp_path, "Kuopio_FI", observation_dates[2]),
+        (sekke_weather, tmp_path, "Sekke_RU", observation_dates[2]),
+    ]:
+        assert draw_and_save_temp_graph_timed(chart) > 0
+
+    assert (tmp_path / "weather_kuopio_fi.png").exists()
+    assert (tmp_path / "weather_sekke_ru.png").exists()
+    # Figures are not registered in pyplot, so none of them is kept alive
+    assert plt.get_fignums() == []
@@ -0,0 +1,153 @@
+import zipfile
+
+import pandas as pd
+import pytest
+
+from utils.dataframe_utils import refine_data
+from utils.file_utils import (
+    assemble_dataframe,
+    iter_csv_chunks_from_zipfile,
+    read_csv_from_zipfile,
+    read_csv_from_zipfile_parallel,
+    save_city_output,
+    unpack_csv_from_zipfile,
+)
+
+hotels_part_0 = pd.DataFrame(
+    {
+        "Id": [1, 2, 3],
+        "Name": ["Name1", "Name2", "Name3"],
+        "Country": ["FI", "FI", "US"],
+        "City": ["Helsinki", "Helsinki", "Boston"],
+        "Latitude": [60.17, 60.16, 42.36],
+        "Longitude": [24.94, 24.93, -71.06],
+    }
+)
+
+hotels_part_1 = pd.DataFrame(
+    {
+        "Id": [4, 5],
+        "Name": ["Name4", "Name5"],
+        "Country": ["US", "PL"],
+        "City": ["Boston", "Warsaw"],
+        "Latitude": [42.35, 52.23],
+        "Longitude": [-71.05, 21.01],
+    }
+)
+
+
+@pytest.fixture()
+def hotels_zip(tmp_path):
+    zip_path = tmp_path / "hotels.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        zip_file.writestr("part-00000.csv", hotels_part_0.to_csv(index=False))
+        zip_file.writestr("part-00001.csv", hotels_part_1.to_csv(index=False))
+        zip_file.writestr("readme.txt", "not a csv")
+    return zip_path
+
+
+def test_read_csv_from_zipfile_matches_extraction(hotels_zip, tmp_path):
+    extract_dir = tmp_path / "temp"
+    unpack_csv_from_zipfile(hotels_zip, extract_dir)
+    expected_res = assemble_dataframe(extract_dir).reset_index(drop=True)
+
+    actual_res = read_csv_from_zipfile(hotels_zip)
+
+    pd.testing.assert_frame_equal(
+        expected_res.sort_values("Name").reset_index(drop=True), actual_res
+    )
+
+
+def test_iter_csv_chunks_from_zipfile(hotels_zip):
+    chunks = list(iter_csv_chunks_from_zipfile(hotels_zip, chunksize=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1, 2]
+
+
+def test_read_csv_from_zipfile_parallel(hotels_zip):
+    expected_res = refine_data(read_csv_from_zipfile(hotels_zip)).reset_index(drop=True)
+
+    actual_res = read_csv_from_zipfile_parallel(
+        hotels_zip, workers=2, transform=refine_data
+    )
+
+    pd.testing.assert_frame_equal(expected_res, actual_res)
+
+
+def test_read_csv_from_zipfile_with_transform(hotels_zip):
+    actual_res = read_csv_from_zipfile(
+        hotels_zip, chunksize=2, transform=lambda chunk: chunk[chunk["Country"] == "US"]
+    )
+
+    assert actual_res["Name"].tolist() == ["Name3", "Name4"]
+    assert isinstance(actual_res["City"].dtype, pd.CategoricalDtype)
+
+
+def test_read_csv_from_zipfile_applies_schema(hotels_zip):
+    actual_res = read_csv_from_zipfile(hotels_zip, chunksize=2)
+
+    assert list(actual_res.columns) == [
+        "Name",
+        "Country",
+        "City",
+        "Latitude",
+        "Longitude",
+    ]
+    assert isinstance(actual_res["Country"].dtype, pd.CategoricalDtype)
+    assert sorted(actual_res["City"].cat.categories) == ["Boston", "Helsinki", "Warsaw"]
+
+
+def test_read_csv_from_bad_zipfile(tmp_path):
+    not_a_zip = tmp_path / "hotels.zip"
+    not_a_zip.write_text("Id,Name\n1,Name1\n")
+
+    with pytest.raises(zipfile.BadZipfile):
+        read_csv_from_zipfile(not_a_zip)
+
+
+def test_read_csv_from_zipfile_without_csv_files(tmp_path):
+    empty_zip = tmp_path / "hotels.zip"
+    with zipfile.ZipFile(empty_zip, "w") as zip_file:
+        zip_file.writestr("readme.txt", "No hotels")
+
+    for read in [read_csv_from_zipfile, read_csv_from_zipfile_parallel]:
+        with pytest.raises(ValueError, match="hotels.zip"):
+            read(empty_zip)
+
+
+def test_save_city_output(tmp_path):
+    hotels = pd.DataFrame(
+        {
+            "Country": ["FI"] * 100,
+            "City": ["Helsinki"] * 100,
+            "Name": [f"Name{idx}" for idx in range(100)],
+            "Address": [f"Address{idx}" for idx in range(100)],
+            "Latitude": [60.17, 60.16] * 50,
+            "Longitude": [24.94, 24.93] * 50,
+        }
+    )
+    save_dir = tmp_path / "Helsinki_FI"
+    save_dir.mkdir()
+    # Left from a previous run with more hotels
+    (save_dir / "hotels_0002.csv").write_text("stale")
+
+    save_city_output(hotels, (60.165, 24.935), save_dir, chunk_size=60)
+
+    assert sorted(path.name for path in save_dir.iterdir()) == [
+        "center_coords.csv",
+        "hotels_0000.csv",
+        "hotels_0001.csv",
+    ]
+    saved_hotels = pd.concat(
+        [
+            pd.read_csv(save_dir / f"hotels_000{idx}.csv", index_col=0)
+            for idx in range(2)
+        ]
+    )
+    pd.testing.assert_frame_equal(
+        hotels[["Name", "Address", "Latitude", "Longitude"]], saved_hotels
+    )
+    pd.testing.assert_frame_equal(
+        pd.DataFrame({"Latitude": [60.165], "Longitude": [24.935]}),
+        pd.read_csv(save_dir / "center_coords.csv"),
+    )
@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.geo_utils import (
+    NearestPointIndex,
+    chord_to_km,
+    snap_coordinates,
+    to_unit_vectors,
+)
+
+
+def test_snap_coordinates_merges_exact_duplicates():
+    coords = [(1.5, 2.5), (3.0, 4.0), (1.5, 2.5), (1.50001, 2.5)]
+
+    unique_coords, inverse = snap_coordinates(coords)
+
+    assert len(unique_coords) == 3
+    np.testing.assert_array_equal(unique_coords[inverse], coords)
+
+
+def test_snap_coordinates_with_tolerance():
+    coords = [(48.85341, 2.34881), (10.0, 10.0), (48.85342, 2.34882)]
+
+    unique_coords, inverse = snap_coordinates(coords, tolerance=0.001)
+
+    assert len(unique_coords) == 2
+    assert inverse[0] == inverse[2]
+    np.testing.assert_array_equal(unique_coords[inverse[2]], coords[0])
+
+
+def test_nearest_point_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lat = np.concatenate([rng.uniform(-90, 90, 500), rng.normal(60, 0.1, 500)])
+    lon = np.concatenate([rng.uniform(-180, 180, 500), rng.normal(25, 0.1, 500)])
+    query_lat = np.concatenate([rng.uniform(-90, 90, 200), rng.normal(60, 0.1, 200)])
+    query_lon = np.concatenate([rng.uniform(-180, 180, 200), rng.normal(25, 0.1, 200)])
+
+    positions, distances = NearestPointIndex(lat, lon, leaf_size=8).query(
+        query_lat, query_lon, chunk_size=64
+    )
+
+    chords = np.linalg.norm(
+        to_unit_vectors(query_lat, query_lon)[:, None] - to_unit_vectors(lat, lon),
+        axis=2,
+    )
+    np.testing.assert_array_equal(positions, chords.argmin(axis=1))
+    np.testing.assert_allclose(distances, chord_to_km(chords.min(axis=1)))
+    assert NearestPointIndex([], []).query([1.0], [1.0])[0].tolist() == [-1]
@@ -0,0 +1,179 @@
+import asyncio
+
+import pandas as pd
+import pytest
+from geopy.exc import GeocoderRateLimited
+
+from utils.geocoder_utils import (
+    FakeGeocoderBackend,
+    FallbackAddress,
+    FallbackGeocoderBackend,
+    GeocoderBackend,
+    OfflineGeocoderBackend,
+    SharedGeocoderBackend,
+    load_gazetteer,
+)
+from utils.rate_limit_utils import AdaptiveRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_backend_interface():
+    async with GeocoderBackend() as backend:
+        assert backend.batch_size is None
+        with pytest.raises(NotImplementedError):
+            await backend.reverse(1.0, 2.0)
+        with pytest.raises(NotImplementedError):
+            await backend.reverse_batch([(1.0, 2.0)])
+
+
+@pytest.mark.asyncio
+async def test_fake_backend():
+    async with FakeGeocoderBackend(batch_size=10) as backend:
+        assert await backend.reverse(1.0, 2.0) == "1.00000, 2.00000"
+        assert await backend.reverse_batch([(1.0, 2.0), (-3.5, 4.25)]) == [
+            "1.00000, 2.00000",
+            "-3.50000, 4.25000",
+        ]
+
+    assert (backend.requests, backend.points) == (2, 3)
+
+
+def make_gazetteer_csv(path):
+    pd.DataFrame(
+        {
+            "name": ["Helsinki", "Espoo", "Suva", "Broken", "Taveuni"],
+            "country": ["FI", "FI", "FJ", "XX", None],
+            "latitude": [60.17, 60.21, -18.14, "not a number", -16.85],
+            "longitude": [24.94, 24.66, 178.44, 0.0, -179.97],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+def test_load_gazetteer(tmp_path):
+    gazetteer = load_gazetteer(
+        make_gazetteer_csv(tmp_path / "places.csv"), address_columns=["name", "country"]
+    )
+
+    assert len(gazetteer) == 4
+    # Nearest places are found across the antimeridian
+    assert gazetteer.nearest([60.2, -16.9, -18.0], [24.7, 179.99, 178.5]) == [
+        "Espoo, FI",
+        "Taveuni",
+        "Suva, FJ",
+    ]
+    assert gazetteer.nearest([60.2, 0.0], [24.7, 0.0], max_distance=100) == [
+        "Espoo, FI",
+        None,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_offline_backend(tmp_path):
+    gazetteer = load_gazetteer(make_gazetteer_csv(tmp_path / "places.csv"))
+
+    async with OfflineGeocoderBackend(gazetteer=gazetteer, max_distance=50) as backend:
+        assert await backend.reverse(60.17, 24.95) == "Helsinki"
+        assert await backend.reverse_batch([(60.2, 24.7), (0.0, 0.0)]) == [
+            "Espoo",
+            None,
+        ]
+        # Requests made at once are resolved by one query
+        res = await asyncio.gather(
+            backend.reverse_batch([(60.2, 24.7), (-18.0, 178.5)]),
+            backend.reverse(60.17, 24.95),
+        )
+        assert res == [["Espoo", "Suva"], "Helsinki"]
+
+    assert backend.queries == 3
+    with pytest.raises(ValueError):
+        OfflineGeocoderBackend()
+
+
+@pytest.mark.asyncio
+async def test_shared_backend(mocker):
+    wrapped = FakeGeocoderBackend(batch_size=10)
+    mocker.spy(wrapped, "__aenter__")
+    mocker.spy(wrapped, "__aexit__")
+    backend = SharedGeocoderBackend(backend_factory=lambda session: wrapped)
+
+    for _ in range(2):
+        async with backend:
+            assert await backend.reverse_batch([(1.0, 2.0)]) == ["1.00000, 2.00000"]
+    assert backend.batch_size == 10
+    assert (wrapped.__aenter__.call_count, wrapped.__aexit__.call_count) == (1, 0)
+
+    await backend.close()
+    await backend.close()
+    assert wrapped.__aexit__.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_backend(mocker):
+    primary = GeocoderBackend()
+    primary.reverse = mocker.AsyncMock(
+        side_effect=[GeocoderRateLimited("Too many requests"), "Primary address"]
+    )
+    fallback = FakeGeocoderBackend(batch_size=None)
+
+    backend = FallbackGeocoderBackend(
+        primary_factory=lambda session: primary,
+        fallback_factory=lambda session: fallback,
+        cooldown=0.1,
+    )
+    async with backend:
+        address = await backend.reverse(1.0, 2.0)
+        assert address == "1.00000, 2.00000"
+        assert isinstance(address, FallbackAddress)
+        # The primary backend is not asked during the cooldown
+        assert await backend.reverse_batch([(3.0, 4.0)]) == ["3.00000, 4.00000"]
+        await asyncio.sleep(0.1)
+        address = await backend.reverse(5.0, 6.0)
+        assert address == "Primary address"
+        assert not isinstance(address, FallbackAddress)
+
+    assert backend.fallbacks == 2
+    assert primary.reverse.call_count == 2
+
+    with pytest.raises(ValueError):
+        primary.reverse = mocker.AsyncMock(side_effect=ValueError)
+        await backend.reverse(1.0, 2.0)
+
+
+@pytest.mark.asyncio
+async def test_fallback_backend_reports_to_rate_limiter(mocker):
+    primary = GeocoderBackend()
+    primary.reverse = mocker.AsyncMock(side_effect=GeocoderRateLimited("Throttled"))
+    backend = FallbackGeocoderBackend(
+        primary_factory=lambda session: primary,
+        fallback_factory=FakeGeocoderBackend,
+    )
+    limiter = AdaptiveRateLimiter(initial_rate=100, max_rate=1000)
+
+    async with backend:
+        for _ in range(3):
+            await limiter(backend.reverse, 1.0, 2.0)
+
+    # The throttling is registered once, answers of the fallback keep the rate
+    assert (limiter.rate, limiter.throttled, limiter.retries) == (50, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_fallback_backend_rate_limited(mocker, tmp_path):
+    primary = GeocoderBackend()
+    primary.reverse = mocker.AsyncMock(side_effect=GeocoderRateLimited("Throttled"))
+    backend = FallbackGeocoderBackend(
+        primary_factory=lambda session: primary,
+        fallback_factory=lambda session: OfflineGeocoderBackend(
+            gazetteer=load_gazetteer(make_gazetteer_csv(tmp_path / "places.csv"))
+        ),
+        cooldown=0.1,
+    )
+
+    # Requests skip the rate limiter only while the offline backend answers them
+    async with SharedGeocoderBackend(backend_factory=lambda session: backend) as shared:
+        assert shared.rate_limited
+        await shared.reverse(60.17, 24.95)
+        assert not shared.rate_limited
+        await asyncio.sleep(0.1)
+        assert shared.rate_limited
@@ -0,0 +1,22 @@
+import pytest
+
+from utils.http_utils import SharedSessionAdapter, make_client_session
+
+
+@pytest.mark.asyncio
+async def test_make_client_session():
+    async with make_client_session(limit=10, limit_per_host=5, dns_ttl=60) as session:
+        assert session.connector.limit == 10
+        assert session.connector.limit_per_host == 5
+        assert session.connector.use_dns_cache
+
+
+@pytest.mark.asyncio
+async def test_shared_session_adapter_keeps_session_open():
+    async with make_client_session() as session:
+        async with SharedSessionAdapter(
+            proxies=None, ssl_context=None, session=session
+        ) as adapter:
+            assert adapter.session is session
+
+        assert not session.closed
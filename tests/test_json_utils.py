@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from utils import json_utils
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_round_trip(mocker, use_orjson):
+    if not use_orjson:
+        mocker.patch("utils.json_utils.orjson", None)
+    obj = {"city": "Paris", "temps": [1.5, -2.25], "count": np.int64(3), 7: None}
+
+    encoded = json_utils.dumps(obj)
+
+    assert isinstance(encoded, str)
+    assert json_utils.loads(encoded) == {
+        "city": "Paris",
+        "temps": [1.5, -2.25],
+        "count": 3,
+        "7": None,
+    }
+    assert json_utils.loads(encoded.encode()) == json_utils.loads(encoded)
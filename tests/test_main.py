@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import main
+from utils.center_utils import CENTER_METHODS
+
+REPO_DIR = Path(__file__).parent.parent
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "aiohttp", "geopy", "api_keys"]
+
+# Generous, so that slow CI machines pass, but far below the cost of pandas alone
+IMPORT_TIME_BUDGET = 0.5
+
+
+def test_center_methods_in_sync():
+    assert main.CENTER_METHODS == list(CENTER_METHODS)
+
+
+def test_startup_does_not_import_heavy_modules():
+    code = (
+        "import sys, main; "
+        "main.parse_args(['hotels.zip', 'output']); "
+        f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split() == []
+
+
+def test_help_import_time_budget():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "main.py", "--help"],
+        cwd=REPO_DIR,
+        capture_output=True,
+        check=True,
+    )
+    assert time.perf_counter() - start < IMPORT_TIME_BUDGET
+
+
+def test_metrics_are_saved_by_failed_run(mocker, tmp_path):
+    mocker.patch("sys.argv", ["main.py", "hotels.zip", str(tmp_path / "output")])
+    mocker.patch("main.run", side_effect=RuntimeError("Failed"))
+
+    with pytest.raises(RuntimeError):
+        main.main()
+
+    assert (tmp_path / "output" / "metrics.json").exists()
@@ -0,0 +1,122 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from utils.file_utils import save_city_output
+from utils.manifest_utils import (
+    changed_chunks,
+    digest,
+    hotel_row_hashes,
+    known_addresses,
+    load_manifest,
+    make_manifest,
+    manifest_weather,
+    save_manifest,
+)
+
+hotels = pd.DataFrame(
+    {
+        "Name": ["Name1", "Name2", "Name3", "Name4", "Name5"],
+        "Address": ["Address1", "Address2", "Address3", "Address4", "Address5"],
+        "Latitude": [60.17, 60.1712345678, 60.16, 60.15, 60.14],
+        "Longitude": [24.94, 24.93, 24.92, 24.91, 24.9],
+    }
+)
+
+weather = pd.DataFrame(
+    {
+        "date": [date(2021, 8, 31), date(2021, 9, 1)],
+        "max_temp": [20.0, 25.0],
+        "min_temp": [10.0, 12.0],
+    }
+)
+
+
+def test_hotel_row_hashes_ignore_index_and_address():
+    moved = hotels.set_index(pd.Index([10, 11, 12, 13, 14])).assign(Address="-")
+    assert (hotel_row_hashes(hotels) == hotel_row_hashes(moved)).all()
+    assert digest(hotel_row_hashes(hotels)) != digest(hotel_row_hashes(hotels[::-1]))
+
+
+def test_manifest_roundtrip(tmp_path):
+    manifest = make_manifest(
+        hotel_row_hashes(hotels),
+        2,
+        weather,
+        datetime(2021, 9, 1, 12, 30),
+        date(2021, 9, 1),
+    )
+    save_manifest(tmp_path, manifest)
+
+    loaded = load_manifest(tmp_path)
+    assert loaded == manifest
+    assert list(loaded["chunks"]) == [
+        "hotels_0000.csv",
+        "hotels_0001.csv",
+        "hotels_0002.csv",
+    ]
+    pd.testing.assert_frame_equal(manifest_weather(loaded, date(2021, 9, 1)), weather)
+    assert manifest_weather(loaded, date(2021, 9, 2)) is None
+
+
+def test_load_manifest_missing_or_broken(tmp_path):
+    assert load_manifest(tmp_path) == {}
+    (tmp_path / "manifest.json").write_text("{broken")
+    assert load_manifest(tmp_path) == {}
+
+
+def test_changed_chunks(tmp_path):
+    save_city_output(hotels, (60.15, 24.92), tmp_path, chunk_size=2)
+    row_hashes = hotel_row_hashes(hotels)
+    manifest = make_manifest(
+        row_hashes, 2, weather, datetime(2021, 9, 1), date(2021, 9, 1)
+    )
+
+    assert changed_chunks(manifest, row_hashes, 2, tmp_path) == []
+    assert changed_chunks({}, row_hashes, 2, tmp_path) == [0, 1, 2]
+    assert changed_chunks(manifest, row_hashes, 3, tmp_path) == [0, 1]
+
+    changed = hotels.assign(Name=["Name1", "Name2", "Name3", "Other", "Name5"])
+    assert changed_chunks(manifest, hotel_row_hashes(changed), 2, tmp_path) == [1]
+
+    (tmp_path / "hotels_0002.csv").unlink()
+    assert changed_chunks(manifest, row_hashes, 2, tmp_path) == [2]
+
+
+def test_known_addresses(tmp_path):
+    save_city_output(hotels, (60.15, 24.92), tmp_path, chunk_size=2)
+    row_hashes = hotel_row_hashes(hotels)
+    manifest = make_manifest(
+        row_hashes, 2, weather, datetime(2021, 9, 1), date(2021, 9, 1)
+    )
+
+    addresses = known_addresses(manifest, tmp_path)
+    # Coordinates survive the round trip through CSV files exactly
+    assert [addresses[row_hash] for row_hash in row_hashes.tolist()] == list(
+        hotels["Address"]
+    )
+    assert known_addresses({}, tmp_path) == {}
+
+    # Only files of changed chunks are read
+    addresses = known_addresses(manifest, tmp_path, unchanged_chunks=[0, 2])
+    assert addresses == dict(zip(row_hashes[2:4].tolist(), ["Address3", "Address4"]))
+
+
+def test_provisional_rows(tmp_path):
+    save_city_output(hotels, (60.15, 24.92), tmp_path, chunk_size=2)
+    row_hashes = hotel_row_hashes(hotels)
+    manifest = make_manifest(
+        row_hashes,
+        2,
+        weather,
+        datetime(2021, 9, 1),
+        date(2021, 9, 1),
+        provisional_rows=[3],
+    )
+    save_manifest(tmp_path, manifest)
+    manifest = load_manifest(tmp_path)
+
+    # The chunk of a provisional hotel is rewritten and the hotel geocoded again
+    assert changed_chunks(manifest, row_hashes, 2, tmp_path) == [1]
+    addresses = known_addresses(manifest, tmp_path)
+    assert set(addresses) == set(row_hashes.tolist()) - {row_hashes[3]}
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.metrics_utils import Histogram, RunMetrics, run_profiled
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == {"0.1": 2, "1.0": 3, "+Inf": 4}
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+@pytest.mark.asyncio
+async def test_run_metrics(tmp_path):
+    metrics = RunMetrics()
+    with metrics.stage("refine", rows=10):
+        pass
+    with metrics.stage("refine") as stage:
+        stage["rows"] += 5
+    assert (
+        await metrics.timed("weather", asyncio.sleep(0, "result"), rows=1) == "result"
+    )
+
+    with metrics.request("onecall"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.request("onecall"):
+            raise ValueError
+    metrics.add_retries("onecall", 3)
+
+    metrics.save_json(tmp_path / "metrics.json")
+    metrics.save_prometheus(tmp_path / "metrics.prom")
+
+    with open(tmp_path / "metrics.json") as json_file:
+        saved = json.load(json_file)
+    stages = {
+        name: (stage["calls"], stage["rows"]) for name, stage in saved["stages"].items()
+    }
+    assert stages == {"refine": (2, 15), "weather": (1, 1)}
+    assert saved["stages"]["refine"]["process_peak_rss_mb_so_far"] > 0
+    onecall = saved["requests"]["onecall"]
+    assert (onecall["requests"], onecall["errors"], onecall["retries"]) == (2, 1, 3)
+    assert onecall["latency_buckets"]["+Inf"] == 2
+
+    textfile = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert 'weather_monitoring_stage_rows{stage="refine"} 15' in textfile
+    assert 'weather_monitoring_http_errors_total{endpoint="onecall"} 1' in textfile
+    assert (
+        "weather_monitoring_http_request_duration_seconds_bucket"
+        '{endpoint="onecall",le="+Inf"} 2' in textfile
+    )
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_run_profiled(tmp_path):
+    assert run_profiled(sorted, tmp_path, [3, 1, 2], reverse=True) == [3, 2, 1]
+    assert {path.name for path in tmp_path.iterdir()} == {
+        "profile.pstats",
+        "profile.txt",
+        "memory.txt",
+    }
+    assert (tmp_path / "memory.txt").read_text().startswith("Peak traced memory")
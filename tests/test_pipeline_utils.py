@@ -0,0 +1,200 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from utils.geocoder_utils import FakeGeocoderBackend
+from utils.pipeline_utils import process_cities
+
+today = date(2021, 9, 1)
+
+city_weather = pd.DataFrame(
+    {
+        "date": [date(2021, 8, 31), today, date(2021, 9, 2)],
+        "max_temp": [20.0, 25.0, 22.0],
+        "min_temp": [10.0, 12.0, 11.0],
+    }
+)
+
+hotels = pd.DataFrame(
+    {
+        "Country": ["FI", "US", "FI", "US"],
+        "City": ["Helsinki", "Boston", "Helsinki", "Boston"],
+        "Name": ["Name1", "Name2", "Name3", "Name4"],
+        "Latitude": [60.17, 42.36, 60.16, 42.35],
+        "Longitude": [24.94, -71.06, 24.93, -71.05],
+    }
+)
+
+centers = pd.DataFrame(
+    {
+        "Country": ["FI", "US"],
+        "City": ["Helsinki", "Boston"],
+        "Latitude": [60.165, 42.355],
+        "Longitude": [24.935, -71.055],
+    }
+)
+
+
+@pytest.mark.asyncio
+async def test_process_cities(mocker, tmp_path):
+    call_times = []
+
+    async def slow_weather(coords, **kwargs):
+        call_times.extend(time.perf_counter() for _ in coords)
+        await asyncio.sleep(0.2)
+        return [city_weather] * len(coords)
+
+    async def slow_addresses(coords, **kwargs):
+        call_times.append(time.perf_counter())
+        await asyncio.sleep(0.2)
+        return [f"Address {lat}" for lat, _ in coords]
+
+    get_weather = mocker.patch(
+        "utils.async_utils.get_weather_bulk", side_effect=slow_weather
+    )
+    mocker.patch("utils.pipeline_utils.get_addresses", side_effect=slow_addresses)
+
+    weather_per_city, chart_times = await process_cities(
+        hotels, centers, tmp_path, today, {}, {}, {}
+    )
+
+    # Weather and geocoding requests of all the cities run at once, weather of
+    # all the cities is fetched by a single batch
+    assert len(call_times) == 4
+    assert get_weather.call_count == 1
+    assert max(call_times) - min(call_times) < 0.1
+    assert list(weather_per_city) == [("FI", "Helsinki"), ("US", "Boston")]
+    assert len(chart_times) == 2
+    assert (tmp_path / "Boston_US" / "weather_boston_us.png").exists()
+    pd.testing.assert_frame_equal(
+        pd.read_csv(tmp_path / "Helsinki_FI" / "hotels_0000.csv", index_col=0),
+        pd.DataFrame(
+            {
+                "Name": ["Name1", "Name3"],
+                "Address": ["Address 60.17", "Address 60.16"],
+                "Latitude": [60.17, 60.16],
+                "Longitude": [24.94, 24.93],
+            }
+        ),
+    )
+    pd.testing.assert_frame_equal(
+        pd.read_csv(tmp_path / "Boston_US" / "center_coords.csv"),
+        pd.DataFrame({"Latitude": [42.355], "Longitude": [-71.055]}),
+    )
+
+
+@pytest.mark.asyncio
+async def test_process_cities_shares_geocoder_backend(mocker, tmp_path):
+    backends = []
+
+    def backend_factory(session):
+        backends.append(FakeGeocoderBackend())
+        return backends[-1]
+
+    mocker.patch(
+        "utils.async_utils.get_weather_bulk",
+        side_effect=lambda coords, **kwargs: [city_weather] * len(coords),
+    )
+    await process_cities(
+        hotels, centers, tmp_path, today, {}, {}, {"backend_factory": backend_factory}
+    )
+
+    # Both the cities are geocoded by the only backend made during the run
+    assert len(backends) == 1
+    assert backends[0].points == 4
+
+
+@pytest.mark.asyncio
+async def test_process_cities_resumes(mocker, tmp_path):
+    fetched = []
+
+    async def fake_weather(coords, **kwargs):
+        fetched.extend(coords)
+        return [city_weather] * len(coords)
+
+    mocker.patch("utils.async_utils.get_weather_bulk", side_effect=fake_weather)
+    geocoded = []
+
+    async def fake_addresses(coords, **kwargs):
+        geocoded.extend(lat for lat, _ in coords)
+        return [f"Address {lat}" for lat, _ in coords]
+
+    mocker.patch("utils.pipeline_utils.get_addresses", side_effect=fake_addresses)
+    await process_cities(hotels, centers, tmp_path, today, {}, {}, {})
+    assert len(geocoded) == 4
+    assert len(fetched) == 2
+
+    # Nothing changed: neither requests nor writes are made
+    geocoded.clear()
+    chunk_path = tmp_path / "Boston_US" / "hotels_0000.csv"
+    written_at = chunk_path.stat().st_mtime_ns
+    weather_per_city, chart_times = await process_cities(
+        hotels, centers, tmp_path, today, {}, {}, {}
+    )
+    assert geocoded == []
+    assert len(fetched) == 2
+    assert chart_times == []
+    assert chunk_path.stat().st_mtime_ns == written_at
+    pd.testing.assert_frame_equal(weather_per_city[("US", "Boston")], city_weather)
+
+    # Only a new hotel is geocoded and only its city is rewritten
+    new_hotels = pd.concat(
+        [
+            hotels,
+            pd.DataFrame(
+                {
+                    "Country": ["FI"],
+                    "City": ["Helsinki"],
+                    "Name": ["Name5"],
+                    "Latitude": [60.15],
+                    "Longitude": [24.92],
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    await process_cities(new_hotels, centers, tmp_path, today, {}, {}, {})
+    assert geocoded == [60.15]
+    assert chunk_path.stat().st_mtime_ns == written_at
+    assert list(
+        pd.read_csv(tmp_path / "Helsinki_FI" / "hotels_0000.csv")["Address"]
+    ) == ["Address 60.17", "Address 60.16", "Address 60.15"]
+
+    # Weather fetched on another day is refreshed, hotels are kept
+    geocoded.clear()
+    await process_cities(new_hotels, centers, tmp_path, date(2021, 9, 2), {}, {}, {})
+    assert geocoded == []
+    assert len(fetched) == 4
+
+    # Resuming can be switched off
+    await process_cities(
+        new_hotels, centers, tmp_path, date(2021, 9, 2), {}, {}, {}, resume=False
+    )
+    assert len(geocoded) == 5
+
+
+@pytest.mark.asyncio
+async def test_process_cities_renders_plots_in_spawned_processes(mocker, tmp_path):
+    async def fake_weather(coords, **kwargs):
+        return [city_weather] * len(coords)
+
+    async def fake_addresses(coords, **kwargs):
+        return [f"Address {lat}" for lat, _ in coords]
+
+    mocker.patch("utils.async_utils.get_weather_bulk", side_effect=fake_weather)
+    mocker.patch("utils.pipeline_utils.get_addresses", side_effect=fake_addresses)
+    process_pool = mocker.patch(
+        "utils.pipeline_utils.ProcessPoolExecutor", side_effect=ProcessPoolExecutor
+    )
+
+    _, chart_times = await process_cities(
+        hotels, centers, tmp_path, today, {}, {}, {}, workers=2
+    )
+
+    assert process_pool.call_args.kwargs["mp_context"].get_start_method() == "spawn"
+    assert len(chart_times) == 2
+    assert (tmp_path / "Helsinki_FI" / "weather_helsinki_fi.png").exists()
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from utils.rate_limit_utils import AdaptiveRateLimiter, report_bypass
+
+
+class Throttled(Exception):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_increases_rate_on_success():
+    async def call(value):
+        return value
+
+    limiter = AdaptiveRateLimiter(initial_rate=100, max_rate=1000, increase_step=100)
+    res = await asyncio.gather(*[limiter(call, idx) for idx in range(10)])
+
+    assert res == list(range(10))
+    assert limiter.rate > 100
+    assert limiter.requests == 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_backs_off_on_throttling():
+    attempts = []
+
+    async def flaky_call():
+        attempts.append(None)
+        if len(attempts) < 3:
+            raise Throttled()
+        return "ok"
+
+    limiter = AdaptiveRateLimiter(
+        initial_rate=100, min_rate=10, backoff=0.001, retry_on=(Throttled,)
+    )
+    res = await limiter(flaky_call)
+
+    assert res == "ok"
+    assert (limiter.throttled, limiter.retries) == (2, 2)
+    assert limiter.rate < 100
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_gives_up_after_retries():
+    async def throttled_call():
+        raise Throttled()
+
+    limiter = AdaptiveRateLimiter(
+        initial_rate=100, max_retries=2, backoff=0.001, retry_on=(Throttled,)
+    )
+    with pytest.raises(Throttled):
+        await limiter(throttled_call)
+
+    assert limiter.requests == 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_decreases_once_per_window():
+    async def throttled_call():
+        await asyncio.sleep(0.01)
+        raise Throttled()
+
+    limiter = AdaptiveRateLimiter(
+        initial_rate=1000, max_in_flight=5, max_retries=0, retry_on=(Throttled,)
+    )
+    await asyncio.gather(
+        *[limiter(throttled_call) for _ in range(5)], return_exceptions=True
+    )
+
+    assert limiter.rate == 500
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_follows_bypassed_calls():
+    async def bypassed_call(throttled):
+        await asyncio.sleep(0)
+        report_bypass(throttled=throttled)
+        return "fallback"
+
+    limiter = AdaptiveRateLimiter(initial_rate=100, max_rate=1000)
+    # A call answered without the service neither raises nor cuts the rate
+    assert await limiter(bypassed_call, False) == "fallback"
+    assert (limiter.rate, limiter.throttled) == (100, 0)
+
+    # A call which bypassed a throttling service cuts the rate without retries
+    assert await limiter(bypassed_call, True) == "fallback"
+    assert (limiter.rate, limiter.throttled, limiter.retries) == (50, 1, 0)
+
+    report_bypass(throttled=True)
+    await limiter(asyncio.sleep, 0)
+    assert limiter.rate > 50
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_gives_back_tokens_of_bypassed_calls():
+    async def bypassed_call():
+        report_bypass()
+
+    limiter = AdaptiveRateLimiter(initial_rate=1)
+    # Only the first call is sent with the initial token, the rest have to wait for
+    # new ones unless the token is given back
+    await asyncio.wait_for(
+        asyncio.gather(*[limiter(bypassed_call) for _ in range(5)]), timeout=0.5
+    )
+    assert limiter.requests == 5
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_caps_requests_in_flight():
+    in_flight = []
+    max_in_flight = []
+
+    async def call():
+        in_flight.append(None)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+
+    limiter = AdaptiveRateLimiter(initial_rate=1000, max_in_flight=3)
+    await asyncio.gather(*[limiter(call) for _ in range(10)])
+
+    assert max(max_in_flight) == 3
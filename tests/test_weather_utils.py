@@ -0,0 +1,87 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.weather_utils import (
+    build_weather_table,
+    compute_weather_statistics,
+    crop_weather_table,
+)
+
+observation_dates = [date(2021, 8, 30), date(2021, 8, 31), date(2021, 9, 1)]
+
+weather_dict = {
+    ("FI", "Kuopio"): pd.DataFrame(
+        {
+            "date": observation_dates,
+            "max_temp": [10.0, 30.0, 20.0],
+            "min_temp": [0.0, 5.0, 10.0],
+        }
+    ),
+    ("RU", "Kostamus"): pd.DataFrame(
+        {
+            "date": observation_dates,
+            "max_temp": [10.0, np.nan, 12.0],
+            "min_temp": [-20.0, 0.0, 0.0],
+        },
+        index=[-1, 0, 1],
+    ),
+}
+
+
+def test_build_weather_table():
+    actual_res = build_weather_table(weather_dict)
+
+    assert list(actual_res.columns) == [
+        "city_id",
+        "Country",
+        "City",
+        "date",
+        "max_temp",
+        "min_temp",
+    ]
+    assert list(actual_res["city_id"]) == [0, 0, 0, 1, 1, 1]
+    assert list(actual_res["City"]) == ["Kuopio"] * 3 + ["Kostamus"] * 3
+    assert list(actual_res.index) == [0, 1, 2, -1, 0, 1]
+    assert actual_res["date"].dtype == "datetime64[ns]"
+
+
+def test_crop_weather_table():
+    weather_table = build_weather_table(weather_dict)
+
+    actual_res = crop_weather_table(weather_table, date(2021, 9, 2), days=2)
+
+    assert list(actual_res["date"].dt.date) == observation_dates[1:] * 2
+
+
+def test_compute_weather_statistics():
+    actual_res = compute_weather_statistics(build_weather_table(weather_dict))
+
+    expected_max_temp = pd.DataFrame(
+        {
+            "date": pd.to_datetime([observation_dates[1]]),
+            "Country": ["FI"],
+            "City": ["Kuopio"],
+            "temp": [30.0],
+        },
+        index=[1],
+    )
+    expected_min_temp = pd.DataFrame(
+        {
+            "date": pd.to_datetime([observation_dates[0]]),
+            "Country": ["RU"],
+            "City": ["Kostamus"],
+            "temp": [-20.0],
+        },
+        index=[-1],
+    )
+    expected_max_temp_delta = pd.DataFrame(
+        {"Country": ["RU"], "City": ["Kostamus"], "temp_delta": [11.0]}
+    )
+
+    pd.testing.assert_frame_equal(expected_max_temp, actual_res.max_temp)
+    pd.testing.assert_frame_equal(expected_min_temp, actual_res.min_temp)
+    assert list(actual_res.max_temp_diff["City"]) == ["Kostamus"]
+    assert list(actual_res.max_temp_diff["temp_diff"]) == [30.0]
+    pd.testing.assert_frame_equal(expected_max_temp_delta, actual_res.max_temp_delta)
@@ -3,14 +3,66 @@
 import asyncio
 import json
 from datetime import date, datetime, timedelta
-from typing import Generator, Iterable, List, Union
+from functools import partial
+from pathlib import PurePosixPath
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import aiohttp
 import geopy as gp
+import numpy as np
 import pandas as pd
-from geopy.extra.rate_limiter import AsyncRateLimiter
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
 
-from api_keys import HERE_API_KEY, WHEATHERMAP_API_KEY
+from utils.cache_utils import DEFAULT_TTL, GeocodingCache, SqliteCache, WeatherCache
+from utils.geo_utils import snap_coordinates
+from utils.geocoder_utils import FallbackAddress, GeocoderBackend
+from utils.http_utils import SharedSessionAdapter
+from utils.json_utils import loads
+from utils.metrics_utils import METRICS
+from utils.rate_limit_utils import AdaptiveRateLimiter
+
+OPENWEATHERMAP_URL = "https://api.openweathermap.org/data/2.5"
+
+
+# Sent to stand-in servers like benchmarks/fake_api_server.py when there is no
+# api_keys module, they do not check keys
+STAND_IN_API_KEY = "stand-in"
+
+
+def get_api_key(name: str, fallback: Optional[str] = None) -> str:
+    """
+    Takes an API key from the api_keys module. The module is imported on the first
+    call, so that only runs sending requests require it.
+    Args:
+        name: name of the key, "HERE_API_KEY" or "WHEATHERMAP_API_KEY"
+        fallback: a key returned if there is no api_keys module, None makes the
+            module required
+
+    Returns:
+    The key
+    """
+    try:
+        import api_keys
+    except ImportError:
+        if fallback is None:
+            raise
+        return fallback
+    return getattr(api_keys, name)
 
 
 async def get_adress_by_coordinates(
@@ -30,34 +82,448 @@ async def get_adress_by_coordinates(
     return location.address
 
 
-async def get_addresses(coords: Iterable, req_per_sec=1) -> List[Union[str, None]]:
+class HereBackend(GeocoderBackend):
+    """
+    HERE geocoding API answering single reverse geocoding requests. See
+    geocoder_utils.GeocoderBackend.
+
+    Args:
+        session: an HTTP session shared with other API clients. If None, a new one
+            is opened.
+        base_url: scheme and host the requests are sent to instead of the HERE
+            API, e.g. "http://127.0.0.1:8080" of benchmarks/fake_api_server.py.
+            The api_keys module is optional then.
+    """
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+        base_url: Optional[str] = None,
+    ):
+        super().__init__(session)
+        self.base_url = base_url
+        self._geolocator = None
+
+    async def __aenter__(self):
+        adapter_factory = gp.adapters.AioHTTPAdapter
+        if self.session is not None:
+            adapter_factory = partial(SharedSessionAdapter, session=self.session)
+        self._geolocator = gp.geocoders.Here(
+            apikey=get_api_key(
+                "HERE_API_KEY",
+                fallback=None if self.base_url is None else STAND_IN_API_KEY,
+            ),
+            user_agent="wheather_monitoring",
+            adapter_factory=adapter_factory,
+            timeout=10,
+        )
+        if self.base_url is not None:
+            self._geolocator.reverse_api = (
+                self.base_url.rstrip("/") + self._geolocator.reverse_path
+            )
+        await self._geolocator.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._geolocator.__aexit__(exc_type, exc_val, exc_tb)
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        with METRICS.request("here_reverse"):
+            return await get_adress_by_coordinates(lat, lon, self._geolocator.reverse)
+
+
+async def get_addresses(
+    coords: Iterable,
+    req_per_sec=1,
+    cache: Optional[GeocodingCache] = None,
+    snap_tolerance=0.0,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    window=100,
+    backend_factory: Callable[..., GeocoderBackend] = HereBackend,
+) -> List[Union[str, None]]:
     """
-    Retrieves a bunch of addresses using HERE geocoding API
+    Retrieves a bunch of addresses using a geocoding service, HERE geocoding API by
+    default
     Args:
         coords: A collection of pairs latitude-longitude
-        req_per_sec (int): requests per second, used to control geocoding API calls
-            flow. If you keep getting time-out errors consider reducing this parameter.
+        req_per_sec (int): initial requests per second, used to control geocoding
+            API calls flow. The rate adapts to throttling and latency afterwards.
+        cache: a persistent cache of addresses. Cached coordinates are not sent to
+            the API and do not count against the rate limit. Addresses answered
+            by a fallback backend (see geocoder_utils.FallbackAddress) are not
+            cached.
+        snap_tolerance: coordinates closer than this amount of degrees are geocoded
+            once and share the address, see geo_utils.snap_coordinates()
+        rate_limiter: a limiter controlling geocoding API calls flow, overrides
+            req_per_sec. Pass it to inspect the rate it settled on afterwards.
+        session: an HTTP session shared with other API clients, see
+            http_utils.make_client_session(). If None, a new one is opened.
+        window: maximal amount of requests being sent at once, see
+            iter_addresses()
+        backend_factory: creates a geocoding service out of a "session" keyword
+            argument, see geocoder_utils.GeocoderBackend. Services supporting
+            batch requests are sent points in batches.
 
     Returns:
         List of addresses
     """
-    async with gp.geocoders.Here(
-        apikey=HERE_API_KEY,
-        user_agent="wheather_monitoring",
-        adapter_factory=gp.adapters.AioHTTPAdapter,
-        timeout=10,
-    ) as geolocator:
-        reverse = AsyncRateLimiter(
-            geolocator.reverse, min_delay_seconds=1 / req_per_sec
-        )
-        return await asyncio.gather(
-            *[get_adress_by_coordinates(lat, lon, reverse) for lat, lon in coords]
+    all_coords = list(coords)
+    if not all_coords:
+        return []
+    unique_coords, inverse = snap_coordinates(all_coords, tolerance=snap_tolerance)
+    if rate_limiter is None:
+        rate_limiter = make_geocoding_rate_limiter(req_per_sec)
+    unique_addresses = await _get_unique_addresses(
+        unique_coords.tolist(),
+        rate_limiter,
+        cache,
+        backend_factory(session=session),
+        window,
+    )
+    return np.asarray(unique_addresses, dtype=object)[inverse].tolist()
+
+
+async def _get_unique_addresses(
+    coords: List,
+    rate_limiter: AdaptiveRateLimiter,
+    cache: Optional[GeocodingCache],
+    backend: GeocoderBackend,
+    window: int,
+) -> List[Union[str, None]]:
+    """
+    Retrieves addresses for already deduplicated coordinates, consulting the cache
+    first. See get_addresses().
+    """
+    addresses = [None] * len(coords)
+    pending = list(range(len(coords)))
+
+    if cache is not None:
+        keys = [cache.coords_key(lat, lon) for lat, lon in coords]
+        cached = cache.get_many(keys)
+        pending = [idx for idx, key in enumerate(keys) if key not in cached]
+        for idx, key in enumerate(keys):
+            addresses[idx] = cached.get(key)
+
+    if not pending:
+        return addresses
+
+    async with backend:
+        items = _as_async_iterator((idx, *coords[idx], None) for idx in pending)
+        # Workers beyond the amount of requests to send would only idle, and every
+        # city of process_cities() runs its own stream
+        window = min(window, -(-len(pending) // (backend.batch_size or 1)))
+        async for idx, address, _ in _geocode_stream(
+            items, backend, rate_limiter, window
+        ):
+            addresses[idx] = address
+
+    if cache is not None:
+        cache.set_many(
+            {
+                keys[idx]: addresses[idx]
+                for idx in pending
+                if _is_cacheable(addresses[idx])
+            }
         )
+    return addresses
+
+
+def _is_cacheable(address: Optional[str]) -> bool:
+    """Tells whether an address is kept in the cache, fallback answers are not"""
+    return address is not None and not isinstance(address, FallbackAddress)
+
+
+async def iter_addresses(
+    coords: Union[Iterable, AsyncIterable],
+    req_per_sec=1,
+    cache: Optional[GeocodingCache] = None,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    window=100,
+    backend_factory: Callable[..., GeocoderBackend] = HereBackend,
+) -> AsyncGenerator[Tuple[int, Union[str, None]], None]:
+    """
+    Retrieves addresses using a geocoding service as a stream. Unlike
+    get_addresses(), coordinates are consumed lazily and no more than window
+    requests are processed at once, so memory does not grow with the input.
+    Addresses are yielded as soon as they arrive, which is not necessarily the
+    input order.
+    Args:
+        coords: An iterable or an async iterable of pairs latitude-longitude
+        req_per_sec (int): initial requests per second, see get_addresses()
+        cache: a persistent cache of addresses, looked up in batches
+        rate_limiter: a limiter controlling geocoding API calls flow, overrides
+            req_per_sec
+        session: an HTTP session shared with other API clients. If None, a new one
+            is opened.
+        window: maximal amount of requests being sent at once. A request holds one
+            point, or up to batch_size of them for batch services.
+        backend_factory: creates a geocoding service, see get_addresses()
+
+    Returns:
+        Async generator of (index of coordinates in coords, address) pairs
+    """
+    if rate_limiter is None:
+        rate_limiter = make_geocoding_rate_limiter(req_per_sec)
+    backend = backend_factory(session=session)
+    cache_batch_size = window * (backend.batch_size or 1)
+
+    fetched = {}
+    try:
+        async with backend:
+            items = _lookup_cache(_as_async_iterator(coords), cache, cache_batch_size)
+            async for (idx, key), address, is_fetched in _geocode_stream(
+                items, backend, rate_limiter, window
+            ):
+                if is_fetched and cache is not None and _is_cacheable(address):
+                    fetched[key] = address
+                    if len(fetched) >= cache_batch_size:
+                        cache.set_many(fetched)
+                        fetched = {}
+                yield idx, address
+    finally:
+        if fetched:
+            cache.set_many(fetched)
+
+
+async def _lookup_cache(
+    coords: AsyncIterator, cache: Optional[GeocodingCache], batch_size: int
+) -> AsyncGenerator[Tuple[Tuple[int, Optional[str]], float, float, Any], None]:
+    """
+    Turns coordinates into items for _geocode_stream() tagged with their index and
+    cache key, looking up the cache in batches
+    """
+    batch = []
+    async for idx, (lat, lon) in _enumerate_async(coords):
+        batch.append((idx, lat, lon))
+        if len(batch) >= batch_size:
+            for item in _lookup_cache_batch(batch, cache):
+                yield item
+            batch = []
+    for item in _lookup_cache_batch(batch, cache):
+        yield item
+
+
+def _lookup_cache_batch(
+    batch: List[Tuple[int, float, float]], cache: Optional[GeocodingCache]
+) -> Generator:
+    """Looks up a batch of coordinates in the cache, see _lookup_cache()"""
+    if cache is None:
+        return (((idx, None), lat, lon, None) for idx, lat, lon in batch)
+    keys = [cache.coords_key(lat, lon) for _, lat, lon in batch]
+    cached = cache.get_many(keys)
+    return (
+        ((idx, key), lat, lon, cached.get(key))
+        for (idx, lat, lon), key in zip(batch, keys)
+    )
+
+
+async def _geocode_stream(
+    items: AsyncIterator[Tuple[Any, float, float, Optional[str]]],
+    backend: GeocoderBackend,
+    rate_limiter: AdaptiveRateLimiter,
+    window: int,
+) -> AsyncGenerator[Tuple[Any, Union[str, None], bool], None]:
+    """
+    Geocodes a stream of coordinates with a bounded pool of workers fed through a
+    queue, so that only window tasks exist however long the stream is. Every
+    worker sends one request at a time: a single point, or a batch of points if
+    the backend supports batch requests.
+    Args:
+        items: (tag, latitude, longitude, known_address) tuples. Items with a known
+            address are passed through without a request.
+        backend: an entered geocoding service
+        rate_limiter: a limiter every request goes through
+        window: amount of workers, which is also the capacity of both queues
+
+    Returns:
+        Async generator of (tag, address, whether address was fetched) in the order
+        of completion
+    """
+    batch_size = backend.batch_size or 1
+    todo = asyncio.Queue(maxsize=window)
+    done = asyncio.Queue(maxsize=window)
+
+    async def produce():
+        try:
+            batch = []
+            async for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    await todo.put(batch)
+                    batch = []
+            if batch:
+                await todo.put(batch)
+        except Exception as err:
+            await done.put(err)
+        for _ in range(window):
+            await todo.put(None)
+
+    async def work():
+        while True:
+            batch = await todo.get()
+            if batch is None:
+                await done.put(None)
+                return
+            unknown = [item for item in batch if item[3] is None]
+            try:
+                if not unknown:
+                    addresses = []
+                elif backend.batch_size:
+                    addresses = await _limit(backend, rate_limiter)(
+                        backend.reverse_batch,
+                        [(lat, lon) for _, lat, lon, _ in unknown],
+                    )
+                else:
+                    addresses = [
+                        await _limit(backend, rate_limiter)(backend.reverse, lat, lon)
+                        for _, lat, lon, _ in unknown
+                    ]
+            except Exception as err:
+                await done.put(err)
+                return
+            await done.put(
+                [
+                    (tag, address, False)
+                    for tag, _, _, address in batch
+                    if address is not None
+                ]
+                + [
+                    (item[0], address, True)
+                    for item, address in zip(unknown, addresses)
+                ]
+            )
+
+    tasks = [asyncio.ensure_future(produce())]
+    tasks.extend(asyncio.ensure_future(work()) for _ in range(window))
+    try:
+        finished = 0
+        while finished < window:
+            results = await done.get()
+            if results is None:
+                finished += 1
+            elif isinstance(results, Exception):
+                raise results
+            else:
+                for result in results:
+                    yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _limit(
+    backend: GeocoderBackend, rate_limiter: AdaptiveRateLimiter
+) -> Callable[..., Awaitable]:
+    """
+    Picks the way the next request of a backend is sent: through the rate limiter,
+    or directly if the backend answers it without a rate limited service
+    """
+    return rate_limiter if backend.rate_limited else _call
+
+
+async def _call(func: Callable[..., Awaitable], *args) -> Any:
+    return await func(*args)
+
+
+async def _as_async_iterator(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    """Iterates over either a regular or an async iterable"""
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _enumerate_async(items: AsyncIterator) -> AsyncIterator[Tuple[int, Any]]:
+    """An async counterpart of enumerate()"""
+    idx = 0
+    async for item in items:
+        yield idx, item
+        idx += 1
+
+
+def make_geocoding_rate_limiter(req_per_sec=1, max_in_flight=10, max_rate=50.0):
+    """
+    Creates a rate limiter reacting to geocoding API throttling and time-outs.
+    Args:
+        req_per_sec: initial requests per second
+        max_in_flight: maximal amount of geocoding requests running at once
+        max_rate: maximal requests per second
+
+    Returns:
+    AdaptiveRateLimiter instance
+    """
+    return AdaptiveRateLimiter(
+        initial_rate=req_per_sec,
+        max_rate=max_rate,
+        max_in_flight=max_in_flight,
+        retry_on=(GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable),
+    )
+
+
+class RequestCoalescer:
+    """
+    Merges identical requests running at the same time (the "single-flight"
+    pattern). The first caller of a key starts the request, the ones asking for the
+    same key while it is in flight await its result instead of sending their own
+    requests. A request is not cancelled when one of its callers is, since the
+    others may still wait for it. Keys are forgotten as soon as their requests
+    finish, so this is not a cache.
+
+    Being independent from the event loop, a coalescer can be created outside of
+    asyncio.run() and inspected after it.
+    """
+
+    def __init__(self):
+        self.issued = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def __call__(
+        self, key: str, func: Callable[..., Awaitable], *args, **kwargs
+    ) -> Any:
+        """
+        Calls a coroutine function unless a call with the same key is in flight.
+        Args:
+            key: identifies the request, e.g. its URL
+            func: a coroutine function sending the request, e.g. make_request
+            *args: positional arguments for func
+            **kwargs: keyword arguments for func
+
+        Returns:
+        The result of func, shared by all the callers of the key
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            self.issued += 1
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(partial(self._forget, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        del self._in_flight[key]
+        # Retrieves the exception of a request all the callers gave up on, so that
+        # asyncio doesn't complain about it
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> str:
+        """Returns a human-readable line with the counters"""
+        return f"{self.issued} requests issued, {self.coalesced} coalesced"
 
 
 async def make_request(req: str, session: aiohttp.ClientSession) -> json:
     """
-    A simple routine for sending single HTTP request.
+    A simple routine for sending single HTTP request. Error statuses raise
+    aiohttp.ClientResponseError, so that error bodies are never taken for data or
+    cached.
     Args:
         req: HTTP address
         session: session object
@@ -65,12 +531,67 @@ async def make_request(req: str, session: aiohttp.ClientSession) -> json:
     Returns:
     HTTP request result as JSON object
     """
-    async with session.get(req) as response:
-        return await response.json()
+    # The last part of the path names the endpoint, e.g. "onecall"
+    endpoint = PurePosixPath(req.split("?", 1)[0]).stem
+    with METRICS.request(endpoint):
+        async with session.get(req) as response:
+            response.raise_for_status()
+            return loads(await response.read())
+
+
+async def make_cached_requests(
+    reqs: List[str],
+    keys: List[str],
+    session: aiohttp.ClientSession,
+    cache: Optional[SqliteCache] = None,
+    ttl=DEFAULT_TTL,
+    coalescer: Optional[RequestCoalescer] = None,
+) -> List[json]:
+    """
+    Sends several HTTP requests at once skipping the ones whose responses are
+    cached.
+    Args:
+        reqs: HTTP addresses
+        keys: cache keys of the requests, one per address
+        session: session object
+        cache: a cache of responses, if None all the requests are sent
+        ttl: time-to-live of the new responses, see SqliteCache.set_many()
+        coalescer: merges requests with equal keys running at the same time, also
+            the ones sent by other callers sharing it. If None, every request is
+            sent.
+
+    Returns:
+    Request results as JSON objects in the order of reqs
+    """
+    cached = cache.get_many(keys) if cache is not None else {}
+    pending = [idx for idx, key in enumerate(keys) if key not in cached]
+    if coalescer is None:
+        requests = [make_request(reqs[idx], session) for idx in pending]
+    else:
+        requests = [
+            coalescer(keys[idx], make_request, reqs[idx], session) for idx in pending
+        ]
+    fetched = await asyncio.gather(*requests)
+
+    if cache is not None and pending:
+        cache.set_many(
+            {keys[idx]: response for idx, response in zip(pending, fetched)}, ttl=ttl
+        )
+
+    responses = dict(zip(pending, fetched))
+    return [
+        cached[key] if key in cached else responses[idx] for idx, key in enumerate(keys)
+    ]
 
 
 async def get_weather(
-    lat: float, lon: float, session: aiohttp.ClientSession, history_depth=4
+    lat: float,
+    lon: float,
+    session: aiohttp.ClientSession,
+    history_depth=4,
+    cache: Optional[WeatherCache] = None,
+    coalescer: Optional[RequestCoalescer] = None,
+    base_url=OPENWEATHERMAP_URL,
 ) -> pd.DataFrame:
     """
     Acquires history and forecasted weather from openweathermap.org for a place
@@ -88,58 +609,201 @@ async def get_weather(
         lon: longitude of a place
         history_depth: the depth of history data to be fetched.
         session: an HTTP session object
+        cache: a cache of API responses. History is cached forever, current and
+            forecasted weather expires after the cache TTL.
+        coalescer: merges identical requests of places fetched at the same time,
+            see RequestCoalescer
+        base_url: the API root the requests are sent to, e.g. the one of
+            benchmarks/fake_api_server.py. The api_keys module is only required
+            by the public API.
 
     Returns:
     DataFrame of three columns: "date", "max_temp", "min_temp". Index column
     contains day number relatively to today, so 0 means today, negative
     numbers refer to the past and positive ones to the future.
     """
-    req_prefix = "https://api.openweathermap.org/data/2.5/onecall"
-    exclude_part = "minutely,hourly,alerts,current"
     date_today = datetime.utcnow().date()
+    responses = await _fetch_weather_responses(
+        lat, lon, session, date_today, history_depth, cache, coalescer, base_url
+    )
+    return parse_weather_batch([responses], date_today)[0]
+
+
+async def _fetch_weather_responses(
+    lat: float,
+    lon: float,
+    session: aiohttp.ClientSession,
+    date_today: date,
+    history_depth: int,
+    cache: Optional[WeatherCache],
+    coalescer: Optional[RequestCoalescer],
+    base_url: str,
+) -> Tuple[json, List[json]]:
+    """
+    Fetches the forecast and the history responses of a place, see get_weather()
+    """
+    req_prefix = f"{base_url.rstrip('/')}/onecall"
+    exclude_part = "minutely,hourly,alerts,current"
+    api_key = get_api_key(
+        "WHEATHERMAP_API_KEY",
+        fallback=None if base_url == OPENWEATHERMAP_URL else STAND_IN_API_KEY,
+    )
     curr_and_fore_req = (
         f"{req_prefix}?lat={lat}&lon={lon}&exclude={exclude_part}"
-        f"&appid={WHEATHERMAP_API_KEY}&units=metric"
+        f"&appid={api_key}&units=metric"
     )
 
-    history_timestamps = (
-        int(h_date.timestamp())
-        for h_date in date_range(date_today - timedelta(days=history_depth), date_today)
+    history_dates = list(
+        date_range(date_today - timedelta(days=history_depth), date_today)
     )
     history_reqs = [
-        f"{req_prefix}/timemachine?lat={lat}&lon={lon}&dt={his_timestamp}&"
-        f"appid={WHEATHERMAP_API_KEY}&units=metric"
-        for his_timestamp in history_timestamps
+        f"{req_prefix}/timemachine?lat={lat}&lon={lon}&dt={int(h_date.timestamp())}&"
+        f"appid={api_key}&units=metric"
+        for h_date in history_dates
     ]
 
-    curr_json = await make_request(curr_and_fore_req, session)
-    history_jsons = await asyncio.gather(
-        *[make_request(his_req, session) for his_req in history_reqs]
+    if cache is not None:
+        curr_and_fore_key = cache.request_key("onecall", lat, lon, date_today)
+        history_keys = [
+            cache.request_key("timemachine", lat, lon, h_date.date())
+            for h_date in history_dates
+        ]
+    else:
+        curr_and_fore_key, history_keys = curr_and_fore_req, history_reqs
+
+    (curr_json,) = await make_cached_requests(
+        [curr_and_fore_req], [curr_and_fore_key], session, cache, coalescer=coalescer
     )
-
-    curr_and_forecasted_weather = parse_forecasted_data(curr_json)
-    history_weather = pd.DataFrame(map(parse_historic_data, history_jsons))
-    return pd.concat([history_weather, curr_and_forecasted_weather])
+    history_jsons = await make_cached_requests(
+        history_reqs, history_keys, session, cache, ttl=None, coalescer=coalescer
+    )
+    return curr_json, history_jsons
 
 
-async def get_weather_bulk(coords: Iterable, history_depth=4) -> List[pd.DataFrame]:
+async def get_weather_bulk(
+    coords: Iterable,
+    history_depth=4,
+    cache: Optional[WeatherCache] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    coalescer: Optional[RequestCoalescer] = None,
+    base_url=OPENWEATHERMAP_URL,
+) -> List[pd.DataFrame]:
     """
-    An adapter function for asynchronously calling "get_weather" for several locations
-        at once.
+    Acquires weather of several locations at once. Requests of all the places are
+    sent concurrently and their responses are parsed together, see
+    parse_weather_batch().
     Args:
         coords: an Iterable object, containing pairs of longitude and latitude of
             places.
+        history_depth: the depth of history data to be fetched.
+        cache: a cache of API responses, see get_weather()
+        session: an HTTP session shared with other API clients, see
+            http_utils.make_client_session(). If None, a new one is opened.
+        coalescer: merges identical requests of places, see RequestCoalescer. If
+            None, a new one is used for this call.
+        base_url: the API root the requests are sent to, see get_weather()
 
     Returns:
-    List of DataFrames containing weather info for each place
+    List of DataFrames containing weather info for each place, see get_weather()
     """
-    async with aiohttp.ClientSession() as session:
-        return await asyncio.gather(
-            *[
-                get_weather(lat, lon, session, history_depth=history_depth)
-                for lat, lon in coords
-            ]
+    if session is None:
+        async with aiohttp.ClientSession() as own_session:
+            return await get_weather_bulk(
+                coords,
+                history_depth=history_depth,
+                cache=cache,
+                session=own_session,
+                coalescer=coalescer,
+                base_url=base_url,
+            )
+
+    if coalescer is None:
+        coalescer = RequestCoalescer()
+    date_today = datetime.utcnow().date()
+    responses = await asyncio.gather(
+        *[
+            _fetch_weather_responses(
+                lat,
+                lon,
+                session,
+                date_today,
+                history_depth,
+                cache,
+                coalescer,
+                base_url,
+            )
+            for lat, lon in coords
+        ]
+    )
+    if not responses:
+        return []
+    return parse_weather_batch(responses, date_today)
+
+
+class WeatherBatcher:
+    """
+    Fetches weather of places asked for independently in batches. Places asked
+    for within one iteration of the event loop, e.g. by the cities of
+    pipeline_utils.process_cities() starting at once, are fetched by a single
+    get_weather_bulk() call, so that their responses are parsed together. A
+    failure of the batch is raised to all of its callers.
+
+    Args:
+        session: an HTTP session all the requests are sent through
+        **weather_kwargs: keyword arguments for get_weather_bulk()
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, **weather_kwargs):
+        self.session = session
+        self.weather_kwargs = weather_kwargs
+        self.batches = 0
+        self._pending: List[Tuple[Tuple[float, float], asyncio.Future]] = []
+        self._in_flight: Set[asyncio.Future] = set()
+
+    async def __call__(self, lat: float, lon: float) -> pd.DataFrame:
+        """
+        Fetches weather of a place along with the other places of the batch
+        Args:
+            lat: latitude of a place
+            lon: longitude of a place
+
+        Returns:
+        DataFrame with weather of the place, see get_weather()
+        """
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        future = loop.create_future()
+        self._pending.append(((lat, lon), future))
+        return await future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        self.batches += 1
+        batch = asyncio.ensure_future(
+            get_weather_bulk(
+                [coords for coords, _ in pending],
+                session=self.session,
+                **self.weather_kwargs,
+            )
         )
+        self._in_flight.add(batch)
+        batch.add_done_callback(
+            partial(self._resolve, [future for _, future in pending])
+        )
+
+    def _resolve(self, futures: List[asyncio.Future], batch: asyncio.Future):
+        self._in_flight.discard(batch)
+        error = None if batch.cancelled() else batch.exception()
+        for idx, future in enumerate(futures):
+            if future.done():
+                continue
+            if batch.cancelled():
+                future.cancel()
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(batch.result()[idx])
 
 
 def parse_forecasted_data(data: json) -> pd.DataFrame:
@@ -151,13 +815,8 @@ def parse_forecasted_data(data: json) -> pd.DataFrame:
     Returns:
     DataFrame with date, max and min temperatures for all dates found in JSON
     """
-    temps = []
-    for day_data in data["daily"]:
-        curr_date = datetime.fromtimestamp(day_data["dt"]).date()
-        min_temp = day_data["temp"]["min"]
-        max_temp = day_data["temp"]["max"]
-        temps.append({"date": curr_date, "min_temp": min_temp, "max_temp": max_temp})
-    return pd.DataFrame(temps)
+    forecast = parse_forecasted_batch([data]).drop(columns="response_id")
+    return forecast.assign(date=_to_date_objects(forecast["date"]))
 
 
 def parse_historic_data(data: json) -> pd.Series:
@@ -171,16 +830,160 @@ def parse_historic_data(data: json) -> pd.Series:
     Returns:
     A Series object containing date, max and min temperature.
     """
-    temps = []
-    curr_date = datetime.fromtimestamp(data["current"]["dt"]).date()
-    for hour_data in data["hourly"]:
-        temps.append(hour_data["temp"])
+    history = parse_historic_batch([data])
+    curr_date = _to_date_objects(history["date"])[0]
     return pd.Series(
-        {"date": curr_date, "max_temp": max(temps), "min_temp": min(temps)},
+        {
+            "date": curr_date,
+            "max_temp": history["max_temp"].iloc[0],
+            "min_temp": history["min_temp"].iloc[0],
+        },
         name=(curr_date - datetime.utcnow().date()).days,
     )
 
 
+def parse_forecasted_batch(responses: List[json]) -> pd.DataFrame:
+    """
+    Parses many JSONs of weather forecast from openweathermap.org into a single
+    table at once
+    Args:
+        responses: JSONs gotten as request results, e.g. forecasts of many cities
+
+    Returns:
+    DataFrame with "response_id", "date", "max_temp" and "min_temp" columns, one
+        row per forecasted day, where "response_id" is the position of a response
+        in responses and "date" is the UTC date as datetime64
+    """
+    days = [day_data for data in responses for day_data in data["daily"]]
+    return pd.DataFrame(
+        {
+            "response_id": np.repeat(
+                np.arange(len(responses)), [len(data["daily"]) for data in responses]
+            ),
+            "date": epochs_to_dates([day_data["dt"] for day_data in days]),
+            "max_temp": np.array(
+                [day_data["temp"]["max"] for day_data in days], dtype=np.float64
+            ),
+            "min_temp": np.array(
+                [day_data["temp"]["min"] for day_data in days], dtype=np.float64
+            ),
+        }
+    )
+
+
+def parse_historic_batch(responses: List[json]) -> pd.DataFrame:
+    """
+    Parses many JSONs of weather history from openweathermap.org into a single
+    table at once, aggregating hourly temperatures of every response
+    Args:
+        responses: JSONs gotten as request results, one per day and place
+
+    Returns:
+    DataFrame with "date", "max_temp" and "min_temp" columns, one row per response
+        in the order of responses, where "date" is the UTC date as datetime64.
+        Temperatures of a response without hourly data are NaN.
+    """
+    counts = np.array([len(data["hourly"]) for data in responses], dtype=np.int64)
+    temps = np.array(
+        [hour_data["temp"] for data in responses for hour_data in data["hourly"]],
+        dtype=np.float64,
+    )
+    max_temps = np.full(len(responses), np.nan)
+    min_temps = np.full(len(responses), np.nan)
+    # reduceat() can't handle empty groups, so only non-empty ones are reduced
+    non_empty = counts > 0
+    if non_empty.any():
+        starts = (np.cumsum(counts) - counts)[non_empty]
+        max_temps[non_empty] = np.maximum.reduceat(temps, starts)
+        min_temps[non_empty] = np.minimum.reduceat(temps, starts)
+
+    return pd.DataFrame(
+        {
+            "date": epochs_to_dates([data["current"]["dt"] for data in responses]),
+            "max_temp": max_temps,
+            "min_temp": min_temps,
+        }
+    )
+
+
+def parse_weather_batch(
+    responses: List[Tuple[json, List[json]]], today: date
+) -> List[pd.DataFrame]:
+    """
+    Parses weather responses of many places at once: all the forecasts are parsed
+    by a single parse_forecasted_batch() call, all the history by a single
+    parse_historic_batch() one, and the tables are split by place afterwards
+    Args:
+        responses: pairs of a forecast JSON and a list of history JSONs, one pair
+            per place
+        today: the date day numbers of the index are counted from
+
+    Returns:
+    List of DataFrames, one per place in the order of responses, see get_weather()
+    """
+    history_counts = [len(history) for _, history in responses]
+    history = parse_historic_batch(
+        [data for _, place_history in responses for data in place_history]
+    )
+    history.insert(
+        0, "response_id", np.repeat(np.arange(len(responses)), history_counts)
+    )
+    forecast = parse_forecasted_batch([data for data, _ in responses])
+    forecast_ids = forecast["response_id"].to_numpy()
+    # Forecasted days are numbered from today by their position in a response
+    forecast_starts = np.searchsorted(forecast_ids, np.arange(len(responses)))
+
+    weather = pd.concat([history, forecast], ignore_index=True)
+    days = np.concatenate(
+        [
+            _days_from(history["date"], today),
+            np.arange(len(forecast)) - forecast_starts[forecast_ids],
+        ]
+    )
+    # A stable sort keeps history before forecast within every place
+    response_ids = weather["response_id"].to_numpy()
+    order = np.argsort(response_ids, kind="stable")
+    weather = pd.DataFrame(
+        {
+            "date": _to_date_objects(weather["date"].iloc[order]),
+            "max_temp": weather["max_temp"].to_numpy()[order],
+            "min_temp": weather["min_temp"].to_numpy()[order],
+        },
+        index=days[order],
+    )
+    bounds = np.searchsorted(response_ids[order], np.arange(len(responses) + 1))
+    return [
+        weather.iloc[start:stop].copy() for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def epochs_to_dates(epochs: Iterable[int]) -> np.ndarray:
+    """
+    Converts UNIX timestamps into UTC dates at once
+    Args:
+        epochs: seconds since the epoch
+
+    Returns:
+    datetime64[D] array
+    """
+    seconds = np.asarray(epochs, dtype=np.int64).astype("datetime64[s]")
+    return seconds.astype("datetime64[D]")
+
+
+def _to_date_objects(dates: pd.Series) -> np.ndarray:
+    """Converts datetime64 dates into datetime.date objects"""
+    return dates.to_numpy().astype("datetime64[D]").astype(object)
+
+
+def _days_from(dates: pd.Series, today: date) -> np.ndarray:
+    """Amounts of days between datetime64 dates and today"""
+    return (
+        (dates.to_numpy() - np.datetime64(today, "D"))
+        .astype("timedelta64[D]")
+        .astype(np.int64)
+    )
+
+
 def date_range(
     start: Union[date, datetime], stop: Union[date, datetime]
 ) -> Generator[datetime, None, None]:
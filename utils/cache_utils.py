@@ -0,0 +1,254 @@
+"""This module contains persistent caches for results of API calls"""
+
+import sqlite3
+import time
+from datetime import date
+from os import PathLike
+from typing import Any, Dict, Iterable, Mapping, Optional, Union
+
+from utils import json_utils
+
+# Passed as "ttl" to make an entry use the cache-wide TTL
+DEFAULT_TTL = object()
+
+
+class SqliteCache:
+    """
+    A persistent key-value cache stored in a single SQLite table. Values are stored
+    as JSON. Every entry may have its own time-to-live; when the amount of entries
+    exceeds max_entries, the least recently used ones are evicted.
+
+    Args:
+        db_path: path to SQLite database file, created if not exists
+        table: name of a table holding cache entries
+        ttl: default time-to-live of an entry in seconds, None means forever
+        max_entries: maximal amount of entries kept, None means unlimited
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, PathLike],
+        table="cache",
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("  # noqa: S608
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        # Eviction runs after every write, so it must not scan the whole table
+        for column in ["expires_at", "accessed_at"]:
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_{column} "  # noqa: S608
+                f"ON {table} ({column})"
+            )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        query = f"SELECT COUNT(*) FROM {self.table}"  # noqa: S608
+        return self._connection.execute(query).fetchone()[0]
+
+    def close(self):
+        """Closes the underlying database connection"""
+        self._connection.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Looks up several keys at once. Found entries are marked as recently used.
+        Args:
+            keys: keys to look up, may contain duplicates
+
+        Returns:
+        A dictionary of found and not expired entries
+        """
+        keys = list(keys)
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        # SQLite limits the number of query parameters, hence the batching
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start : start + 500]
+            rows = self._connection.execute(
+                f"SELECT key, value FROM {self.table} "  # noqa: S608
+                f"WHERE key IN ({','.join('?' * len(batch))}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                [*batch, now],
+            )
+            found.update((key, json_utils.loads(value)) for key, value in rows)
+
+        if found:
+            self._connection.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",  # noqa: S608
+                [(now, key) for key in found],
+            )
+            self._connection.commit()
+
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def get(self, key: str, default=None) -> Any:
+        """
+        Looks up a single key.
+        Args:
+            key: a key to look up
+            default: a value returned when key is not cached
+
+        Returns:
+        Cached value or default
+        """
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items: Mapping[str, Any], ttl=DEFAULT_TTL):
+        """
+        Stores several entries at once and evicts the excess ones.
+        Args:
+            items: a mapping of keys to JSON-serializable values
+            ttl: time-to-live of the entries in seconds, None means forever. If not
+                passed, the cache-wide TTL is used.
+
+        Returns:
+            None
+        """
+        if ttl is DEFAULT_TTL:
+            ttl = self.ttl
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO {self.table} "  # noqa: S608
+            "(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            [
+                (key, json_utils.dumps(value), expires_at, now)
+                for key, value in items.items()
+            ],
+        )
+        self._connection.commit()
+        self.evict()
+
+    def set(self, key: str, value: Any, ttl=DEFAULT_TTL):
+        """
+        Stores a single entry. See set_many().
+        """
+        self.set_many({key: value}, ttl=ttl)
+
+    def evict(self):
+        """
+        Removes expired entries and, if the cache is still too large, the least
+        recently used ones.
+
+        Returns:
+            None
+        """
+        self._connection.execute(
+            f"DELETE FROM {self.table} WHERE expires_at <= ?",  # noqa: S608
+            (time.time(),),
+        )
+        excess = 0 if self.max_entries is None else len(self) - self.max_entries
+        if excess > 0:
+            # Only the excess entries are walked through the index
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("  # noqa: S608
+                f"SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+        self._connection.commit()
+
+    def stats(self) -> str:
+        """Returns a human-readable line with hit and miss counters"""
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+class GeocodingCache(SqliteCache):
+    """
+    A persistent cache of reverse geocoding results keyed by rounded coordinates.
+
+    Args:
+        db_path: path to SQLite database file, created if not exists
+        precision: amount of decimal digits coordinates are rounded to. The default
+            of 5 digits corresponds to roughly one meter.
+        ttl: time-to-live of an address in seconds, None means forever
+        max_entries: maximal amount of addresses kept, None means unlimited
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, PathLike],
+        precision=5,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        super().__init__(db_path, "addresses", ttl=ttl, max_entries=max_entries)
+        self.precision = precision
+
+    def coords_key(self, lat: float, lon: float) -> str:
+        """
+        Makes a cache key out of a pair of coordinates
+        Args:
+            lat: latitude
+            lon: longitude
+
+        Returns:
+        Rounded coordinates as a string
+        """
+        # Adding 0.0 turns negative zero into positive one
+        return (
+            f"{round(lat, self.precision) + 0.0:.{self.precision}f},"
+            f"{round(lon, self.precision) + 0.0:.{self.precision}f}"
+        )
+
+
+class WeatherCache(SqliteCache):
+    """
+    A persistent cache of raw openweathermap.org responses keyed by endpoint, date
+    and rounded coordinates. History of past days never changes, so it is meant to
+    be stored forever, while current and forecasted weather expires after ttl.
+
+    Args:
+        db_path: path to SQLite database file, created if not exists
+        precision: amount of decimal digits coordinates are rounded to. The default
+            of 2 digits corresponds to roughly one kilometer.
+        ttl: time-to-live of current and forecasted weather in seconds
+        max_entries: maximal amount of responses kept, None means unlimited
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, PathLike],
+        precision=2,
+        ttl: Optional[float] = 3 * 60 * 60,
+        max_entries: Optional[int] = None,
+    ):
+        super().__init__(db_path, "weather", ttl=ttl, max_entries=max_entries)
+        self.precision = precision
+
+    def request_key(self, endpoint: str, lat: float, lon: float, day: date) -> str:
+        """
+        Makes a cache key for a weather request
+        Args:
+            endpoint: API endpoint name, e.g. "onecall" or "timemachine"
+            lat: latitude
+            lon: longitude
+            day: the date weather is requested for
+
+        Returns:
+        Endpoint, date and rounded coordinates as a string
+        """
+        return (
+            f"{endpoint}/{day.isoformat()}/"
+            f"{round(lat, self.precision) + 0.0:.{self.precision}f},"
+            f"{round(lon, self.precision) + 0.0:.{self.precision}f}"
+        )
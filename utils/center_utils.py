@@ -0,0 +1,246 @@
+"""This module contains vectorized computation of city centers"""
+
+from itertools import combinations
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.geo_utils import to_unit_vectors
+
+CENTER_METHODS = ("bbox", "centroid", "minimax")
+
+
+def compute_city_centers(
+    hotels: pd.DataFrame, method="bbox", keys: Tuple[str, ...] = ("Country", "City")
+) -> pd.DataFrame:
+    """
+    Computes centers of all the cities at once.
+    Args:
+        hotels: a DataFrame with key columns, "Latitude" and "Longitude"
+        method: one of CENTER_METHODS:
+            "bbox" - the midpoint of the bounding box of hotels. Longitudes of a
+                city straddling the antimeridian are wrapped around it.
+            "centroid" - the spherical centroid of hotels, i.e. the direction of
+                the mean of their unit vectors
+            "minimax" - the center of the minimum enclosing circle of the extreme
+                hotels of a city, which minimizes the distance to the farthest of
+                them
+        keys: columns identifying a city
+
+    Returns:
+    A DataFrame with key columns, "Latitude" and "Longitude", one row per city in
+        the order of the first appearance in hotels
+    """
+    if method not in CENTER_METHODS:
+        raise ValueError(f"Unknown city center method '{method}'")
+
+    grouped = hotels.groupby(list(keys), sort=False, observed=True)
+    cities = grouped.size().index.to_frame(index=False)
+    group_ids = grouped.ngroup().to_numpy()
+    order = np.argsort(group_ids, kind="stable")
+    lat = hotels["Latitude"].to_numpy(dtype=np.float64)[order]
+    lon = hotels["Longitude"].to_numpy(dtype=np.float64)[order]
+    starts = np.flatnonzero(np.diff(group_ids[order], prepend=-1))
+
+    if method == "bbox":
+        center_lat, center_lon = bbox_centers(lat, lon, starts)
+    elif method == "centroid":
+        center_lat, center_lon = spherical_centroids(lat, lon, starts)
+    else:
+        center_lat, center_lon = minimax_centers(lat, lon, starts)
+    return cities.assign(Latitude=center_lat, Longitude=center_lon)
+
+
+def bbox_centers(
+    lat: np.ndarray, lon: np.ndarray, starts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds midpoints of bounding boxes of groups of points. The longitude range
+    of a group is the shortest arc holding all of its points, i.e. the complement
+    of the largest gap between them, which may cross the antimeridian.
+    Args:
+        lat: latitudes of points sorted by group
+        lon: longitudes of points sorted by group
+        starts: positions of the first points of groups
+
+    Returns:
+    Latitudes and longitudes of midpoints
+    """
+    center_lat = (
+        np.minimum.reduceat(lat, starts) + np.maximum.reduceat(lat, starts)
+    ) / 2
+
+    group_of = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(lon)))
+    by_lon = np.lexsort((lon, group_of))
+    lon = lon[by_lon]
+    ends = np.append(starts[1:], len(lon))
+    # Every point is followed by the next one eastwards, the last point of a group
+    # is followed by the first one through the antimeridian
+    following = np.arange(1, len(lon) + 1)
+    following[ends - 1] = starts
+    gaps = lon[following] - lon
+    gaps[ends - 1] += 360
+
+    widest = _group_argmax(gaps, starts)
+    west, east = lon[following[widest]], lon[widest]
+    center_lon = _wrap_longitude((west + east + 360 * (east < west)) / 2)
+    return center_lat, center_lon
+
+
+def spherical_centroids(
+    lat: np.ndarray, lon: np.ndarray, starts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds spherical centroids of groups of points
+    Args:
+        lat: latitudes of points sorted by group
+        lon: longitudes of points sorted by group
+        starts: positions of the first points of groups
+
+    Returns:
+    Latitudes and longitudes of centroids
+    """
+    sums = np.add.reduceat(to_unit_vectors(lat, lon), starts)
+    return (
+        np.degrees(np.arctan2(sums[:, 2], np.hypot(sums[:, 0], sums[:, 1]))),
+        np.degrees(np.arctan2(sums[:, 1], sums[:, 0])),
+    )
+
+
+def minimax_centers(
+    lat: np.ndarray, lon: np.ndarray, starts: np.ndarray, directions=4
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds centers of minimum enclosing circles of extreme points of groups. Points
+    of a group are projected onto a plane tangent at the group centroid, and its
+    extreme points are the farthest ones in evenly spread directions, by default
+    the northernmost, southernmost, easternmost and westernmost ones. The circle
+    enclosing a few points passes through two or three of them, so all such
+    circles are checked at once.
+    Args:
+        lat: latitudes of points sorted by group
+        lon: longitudes of points sorted by group
+        starts: positions of the first points of groups
+        directions: amount of directions extreme points are taken in. More of
+            them make the circle enclose more points, but the amount of
+            candidate circles grows as a cube of it.
+
+    Returns:
+    Latitudes and longitudes of centers
+    """
+    ref_lat, ref_lon = spherical_centroids(lat, lon, starts)
+    group_of = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(lon)))
+    scale = np.cos(np.radians(ref_lat))
+    x = _wrap_longitude(lon - ref_lon[group_of]) * scale[group_of]
+    y = lat - ref_lat[group_of]
+
+    angles = np.linspace(0, 2 * np.pi, directions, endpoint=False)
+    extremes = np.stack(
+        [
+            _group_argmax(x * np.cos(angle) + y * np.sin(angle), starts)
+            for angle in angles
+        ],
+        axis=1,
+    )
+    points = np.stack([x[extremes], y[extremes]], axis=2)
+
+    best = np.empty((len(starts), 2))
+    # Candidate circles of all the groups at once take too much memory
+    for chunk_start in range(0, len(starts), 4096):
+        chunk = slice(chunk_start, chunk_start + 4096)
+        best[chunk] = _smallest_enclosing_circles(points[chunk])
+
+    return (
+        ref_lat + best[:, 1],
+        _wrap_longitude(ref_lon + best[:, 0] / np.maximum(scale, 1e-12)),
+    )
+
+
+def _smallest_enclosing_circles(points: np.ndarray) -> np.ndarray:
+    """
+    Finds centers of minimum enclosing circles of a few points of every group
+    Args:
+        points: array of shape (groups, k, 2)
+
+    Returns:
+    Centers of shape (groups, 2)
+    """
+    centers, radii = _candidate_circles(points)
+    sq_distances = (points[:, None, :, 0] - centers[:, :, None, 0]) ** 2 + (
+        points[:, None, :, 1] - centers[:, :, None, 1]
+    ) ** 2
+    encloses = (sq_distances <= (radii ** 2 * (1 + 1e-9) + 1e-24)[:, :, None]).all(
+        axis=2
+    )
+    radii = np.where(encloses, radii, np.inf)
+    return centers[np.arange(len(points)), radii.argmin(axis=1)]
+
+
+def _candidate_circles(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds circles passing through every pair (as a diameter) and every triple of
+    points of every group
+    Args:
+        points: array of shape (groups, k, 2)
+
+    Returns:
+    Centers of shape (groups, circles, 2) and radii of shape (groups, circles).
+        Radii of circles through collinear triples are infinite.
+    """
+    pairs = np.array(list(combinations(range(points.shape[1]), 2)))
+    first, second = points[:, pairs[:, 0]], points[:, pairs[:, 1]]
+    pair_centers = (first + second) / 2
+    pair_radii = np.linalg.norm(first - second, axis=2) / 2
+
+    triples = np.array(list(combinations(range(points.shape[1]), 3)))
+    a, b, c = (points[:, triples[:, idx]] for idx in range(3))
+    denominator = 2 * (
+        a[..., 0] * (b[..., 1] - c[..., 1])
+        + b[..., 0] * (c[..., 1] - a[..., 1])
+        + c[..., 0] * (a[..., 1] - b[..., 1])
+    )
+    sq_a, sq_b, sq_c = ((p ** 2).sum(axis=2) for p in (a, b, c))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        triple_centers = np.stack(
+            [
+                (
+                    sq_a * (b[..., 1] - c[..., 1])
+                    + sq_b * (c[..., 1] - a[..., 1])
+                    + sq_c * (a[..., 1] - b[..., 1])
+                )
+                / denominator,
+                (
+                    sq_a * (c[..., 0] - b[..., 0])
+                    + sq_b * (a[..., 0] - c[..., 0])
+                    + sq_c * (b[..., 0] - a[..., 0])
+                )
+                / denominator,
+            ],
+            axis=2,
+        )
+    degenerate = np.abs(denominator) < 1e-15
+    triple_centers[degenerate] = 0.0
+    triple_radii = np.where(
+        degenerate, np.inf, np.linalg.norm(triple_centers - a, axis=2)
+    )
+
+    return (
+        np.concatenate([pair_centers, triple_centers], axis=1),
+        np.concatenate([pair_radii, triple_radii], axis=1),
+    )
+
+
+def _group_argmax(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Positions of the first maximal values of contiguous groups"""
+    maxima = np.repeat(
+        np.maximum.reduceat(values, starts), np.diff(starts, append=len(values))
+    )
+    is_max = np.flatnonzero(values == maxima)
+    group_of = np.searchsorted(starts, is_max, side="right") - 1
+    return is_max[np.diff(group_of, prepend=-1) != 0]
+
+
+def _wrap_longitude(lon: np.ndarray) -> np.ndarray:
+    """Brings longitudes into [-180, 180) range, keeping the ones already in it"""
+    return np.where((lon < -180) | (lon >= 180), np.mod(lon + 180, 360) - 180, lon)
@@ -1,10 +1,12 @@
 """This module contains functions providing dataframe processing"""
 
+import time
 from os import PathLike
+from typing import Iterable
 
-import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
+
+from utils.weather_utils import build_weather_table, compute_weather_statistics
 
 
 def refine_data(dataframe: pd.DataFrame) -> pd.DataFrame:
@@ -20,58 +22,139 @@ def refine_data(dataframe: pd.DataFrame) -> pd.DataFrame:
         Cleaned dataframe.
     """
     # Drops ID column because is seems unnecessary
-    dataframe.drop(columns=["Id"], inplace=True)
+    dataframe = dataframe.drop(columns=["Id"], errors="ignore")
+
+    # Convert coordinates to float column by column
+    for column in ["Latitude", "Longitude"]:
+        dataframe[column] = pd.to_numeric(dataframe[column], errors="coerce")
 
-    # Convert some values to float
-    dataframe[["Latitude", "Longitude"]] = dataframe[["Latitude", "Longitude"]].apply(
-        pd.to_numeric, axis=1, errors="coerce"
+    # Selects rows without NaNs, with latitude in (-90,90) and longitude in (-180,180)
+    valid_rows = (
+        dataframe.notna().all(axis="columns")
+        & dataframe["Latitude"].between(-90.0, 90.0)
+        & dataframe["Longitude"].between(-180.0, 180.0)
+    )
+    dataframe = dataframe[valid_rows]
+
+    # Forgets categories of dropped rows, so they do not show up in groupby results
+    return dataframe.assign(
+        **{
+            column: dataframe[column].cat.remove_unused_categories()
+            for column, dtype in dataframe.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
     )
 
-    # Drops rows with NaN values
-    dataframe.dropna(axis="index", inplace=True)
 
-    # Selects rows with latitude in (-90,90) and longitude in (-180,180)
-    dataframe = dataframe[
-        (dataframe["Latitude"] <= 90.0)
-        & (dataframe["Latitude"] >= -90.0)
-        & (dataframe["Longitude"] <= 180.0)
-        & (dataframe["Longitude"] >= -180.0)
-    ]
+def memory_usage_mb(dataframe: pd.DataFrame) -> float:
+    """
+    Computes the amount of memory occupied by a dataframe, including the contents
+        of object columns.
+
+    Args:
+        dataframe: a dataframe to be measured
 
-    return dataframe
+    Returns:
+        Memory usage in megabytes
+    """
+    return dataframe.memory_usage(deep=True).sum() / 2 ** 20
 
 
-def select_most_hoteled_cities(dataframe: pd.DataFrame) -> pd.DataFrame:
+def select_most_hoteled_cities(dataframe: pd.DataFrame, top_k=1) -> pd.DataFrame:
     """
-    Selects cities with most hotels across each Country from dataframe.
+    Selects cities with most hotels across each Country from dataframe. Cities
+        sharing a place are all selected, so there may be more than top_k cities per
+        country.
 
     Args:
         dataframe: A DataFrame with information about hotels. Must have columns
             "Country", "City" for hotel location and ome more for hotel info.
+        top_k (int): amount of places in the per-country ranking to be selected
 
     Returns:
-    DataFrame with "Country", "City" and "size" column for the amount of hotels per each
+    DataFrame with "Country" and "City" columns sorted by country and city.
+    """
+    return select_top_cities(
+        dataframe.groupby(["Country", "City"], observed=True).size(), top_k=top_k
+    )
+
+
+def select_top_cities(hotels_per_city: pd.Series, top_k=1) -> pd.DataFrame:
+    """
+    Selects cities with most hotels across each Country from hotel counts. Cities
+        sharing a place are all selected, so there may be more than top_k cities per
         country.
+
+    Args:
+        hotels_per_city: amounts of hotels indexed by "Country" and "City", e.g.
+            "Hotels" of accumulate_city_stats() indexed by them
+        top_k (int): amount of places in the per-country ranking to be selected
+
+    Returns:
+    DataFrame with "Country" and "City" columns sorted by country and city.
     """
-    countries = np.unique(dataframe["Country"])
+    city_places = hotels_per_city.groupby(level="Country", observed=True).rank(
+        method="min", ascending=False
+    )
+    # Groups of categorical keys come in the order of appearance, and sorting them
+    # by categories would follow the category order, so names are compared instead
+    return (
+        hotels_per_city[city_places <= top_k]
+        .sort_index(key=lambda level: level.astype(str))
+        .index.to_frame(index=False)
+    )
 
-    hotels_grouped = dataframe.groupby(
-        ["Country", "City"], group_keys=False, as_index=False
-    ).size()
-    most_hotels_df_list = []
 
-    for country in countries:
-        max_hotels_in_country = max(hotels_grouped[hotels_grouped["Country"] == country]["size"])
-        print(f"For country {country} max hotels is {max_hotels_in_country}")
+def accumulate_city_stats(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Counts hotels of every city in a stream of hotel chunks, keeping only counts
+        per city of every chunk in memory. This is the first pass of out-of-core
+        reading, the second one keeps hotels of selected cities only.
+
+    Args:
+        chunks: refined DataFrames with "Country" and "City" columns, e.g. chunks
+            of file_utils.iter_csv_chunks_from_zipfile() passed through
+            refine_data()
 
-        most_hotels_df_list.append(
-            hotels_grouped[
-                (hotels_grouped["Country"] == country)
-                & (hotels_grouped["size"] == max_hotels_in_country)
-                ]
+    Returns:
+    DataFrame with "Country", "City" and "Hotels" columns sorted by country and
+        city
+    """
+    keys = ["Country", "City"]
+    partials = [
+        pd.Series(dtype="int64", index=pd.MultiIndex.from_arrays([[], []], names=keys))
+    ]
+    for chunk in chunks:
+        partial = chunk.groupby(keys, observed=True).size()
+        # Categories differ between chunks, so plain strings are accumulated
+        partial.index = pd.MultiIndex.from_arrays(
+            [partial.index.get_level_values(key).astype(object) for key in keys],
+            names=keys,
         )
+        partials.append(partial)
+    totals = pd.concat(partials).groupby(level=keys).sum()
+    return totals.astype("int64").rename("Hotels").reset_index()
+
 
-    return pd.concat(most_hotels_df_list)[["Country", "City"]]
+def select_hotels_in_cities(
+    dataframe: pd.DataFrame, cities: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Selects hotels located in given cities without merging the tables.
+
+    Args:
+        dataframe: A DataFrame with information about hotels. Must have columns
+            "Country", "City".
+        cities: A DataFrame with "Country" and "City" columns, e.g. a result of
+            select_most_hoteled_cities()
+
+    Returns:
+    Rows of dataframe located in cities, in their original order.
+    """
+    city_keys = pd.MultiIndex.from_frame(dataframe[["Country", "City"]])
+    return dataframe[
+        city_keys.isin(pd.MultiIndex.from_frame(cities[["Country", "City"]]))
+    ]
 
 
 def draw_and_save_temp_graph(
@@ -90,7 +173,16 @@ def draw_and_save_temp_graph(
     Returns:
     None
     """
-    fig, axis = plt.subplots()
+    # Matplotlib takes long to import, so it is only imported by processes drawing
+    # plots
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # A figure created without pyplot is not registered in its global state, so it
+    # is freed as soon as it goes out of scope. It is drawn with Agg backend.
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    axis = fig.subplots()
     axis.plot(
         temp_data[["date"]], temp_data[["min_temp"]], c="cyan", label="Min temperature"
     )
@@ -115,6 +207,20 @@ def draw_and_save_temp_graph(
     fig.savefig(fname=f"{save_path}/weather_{city_name.lower()}.png")
 
 
+def draw_and_save_temp_graph_timed(chart_args: tuple) -> float:
+    """
+    Calls draw_and_save_temp_graph() and measures its duration
+    Args:
+        chart_args: positional arguments of draw_and_save_temp_graph()
+
+    Returns:
+    Rendering time in seconds
+    """
+    start = time.perf_counter()
+    draw_and_save_temp_graph(*chart_args)
+    return time.perf_counter() - start
+
+
 def find_max_temp_city(weather_dict: dict) -> pd.DataFrame:
     """
     Finds city and date where maximal temperature was registered.
@@ -128,19 +234,9 @@ def find_max_temp_city(weather_dict: dict) -> pd.DataFrame:
     A DataFrame with one or (extremely rarely) more rows of max temperature data.
         This DF contains columns "date", "temp", "Country" and "City".
     """
-    max_temps = []
-    for (country, city), weather_df in weather_dict.items():
-        max_temp = weather_df[
-            weather_df["max_temp"] == weather_df["max_temp"].max()
-        ].copy()
-        max_temp["Country"] = [country] * len(max_temp)
-        max_temp["City"] = [city] * len(max_temp)
-        max_temp.rename(columns={"max_temp": "temp"}, inplace=True)
-        max_temp.drop(columns=["min_temp"], inplace=True)
-        max_temps.append(max_temp)
-
-    max_temps = pd.concat(max_temps)
-    return max_temps[max_temps["temp"] == max_temps["temp"].max()]
+    return _with_python_dates(
+        compute_weather_statistics(build_weather_table(weather_dict)).max_temp
+    )
 
 
 def find_min_temp_city(weather_dict: dict) -> pd.DataFrame:
@@ -157,19 +253,9 @@ def find_min_temp_city(weather_dict: dict) -> pd.DataFrame:
     A DataFrame with one or (extremely rarely) more rows of min temperature data.
         This DF contains columns "date", "temp", "Country" and "City".
     """
-    min_temps = []
-    for (country, city), weather_df in weather_dict.items():
-        min_temp = weather_df[
-            weather_df["min_temp"] == weather_df["min_temp"].min()
-        ].copy()
-        min_temp["Country"] = [country] * len(min_temp)
-        min_temp["City"] = [city] * len(min_temp)
-        min_temp.rename(columns={"min_temp": "temp"}, inplace=True)
-        min_temp.drop(columns=["max_temp"], inplace=True)
-        min_temps.append(min_temp)
-
-    max_temps = pd.concat(min_temps)
-    return max_temps[max_temps["temp"] == max_temps["temp"].min()]
+    return _with_python_dates(
+        compute_weather_statistics(build_weather_table(weather_dict)).min_temp
+    )
 
 
 def find_max_temp_diff(weather_dict: dict) -> pd.DataFrame:
@@ -186,21 +272,9 @@ def find_max_temp_diff(weather_dict: dict) -> pd.DataFrame:
     A DataFrame with one or (extremely rarely) more rows of temperature change data.
         This DF contains columns "date", "temp_diff", "Country" and "City".
     """
-    temp_diffs = []
-    for (country, city), weather_df in weather_dict.items():
-        temp_diff = pd.DataFrame(
-            {
-                "date": weather_df["date"],
-                "temp_diff": weather_df["max_temp"] - weather_df["min_temp"],
-                "Country": [country] * len(weather_df),
-                "City": [city] * len(weather_df),
-            }
-        )
-        temp_diffs.append(
-            temp_diff[temp_diff["temp_diff"] == temp_diff["temp_diff"].max()]
-        )
-    temp_diffs = pd.concat(temp_diffs)
-    return temp_diffs[temp_diffs["temp_diff"] == temp_diffs["temp_diff"].max()]
+    return _with_python_dates(
+        compute_weather_statistics(build_weather_table(weather_dict)).max_temp_diff
+    )
 
 
 def find_max_temp_delta_city(weather_dict: dict) -> pd.DataFrame:
@@ -217,20 +291,16 @@ def find_max_temp_delta_city(weather_dict: dict) -> pd.DataFrame:
     A DataFrame with one or (extremely rarely) more rows of temperature data.
         This DF contains columns "temp_delta", "Country" and "City".
     """
-    temp_deltas = []
-    for (country, city), weather_df in weather_dict.items():
-        mean_temps = weather_df[["max_temp", "min_temp"]].mean(axis=1)
-        temp_deltas.append(
-            pd.DataFrame(
-                {
-                    "Country": country,
-                    "City": city,
-                    "temp_delta": mean_temps.tail(1).values - mean_temps.head(1).values,
-                },
-                index=[None],
-            )
-        )
-    temp_deltas = pd.concat(temp_deltas)
-    return temp_deltas[
-        temp_deltas["temp_delta"] == temp_deltas["temp_delta"].max()
-    ].reset_index(drop=True)
+    return _with_python_dates(
+        compute_weather_statistics(build_weather_table(weather_dict)).max_temp_delta
+    )
+
+
+def _with_python_dates(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts datetime64 "date" column, if any, into datetime.date objects as they
+    are returned by async_utils.get_weather
+    """
+    if "date" not in dataframe:
+        return dataframe
+    return dataframe.assign(date=dataframe["date"].dt.date)
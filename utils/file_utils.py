@@ -1,11 +1,88 @@
 """ This module contains functions for interaction with files"""
 
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from os import PathLike
 from pathlib import Path
-from typing import Union, List
+from typing import Callable, Generator, Iterable, List, Optional, Tuple, Union
 
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Columns of the input hotel CSVs used by the pipeline and their types. Coordinates
+# are read as strings, since they may contain garbage, and parsed by refine_data()
+HOTELS_CSV_SCHEMA = {
+    "usecols": ["Name", "Country", "City", "Latitude", "Longitude"],
+    "dtype": {
+        "Name": "object",
+        "Country": "category",
+        "City": "category",
+        "Latitude": "object",
+        "Longitude": "object",
+    },
+}
+
+
+def open_zipfile(zipfile_path: Union[str, PathLike]) -> zipfile.ZipFile:
+    """
+    Opens a ZIP file for reading. The archive is validated by opening it, so there
+    is no need to call zipfile.is_zipfile() beforehand.
+    Args:
+        zipfile_path: path to zipfile
+
+    Returns:
+        Opened ZipFile object, must be closed by the caller
+    """
+    try:
+        return zipfile.ZipFile(zipfile_path)
+    except zipfile.BadZipfile as err:
+        raise zipfile.BadZipfile(
+            f"File '{zipfile_path}' is not a proper ZIP file"
+        ) from err
+
+
+def list_csv_members(zip_file: zipfile.ZipFile) -> List[str]:
+    """
+    Lists names of CSV files stored in a ZIP archive
+    Args:
+        zip_file: an opened ZipFile object
+
+    Returns:
+        Names of CSV members in archive order
+    """
+    return [name for name in zip_file.namelist() if name.endswith(".csv")]
+
+
+def concat_dataframes(
+    subframes: Iterable[pd.DataFrame], source: Union[str, PathLike] = "input"
+) -> pd.DataFrame:
+    """
+    Concatenates DataFrames keeping categorical columns categorical. A plain
+    pd.concat() turns them into objects when subframes have different categories.
+    Args:
+        subframes: DataFrames with the same columns
+        source: a ZIP file or a directory the subframes are read from, named by
+            the error raised when there are none
+
+    Returns:
+        Concatenated DataFrame with a fresh index
+    """
+    subframes = list(subframes)
+    if not subframes:
+        raise ValueError(f"There are no CSV files in '{source}'")
+    categorical_columns = [
+        column
+        for column, dtype in subframes[0].dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    for column in categorical_columns:
+        categories = union_categoricals(
+            [subframe[column] for subframe in subframes], ignore_order=True
+        ).categories
+        for subframe in subframes:
+            subframe[column] = subframe[column].cat.set_categories(categories)
+    return pd.concat(subframes, ignore_index=True)
 
 
 def unpack_csv_from_zipfile(
@@ -21,16 +98,111 @@ def unpack_csv_from_zipfile(
     Returns:
         Paths to extracted files
     """
-    if not zipfile.is_zipfile(zipfile_path):
-        raise zipfile.BadZipfile(f"File '{zipfile_path}' is not a proper ZIP file")
+    with open_zipfile(zipfile_path) as zip_file:
+        return [
+            zip_file.extract(name, path=extract_dir)
+            for name in list_csv_members(zip_file)
+        ]
+
+
+def iter_csv_chunks_from_zipfile(
+    zipfile_path: Union[str, PathLike], chunksize=100_000
+) -> Generator[pd.DataFrame, None, None]:
+    """
+    Reads CSVs stored in a ZIP file chunk by chunk, without extracting them to disk.
+    Args:
+        zipfile_path: path to zipfile
+        chunksize: maximal amount of rows in a single chunk
+
+    Yields:
+        DataFrames of at most chunksize rows
+    """
+    with open_zipfile(zipfile_path) as zip_file:
+        for name in list_csv_members(zip_file):
+            with zip_file.open(name) as csv_file:
+                yield from pd.read_csv(
+                    csv_file, chunksize=chunksize, **HOTELS_CSV_SCHEMA
+                )
+
+
+def read_csv_from_zipfile(
+    zipfile_path: Union[str, PathLike],
+    chunksize=100_000,
+    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """
+    Concatenates all the CSVs stored in a ZIP file reading them directly from the
+    archive. This is a streaming counterpart of unpack_csv_from_zipfile() followed
+    by assemble_dataframe().
+    Args:
+        zipfile_path: path to zipfile
+        chunksize: maximal amount of rows read from an archive member at once
+        transform: a function applied to every chunk before concatenation. A
+            transform filtering rows keeps the memory usage proportional to the
+            rows it keeps rather than to the archive size.
+
+    Returns:
+        DataFrame of all the CSVs
+    """
+    chunks = iter_csv_chunks_from_zipfile(zipfile_path, chunksize=chunksize)
+    if transform is not None:
+        chunks = map(transform, chunks)
+    return concat_dataframes(chunks, zipfile_path)
+
+
+def read_csv_member(
+    zipfile_path: Union[str, PathLike],
+    member_name: str,
+    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """
+    Reads a single CSV member of a ZIP file and optionally transforms it. Being a
+    module level function, it can be sent to worker processes.
+    Args:
+        zipfile_path: path to zipfile
+        member_name: name of a CSV file inside the archive
+        transform: a function applied to the parsed DataFrame, e.g. refine_data()
+
+    Returns:
+        DataFrame of the CSV member
+    """
+    with open_zipfile(zipfile_path) as zip_file:
+        with zip_file.open(member_name) as csv_file:
+            dataframe = pd.read_csv(csv_file, **HOTELS_CSV_SCHEMA)
+    if transform is not None:
+        dataframe = transform(dataframe)
+    return dataframe
+
+
+def read_csv_from_zipfile_parallel(
+    zipfile_path: Union[str, PathLike],
+    workers: Optional[int] = None,
+    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """
+    Concatenates all the CSVs stored in a ZIP file parsing every archive member in
+    a separate process. Each worker opens the archive on its own, so only parsed
+    (and transformed) data is sent back to the parent process.
+    Args:
+        zipfile_path: path to zipfile
+        workers: amount of worker processes, defaults to the number of CPUs
+        transform: a picklable function applied to every member DataFrame inside
+            a worker, e.g. refine_data()
+
+    Returns:
+        DataFrame of all the CSVs
+    """
+    with open_zipfile(zipfile_path) as zip_file:
+        member_names = list_csv_members(zip_file)
 
-    file_list = []
-    with zipfile.ZipFile(zipfile_path) as zip_file:
-        name_list = zip_file.namelist()
-        for name in name_list:
-            if name.endswith(".csv"):
-                file_list.append(zip_file.extract(name, path=extract_dir))
-    return file_list
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        subframes = list(
+            executor.map(
+                partial(read_csv_member, zipfile_path, transform=transform),
+                member_names,
+            )
+        )
+    return concat_dataframes(subframes, zipfile_path)
 
 
 def assemble_dataframe(csv_dir_path: Path) -> pd.DataFrame:
@@ -42,12 +214,19 @@ def assemble_dataframe(csv_dir_path: Path) -> pd.DataFrame:
     Returns:
         DataFrame of all the CSVs
     """
-    subframes = [pd.read_csv(filename) for filename in csv_dir_path.iterdir()]
-    return pd.concat(subframes)
+    subframes = [
+        pd.read_csv(filename, **HOTELS_CSV_SCHEMA)
+        for filename in csv_dir_path.iterdir()
+    ]
+    return concat_dataframes(subframes, csv_dir_path)
 
 
 def save_dataframe_as_csv_splitted(
-    dataframe: pd.DataFrame, dest_dir: PathLike, name_prefix="csv", chunk_size=100
+    dataframe: pd.DataFrame,
+    dest_dir: PathLike,
+    name_prefix="csv",
+    chunk_size=100,
+    chunk_ids: Optional[Iterable[int]] = None,
 ):
     """
     Saves a dataframe as CSV to dest_dir splitting it into chunks
@@ -56,12 +235,73 @@ def save_dataframe_as_csv_splitted(
         dest_dir: A directory where save the data to
         name_prefix: Common name prefix for all CSV chunks
         chunk_size: A length of each chunk
+        chunk_ids: Numbers of chunks to be saved, all the chunks if None
 
     Returns:
         None
     """
 
+    chunk_ids = None if chunk_ids is None else set(chunk_ids)
     for idx, row_cnt in enumerate(range(0, len(dataframe), chunk_size)):
+        if chunk_ids is not None and idx not in chunk_ids:
+            continue
         tmp_chunk = dataframe[row_cnt : row_cnt + chunk_size]
         chunk_path = f"{dest_dir}/{name_prefix}_{idx:04d}.csv"
         tmp_chunk.to_csv(chunk_path)
+
+
+def city_output_dir(output_dir: Union[str, PathLike], country: str, city: str) -> Path:
+    """
+    Makes a path of a directory holding output files of a city
+    Args:
+        output_dir: the root output directory
+        country: country code
+        city: city name
+
+    Returns:
+        Path of the city directory, i.e. output_dir/City_Country
+    """
+    return Path(output_dir) / f"{city}_{country}"
+
+
+def save_city_output(
+    city_hotels: pd.DataFrame,
+    center: Tuple[float, float],
+    save_dir: Path,
+    chunk_size=100,
+    chunk_ids: Optional[Iterable[int]] = None,
+):
+    """
+    Saves hotels of a single city split into "hotels_XXXX.csv" chunks and its
+    center coordinates into "center_coords.csv". Chunk files left from a previous
+    run with more hotels are removed.
+    Args:
+        city_hotels: a DataFrame with "Name", "Address", "Latitude" and "Longitude"
+            columns
+        center: latitude and longitude of the city center
+        save_dir: a directory to save the files to, created if not exists
+        chunk_size: maximal amount of hotels in a single file
+        chunk_ids: numbers of chunks to be (re)written, all the chunks if None.
+            "Address" is only read for hotels in these chunks.
+
+    Returns:
+        None
+    """
+    save_dir.mkdir(parents=True, exist_ok=True)
+    save_dataframe_as_csv_splitted(
+        city_hotels[["Name", "Address", "Latitude", "Longitude"]].reset_index(
+            drop=True
+        ),
+        save_dir,
+        name_prefix="hotels",
+        chunk_size=chunk_size,
+        chunk_ids=chunk_ids,
+    )
+    chunk_count = -(-len(city_hotels) // chunk_size)
+    for chunk_path in save_dir.glob("hotels_*.csv"):
+        chunk_id = chunk_path.stem[len("hotels_") :]
+        if chunk_id.isdigit() and int(chunk_id) >= chunk_count:
+            chunk_path.unlink()
+    pd.DataFrame({"Latitude": [center[0]], "Longitude": [center[1]]}).to_csv(
+        save_dir / "center_coords.csv", index=None
+    )
@@ -0,0 +1,218 @@
+"""This module contains vectorized functions for processing geographic coordinates"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+def snap_coordinates(coords, tolerance=0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Collapses identical or near-identical coordinates. Coordinates are snapped to a
+    grid with a cell size of tolerance degrees, and all the points falling into
+    the same cell are represented by the first of them. Points lying close to each
+    other, but on the different sides of a cell border are not merged.
+
+    Args:
+        coords: an array-like of latitude-longitude pairs
+        tolerance: grid cell size in degrees, 0 merges exact duplicates only
+
+    Returns:
+    A tuple of unique representative coordinates and an array of indices mapping
+        every input point to its representative, so that
+        unique_coords[inverse] approximates coords.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    keys = np.round(coords / tolerance) if tolerance > 0 else coords
+    _, first_idx, inverse = np.unique(
+        keys, axis=0, return_index=True, return_inverse=True
+    )
+    return coords[first_idx], inverse.reshape(-1)
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """
+    Converts geographic coordinates into points on a unit sphere
+    Args:
+        lat: an array-like of latitudes in degrees
+        lon: an array-like of longitudes in degrees
+
+    Returns:
+    Array of shape (n, 3) of x, y, z coordinates
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord) -> np.ndarray:
+    """
+    Converts straight line distances between points on a unit sphere into great
+    circle distances on Earth
+    Args:
+        chord: an array-like of distances between unit vectors
+
+    Returns:
+    Array of distances in kilometers
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class NearestPointIndex:
+    """
+    A KD-tree answering nearest point queries for many points at once. Points
+    are stored as unit vectors, so the index needs no special care for poles and
+    the antimeridian.
+
+    The tree is balanced and implicit: points are sorted so that every node owns
+    a contiguous slice of them, node k of level d owning the k-th of 2 ** d equal
+    slices. The index thus consists of a few flat arrays, namely the sorted
+    points and bounding boxes of nodes of every level. Queries descend the tree
+    level by level for all query points at once, skipping nodes whose bounding
+    boxes are farther than the nearest point found so far.
+
+    Args:
+        lat: an array-like of latitudes of indexed points
+        lon: an array-like of longitudes of indexed points
+        leaf_size: maximal amount of points in a leaf
+    """
+
+    def __init__(self, lat, lon, leaf_size=16):
+        points = to_unit_vectors(lat, lon)
+        size = len(points)
+        self.depth = int(np.ceil(np.log2(size / leaf_size))) if size > leaf_size else 0
+
+        order = np.arange(size)
+        for level in range(self.depth):
+            bounds = _level_bounds(size, level)
+            node_of = np.repeat(np.arange(2 ** level), np.diff(bounds))
+            mins = np.minimum.reduceat(points[order], bounds[:-1])
+            maxs = np.maximum.reduceat(points[order], bounds[:-1])
+            # Every node is split across the axis its points spread the most along
+            axes = np.argmax(maxs - mins, axis=1)[node_of]
+            order = order[np.lexsort((points[order, axes], node_of))]
+
+        self.order = order
+        self.points = points[order]
+        self.boxes = (
+            [
+                (
+                    np.minimum.reduceat(self.points, _level_bounds(size, level)[:-1]),
+                    np.maximum.reduceat(self.points, _level_bounds(size, level)[:-1]),
+                )
+                for level in range(self.depth + 1)
+            ]
+            if size
+            else []
+        )
+        self._leaf_bounds = _level_bounds(size, self.depth)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, lat, lon, chunk_size=16384) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the nearest indexed point for every query point
+        Args:
+            lat: an array-like of latitudes of query points
+            lon: an array-like of longitudes of query points
+            chunk_size: amount of query points processed at once, which bounds
+                memory used by a query
+
+        Returns:
+        A tuple of positions of the nearest points in the indexed arrays and
+            great circle distances to them in kilometers. Positions are -1 if the
+            index is empty.
+        """
+        queries = to_unit_vectors(lat, lon).reshape(-1, 3)
+        best_chord = np.full(len(queries), np.inf)
+        best_pos = np.full(len(queries), -1, dtype=np.int64)
+        if not len(self):
+            return best_pos, chord_to_km(best_chord)
+
+        for start in range(0, len(queries), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            best_pos[chunk], best_chord[chunk] = self._query_chunk(queries[chunk])
+        return self.order[best_pos], chord_to_km(best_chord)
+
+    def _query_chunk(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Runs query() for unit vectors, returns positions and chord distances"""
+        all_queries = np.arange(len(queries))
+
+        # A greedy descent into the nearest child gives a good first guess, which
+        # makes the exact search below skip most of the tree
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        for level in range(1, self.depth + 1):
+            children = 2 * nodes[:, None] + np.array([0, 1])
+            dists = self._box_distances(queries[:, None, :], level, children)
+            nodes = children[all_queries, dists.argmin(axis=1)]
+        best_chord = np.full(len(queries), np.inf)
+        best_pos = np.full(len(queries), -1, dtype=np.int64)
+        self._search_leaves(queries, all_queries, nodes, best_chord, best_pos)
+
+        query_idx, nodes = all_queries, np.zeros(len(queries), dtype=np.int64)
+        for level in range(1, self.depth + 1):
+            query_idx = np.repeat(query_idx, 2)
+            nodes = (2 * nodes[:, None] + np.array([0, 1])).reshape(-1)
+            near = (
+                self._box_distances(queries[query_idx], level, nodes)
+                < best_chord[query_idx]
+            )
+            query_idx, nodes = query_idx[near], nodes[near]
+        self._search_leaves(queries, query_idx, nodes, best_chord, best_pos)
+        return best_pos, best_chord
+
+    def _box_distances(
+        self, queries: np.ndarray, level: int, nodes: np.ndarray
+    ) -> np.ndarray:
+        """Distances from query points to bounding boxes of nodes of a level"""
+        mins, maxs = self.boxes[level]
+        gaps = np.maximum(mins[nodes] - queries, 0) + np.maximum(
+            queries - maxs[nodes], 0
+        )
+        return np.linalg.norm(gaps, axis=-1)
+
+    def _search_leaves(
+        self,
+        queries: np.ndarray,
+        query_idx: np.ndarray,
+        leaves: np.ndarray,
+        best_chord: np.ndarray,
+        best_pos: np.ndarray,
+    ):
+        """
+        Compares query points with the points of leaves, pairs of them are given by
+        query_idx and leaves sorted by query_idx. Updates best_chord and best_pos
+        in place.
+        """
+        starts = self._leaf_bounds[leaves]
+        counts = self._leaf_bounds[leaves + 1] - starts
+        total = counts.sum()
+        if not total:
+            return
+
+        # Expand every (query, leaf) pair into (query, point in the leaf) pairs
+        query_idx = np.repeat(query_idx, counts)
+        group_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        point_pos = np.repeat(starts, counts) + np.arange(total) - group_offsets
+        chords = np.linalg.norm(queries[query_idx] - self.points[point_pos], axis=1)
+
+        group_starts = np.flatnonzero(np.diff(query_idx, prepend=-1))
+        group_min = np.minimum.reduceat(chords, group_starts)
+        group_sizes = np.diff(group_starts, append=total)
+        is_min = np.flatnonzero(chords == np.repeat(group_min, group_sizes))
+        # Several points may be equally near, the first one wins
+        first_min = is_min[np.diff(query_idx[is_min], prepend=-1) != 0]
+
+        query_idx = query_idx[group_starts]
+        better = group_min < best_chord[query_idx]
+        best_chord[query_idx[better]] = group_min[better]
+        best_pos[query_idx[better]] = point_pos[first_min][better]
+
+
+def _level_bounds(size: int, level: int) -> np.ndarray:
+    """Slice bounds of the nodes of a level of NearestPointIndex"""
+    return np.arange(2 ** level + 1) * size // 2 ** level
@@ -0,0 +1,425 @@
+"""This module contains the interface of reverse geocoding services"""
+
+import asyncio
+import time
+from functools import partial
+from os import PathLike
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Type, Union
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+
+from utils.geo_utils import NearestPointIndex
+from utils.rate_limit_utils import report_bypass
+
+
+class GeocoderBackend:
+    """
+    A reverse geocoding service. Every backend answers single requests with
+    reverse(); a backend with a batch endpoint also sets batch_size and answers
+    many points per request with reverse_batch(). Backends are used as async
+    context managers, requests are only sent inside of "async with".
+
+    Backends are created by async_utils.get_addresses() and
+    async_utils.iter_addresses() through a factory called with a "session" keyword
+    argument, so a backend class itself or a functools.partial of it can be
+    passed as backend_factory.
+
+    Args:
+        session: an HTTP session shared with other API clients. If None, the
+            backend opens its own one if it needs it.
+    """
+
+    # Maximal amount of points in a single batch request, None if batch requests
+    # are not supported
+    batch_size: Optional[int] = None
+    # Whether requests are sent to a rate limited service, requests of a backend
+    # answering locally do not go through the rate limiter
+    rate_limited = True
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self.session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        """
+        Retrieves an address of a single point
+        Args:
+            lat: latitude
+            lon: longitude
+
+        Returns:
+            Address or None if nothing is found
+        """
+        raise NotImplementedError
+
+    async def reverse_batch(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> List[Union[str, None]]:
+        """
+        Retrieves addresses of up to batch_size points in a single request
+        Args:
+            coords: pairs latitude-longitude
+
+        Returns:
+            Addresses in the order of coords, None for points nothing is found for
+        """
+        raise NotImplementedError
+
+
+class FakeGeocoderBackend(GeocoderBackend):
+    """
+    An offline backend making up addresses out of coordinates. It supports batch
+    requests and counts them, which makes it suitable for tests and dry runs.
+
+    Args:
+        session: ignored, accepted for compatibility with other backends
+        batch_size: maximal amount of points in a batch request, None disables
+            batch requests
+        latency: seconds every request takes
+    """
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+        batch_size: Optional[int] = 1000,
+        latency=0.0,
+    ):
+        super().__init__(session)
+        self.batch_size = batch_size
+        self.latency = latency
+        self.requests = 0
+        self.points = 0
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        return (await self.reverse_batch([(lat, lon)]))[0]
+
+    async def reverse_batch(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> List[Union[str, None]]:
+        self.requests += 1
+        self.points += len(coords)
+        await asyncio.sleep(self.latency)
+        return [f"{lat:.5f}, {lon:.5f}" for lat, lon in coords]
+
+
+class Gazetteer:
+    """
+    A collection of named places indexed for nearest place queries.
+
+    Args:
+        addresses: an address of every place
+        lat: an array-like of latitudes of places
+        lon: an array-like of longitudes of places
+    """
+
+    def __init__(self, addresses: Iterable[str], lat, lon):
+        self.addresses = np.asarray(list(addresses), dtype=object)
+        self.index = NearestPointIndex(lat, lon)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def nearest(
+        self, lat, lon, max_distance: Optional[float] = None
+    ) -> List[Union[str, None]]:
+        """
+        Finds addresses of the nearest places for many points in one query
+        Args:
+            lat: an array-like of latitudes
+            lon: an array-like of longitudes
+            max_distance: places farther than this amount of kilometers are not
+                taken, None means any distance
+
+        Returns:
+            Addresses of the nearest places, None for points with no place near
+            enough
+        """
+        positions, distances = self.index.query(lat, lon)
+        found = positions >= 0
+        if max_distance is not None:
+            found &= distances <= max_distance
+        addresses = np.full(len(positions), None, dtype=object)
+        addresses[found] = self.addresses[positions[found]]
+        return addresses.tolist()
+
+
+def load_gazetteer(
+    path: Union[str, PathLike],
+    address_columns: Sequence[str] = ("name",),
+    lat_column="latitude",
+    lon_column="longitude",
+    **read_csv_kwargs,
+) -> Gazetteer:
+    """
+    Loads a gazetteer from a CSV file with a row per place, e.g. a GeoNames dump
+    or an extract of OpenStreetMap places. Rows with invalid coordinates are
+    skipped.
+    Args:
+        path: path to the file
+        address_columns: columns making up an address of a place, non-empty
+            values are joined with commas
+        lat_column: a column holding latitudes
+        lon_column: a column holding longitudes
+        **read_csv_kwargs: passed to pandas.read_csv(), e.g. sep="\t",
+            header=None and names=[...] for GeoNames dumps
+
+    Returns:
+        Gazetteer object
+    """
+    address_columns = list(address_columns)
+    places = pd.read_csv(
+        path,
+        usecols=[*address_columns, lat_column, lon_column],
+        dtype={column: str for column in address_columns},
+        **read_csv_kwargs,
+    )
+    lat = pd.to_numeric(places[lat_column], errors="coerce")
+    lon = pd.to_numeric(places[lon_column], errors="coerce")
+    valid = lat.between(-90, 90) & lon.between(-180, 180)
+    places = places[valid]
+
+    addresses = [
+        ", ".join(part for part in parts if part)
+        for parts in places[address_columns].fillna("").itertuples(index=False)
+    ]
+    return Gazetteer(addresses, lat[valid].to_numpy(), lon[valid].to_numpy())
+
+
+class OfflineGeocoderBackend(GeocoderBackend):
+    """
+    An offline backend taking the address of the nearest place of a gazetteer.
+    Points asked for within one iteration of the event loop, e.g. by batches of
+    all the cities sharing the backend, are resolved by a single vectorized query
+    in a worker thread.
+
+    Args:
+        session: ignored, accepted for compatibility with other backends
+        gazetteer: places to take addresses from, see load_gazetteer()
+        max_distance: places farther than this amount of kilometers are not
+            taken, None means any distance
+        batch_size: maximal amount of points in a single request, requests made
+            at once are still resolved by one query
+    """
+
+    rate_limited = False
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+        gazetteer: Optional[Gazetteer] = None,
+        max_distance: Optional[float] = None,
+        batch_size=100_000,
+    ):
+        super().__init__(session)
+        if gazetteer is None:
+            raise ValueError("A gazetteer is required for offline geocoding")
+        self.gazetteer = gazetteer
+        self.max_distance = max_distance
+        self.batch_size = batch_size
+        self.queries = 0
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        return (await self.reverse_batch([(lat, lon)]))[0]
+
+    async def reverse_batch(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> List[Union[str, None]]:
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._query)
+        future = loop.create_future()
+        self._pending.append(
+            (np.asarray(coords, dtype=np.float64).reshape(-1, 2), future)
+        )
+        return await future
+
+    def _query(self):
+        pending, self._pending = self._pending, []
+        self.queries += 1
+        coords = np.concatenate([points for points, _ in pending])
+        query = asyncio.get_running_loop().run_in_executor(
+            None, self.gazetteer.nearest, coords[:, 0], coords[:, 1], self.max_distance
+        )
+        query.add_done_callback(partial(_split_answers, pending))
+
+
+def _split_answers(
+    pending: List[Tuple[np.ndarray, asyncio.Future]], query: asyncio.Future
+):
+    """Hands addresses found by a merged query to the requests it merged"""
+    error = query.exception()
+    start = 0
+    for points, future in pending:
+        stop = start + len(points)
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(query.result()[start:stop])
+        start = stop
+
+
+class SharedGeocoderBackend(GeocoderBackend):
+    """
+    A backend shared by many get_addresses() calls, e.g. by all the cities of
+    pipeline_utils.process_cities(), so that the state of the wrapped backend
+    lasts for the whole run: the cooldown of FallbackGeocoderBackend applies to
+    all the cities, and OfflineGeocoderBackend merges requests of all of them.
+    The wrapped backend is entered by the first "async with" and exited by
+    close(), entering and exiting the shared one once again does nothing.
+
+    Args:
+        session: an HTTP session the wrapped backend is created with
+        backend_factory: creates the wrapped backend, see GeocoderBackend
+    """
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+        backend_factory: Callable[..., GeocoderBackend] = None,
+    ):
+        super().__init__(session)
+        self.backend = backend_factory(session=session)
+        self.batch_size = self.backend.batch_size
+        self._entered: Optional[asyncio.Future] = None
+
+    async def __aenter__(self):
+        if self._entered is None:
+            self._entered = asyncio.ensure_future(self.backend.__aenter__())
+        await asyncio.shield(self._entered)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def close(self):
+        """Exits the wrapped backend if it was entered"""
+        entered, self._entered = self._entered, None
+        if entered is None:
+            return
+        try:
+            await entered
+        except Exception:
+            # The error was raised to the caller entering the backend, and a
+            # backend failing to enter has nothing to exit
+            return
+        await self.backend.__aexit__(None, None, None)
+
+    @property
+    def rate_limited(self):
+        return self.backend.rate_limited
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        return await self.backend.reverse(lat, lon)
+
+    async def reverse_batch(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> List[Union[str, None]]:
+        return await self.backend.reverse_batch(coords)
+
+
+class FallbackAddress(str):
+    """
+    An address answered by the fallback backend of FallbackGeocoderBackend. It is
+    a provisional answer: it is not cached and its hotel is geocoded again by the
+    next run.
+    """
+
+
+class FallbackGeocoderBackend(GeocoderBackend):
+    """
+    A backend sending requests to a primary backend and switching to a fallback
+    one while the primary is throttling or unavailable. After a failure, all the
+    requests go to the fallback backend for cooldown seconds, then the primary
+    one is tried again. Addresses answered by the fallback backend are returned
+    as FallbackAddress, so that they are not cached in place of primary ones.
+    While the fallback backend is in use, requests skip the rate limiter if the
+    fallback one is not rate limited. Failures of the primary backend and fallback
+    answers of calls already sent through the limiter are reported to it, see
+    rate_limit_utils.report_bypass().
+
+    Args:
+        session: an HTTP session passed to both backends
+        primary_factory: creates the primary backend, e.g. async_utils.HereBackend
+        fallback_factory: creates the fallback backend, e.g. a functools.partial of
+            OfflineGeocoderBackend
+        cooldown: seconds the fallback backend is used for after a failure
+        fallback_on: exceptions of the primary backend causing the switch
+    """
+
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+        primary_factory: Callable[..., GeocoderBackend] = None,
+        fallback_factory: Callable[..., GeocoderBackend] = None,
+        cooldown=60.0,
+        fallback_on: Tuple[Type[BaseException], ...] = (
+            GeocoderRateLimited,
+            GeocoderTimedOut,
+            GeocoderUnavailable,
+        ),
+    ):
+        super().__init__(session)
+        self.primary = primary_factory(session=session)
+        self.fallback = fallback_factory(session=session)
+        self.batch_size = self.primary.batch_size
+        self.cooldown = cooldown
+        self.fallback_on = fallback_on
+        self.fallbacks = 0
+        self._primary_after = 0.0
+
+    async def __aenter__(self):
+        await self.primary.__aenter__()
+        await self.fallback.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.fallback.__aexit__(exc_type, exc_val, exc_tb)
+        await self.primary.__aexit__(exc_type, exc_val, exc_tb)
+
+    @property
+    def rate_limited(self):
+        if time.monotonic() >= self._primary_after:
+            return self.primary.rate_limited
+        return self.fallback.rate_limited
+
+    async def reverse(self, lat: float, lon: float) -> Union[str, None]:
+        if time.monotonic() >= self._primary_after:
+            try:
+                return await self.primary.reverse(lat, lon)
+            except self.fallback_on:
+                self._primary_after = time.monotonic() + self.cooldown
+                report_bypass(throttled=True)
+        report_bypass()
+        self.fallbacks += 1
+        return _as_fallback(await self.fallback.reverse(lat, lon))
+
+    async def reverse_batch(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> List[Union[str, None]]:
+        if time.monotonic() >= self._primary_after:
+            try:
+                return await self.primary.reverse_batch(coords)
+            except self.fallback_on:
+                self._primary_after = time.monotonic() + self.cooldown
+                report_bypass(throttled=True)
+        report_bypass()
+        self.fallbacks += len(coords)
+        if self.fallback.batch_size is None:
+            addresses = [await self.fallback.reverse(lat, lon) for lat, lon in coords]
+        else:
+            addresses = await self.fallback.reverse_batch(coords)
+        return [_as_fallback(address) for address in addresses]
+
+
+def _as_fallback(address: Optional[str]) -> Optional[FallbackAddress]:
+    return None if address is None else FallbackAddress(address)
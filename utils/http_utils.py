@@ -0,0 +1,57 @@
+"""This module contains the HTTP transport shared by all the API clients"""
+
+import aiohttp
+from geopy.adapters import AioHTTPAdapter
+
+
+def make_client_session(
+    limit=100, limit_per_host=20, dns_ttl=300, keepalive_timeout=30, timeout=30
+) -> aiohttp.ClientSession:
+    """
+    Creates an HTTP session with a tuned connection pool. Must be called inside a
+    running event loop and closed by the caller, e.g. with "async with".
+    Args:
+        limit: maximal amount of simultaneously open connections, 0 for unlimited
+        limit_per_host: maximal amount of simultaneously open connections to the
+            same host, 0 for unlimited
+        dns_ttl: seconds resolved host addresses are cached for
+        keepalive_timeout: seconds an idle connection is kept open for reuse
+        timeout: total timeout of a single request in seconds
+
+    Returns:
+    ClientSession object
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_ttl,
+        keepalive_timeout=keepalive_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        trust_env=False,
+    )
+
+
+class SharedSessionAdapter(AioHTTPAdapter):
+    """
+    A geopy adapter sending requests through an existing aiohttp session instead
+    of creating its own one. The session is owned by the caller and is not closed
+    when a geocoder exits. Use it as
+    adapter_factory=functools.partial(SharedSessionAdapter, session=session).
+
+    Args:
+        proxies: passed by geopy, see AioHTTPAdapter
+        ssl_context: passed by geopy, see AioHTTPAdapter
+        session: the session to be reused
+    """
+
+    def __init__(self, *, proxies, ssl_context, session: aiohttp.ClientSession):
+        super().__init__(proxies=proxies, ssl_context=ssl_context)
+        # AioHTTPAdapter.session is a lazy property reading the instance dictionary
+        self.__dict__["session"] = session
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
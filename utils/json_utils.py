@@ -0,0 +1,50 @@
+"""
+This module contains JSON encoding and decoding, which is done with orjson when it
+is installed and with the standard json module otherwise
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decodes a JSON document. Raw bytes of an HTTP response body can be passed as is,
+    without decoding them into a string first.
+    Args:
+        data: a JSON document
+
+    Returns:
+    Decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """
+    Encodes an object as a compact JSON string
+    Args:
+        obj: a JSON-serializable object, numpy values are allowed
+
+    Returns:
+    JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+    return json.dumps(obj, default=_numpy_default)
+
+
+def _numpy_default(obj: Any) -> Any:
+    """Converts numpy values the standard json module can't encode"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,236 @@
+"""
+This module contains functions for manifests of city output directories, which
+make runs incremental and resumable
+"""
+
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+
+# Hotel columns identifying the input of a hotel, its address is derived from them
+HOTEL_KEY_COLUMNS = ["Name", "Latitude", "Longitude"]
+
+
+def hotel_row_hashes(hotels: pd.DataFrame) -> np.ndarray:
+    """
+    Hashes every hotel by its name and coordinates
+    Args:
+        hotels: a DataFrame with "Name", "Latitude" and "Longitude" columns
+
+    Returns:
+        Array of uint64 hashes, one per row
+    """
+    keys = hotels[HOTEL_KEY_COLUMNS].astype({"Name": object})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def digest(row_hashes: np.ndarray) -> str:
+    """
+    Combines row hashes into a single order-sensitive digest
+    Args:
+        row_hashes: an array of uint64 hashes
+
+    Returns:
+        Hex digest
+    """
+    return hashlib.sha1(np.ascontiguousarray(row_hashes, np.uint64)).hexdigest()
+
+
+def chunk_digests(row_hashes: np.ndarray, chunk_size=100) -> List[str]:
+    """
+    Computes a digest of every chunk of rows as they are split by
+    file_utils.save_dataframe_as_csv_splitted()
+    Args:
+        row_hashes: an array of uint64 hashes
+        chunk_size: a length of each chunk
+
+    Returns:
+        Digests of chunks in order
+    """
+    return [
+        digest(row_hashes[start : start + chunk_size])
+        for start in range(0, len(row_hashes), chunk_size)
+    ]
+
+
+def load_manifest(save_dir: Path) -> dict:
+    """
+    Reads the manifest of a city output directory
+    Args:
+        save_dir: a city output directory
+
+    Returns:
+        Manifest contents, an empty dictionary if there is no valid manifest
+    """
+    try:
+        with open(save_dir / MANIFEST_NAME) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(save_dir: Path, manifest: dict):
+    """
+    Writes the manifest of a city output directory. The file is replaced
+    atomically, so an interrupted run never leaves a broken manifest.
+    Args:
+        save_dir: a city output directory
+        manifest: manifest contents
+
+    Returns:
+        None
+    """
+    tmp_path = save_dir / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(tmp_path, save_dir / MANIFEST_NAME)
+
+
+def make_manifest(
+    row_hashes: np.ndarray,
+    chunk_size: int,
+    weather: pd.DataFrame,
+    weather_fetched_at: datetime,
+    today: date,
+    name_prefix="hotels",
+    provisional_rows: Iterable[int] = (),
+) -> dict:
+    """
+    Makes a manifest describing the outputs of a city
+    Args:
+        row_hashes: hashes of the city hotels, see hotel_row_hashes()
+        chunk_size: maximal amount of hotels in a chunk file
+        weather: weather of the city with "date", "max_temp", "min_temp" columns
+        weather_fetched_at: UTC time the weather was fetched at
+        today: the UTC date of the run the weather was fetched by
+        name_prefix: common name prefix of hotel chunk files
+        provisional_rows: positions of hotels whose saved addresses are not to be
+            kept, e.g. answers of a fallback geocoder. Their chunks are recorded
+            without a digest, so the next run rewrites them and geocodes those
+            hotels again.
+
+    Returns:
+        Manifest contents
+    """
+    provisional_rows = sorted(provisional_rows)
+    provisional_chunks = {row // chunk_size for row in provisional_rows}
+    return {
+        "hotels_hash": digest(row_hashes),
+        "hotels_count": len(row_hashes),
+        "chunk_size": chunk_size,
+        "chunks": {
+            f"{name_prefix}_{idx:04d}.csv": (
+                None if idx in provisional_chunks else chunk_hash
+            )
+            for idx, chunk_hash in enumerate(chunk_digests(row_hashes, chunk_size))
+        },
+        "provisional_hotels": row_hashes[provisional_rows].tolist(),
+        "weather_fetched_at": weather_fetched_at.isoformat(),
+        "weather_date": today.isoformat(),
+        "weather": [
+            {
+                "date": str(row_date),
+                "max_temp": max_temp,
+                "min_temp": min_temp,
+            }
+            for row_date, max_temp, min_temp in zip(
+                weather["date"], weather["max_temp"], weather["min_temp"]
+            )
+        ],
+    }
+
+
+def manifest_weather(manifest: dict, today: date) -> Optional[pd.DataFrame]:
+    """
+    Takes the weather stored in a manifest if it was fetched by a run of the same
+    date
+    Args:
+        manifest: manifest contents
+        today: the current UTC date
+
+    Returns:
+        DataFrame with "date", "max_temp", "min_temp" columns or None if the
+        manifest has no weather fetched today
+    """
+    if manifest.get("weather_date") != today.isoformat():
+        return None
+    return pd.DataFrame(
+        {
+            "date": [
+                date.fromisoformat(row["date"][:10]) for row in manifest["weather"]
+            ],
+            "max_temp": [row["max_temp"] for row in manifest["weather"]],
+            "min_temp": [row["min_temp"] for row in manifest["weather"]],
+        }
+    )
+
+
+def changed_chunks(
+    manifest: dict, row_hashes: np.ndarray, chunk_size: int, save_dir: Path
+) -> List[int]:
+    """
+    Finds hotel chunk files which have to be (re)written
+    Args:
+        manifest: manifest of the previous run
+        row_hashes: hashes of the current city hotels
+        chunk_size: maximal amount of hotels in a chunk file
+        save_dir: a city output directory
+
+    Returns:
+        Numbers of chunks whose hotels changed or whose files are missing
+    """
+    old_chunks = (
+        manifest.get("chunks", {}) if manifest.get("chunk_size") == chunk_size else {}
+    )
+    old_names = list(old_chunks)
+    old_hashes = list(old_chunks.values())
+    return [
+        idx
+        for idx, chunk_hash in enumerate(chunk_digests(row_hashes, chunk_size))
+        if idx >= len(old_hashes)
+        or old_hashes[idx] != chunk_hash
+        or not (save_dir / old_names[idx]).exists()
+    ]
+
+
+def known_addresses(
+    manifest: dict, save_dir: Path, unchanged_chunks: Iterable[int] = ()
+) -> Dict[int, str]:
+    """
+    Reads addresses of hotels saved by the previous run, except for provisional
+    ones, see make_manifest()
+    Args:
+        manifest: manifest of the previous run
+        save_dir: a city output directory
+        unchanged_chunks: numbers of chunks holding the same hotels as in the
+            previous run, see changed_chunks(). Their files are not read, since
+            they can't hold hotels of the changed chunks.
+
+    Returns:
+        A dictionary of {hotel_row_hash: address}
+    """
+    unchanged_chunks = set(unchanged_chunks)
+    chunk_paths = [
+        save_dir / name
+        for idx, name in enumerate(manifest.get("chunks", {}))
+        if idx not in unchanged_chunks and (save_dir / name).exists()
+    ]
+    if not chunk_paths:
+        return {}
+
+    old_hotels = pd.concat(
+        pd.read_csv(path, index_col=0, float_precision="round_trip")
+        for path in chunk_paths
+    )
+    addresses = dict(zip(hotel_row_hashes(old_hotels).tolist(), old_hotels["Address"]))
+    for row_hash in manifest.get("provisional_hotels", []):
+        addresses.pop(row_hash, None)
+    return addresses
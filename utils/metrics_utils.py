@@ -0,0 +1,305 @@
+"""
+This module contains collection of run metrics: time, memory and row counts of
+pipeline stages and counts and latencies of HTTP requests. Metrics are written as
+JSON and optionally as a Prometheus textfile.
+"""
+
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+from os import PathLike
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Union
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# Upper bounds of request latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_PREFIX = "weather_monitoring"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Takes the peak resident set size of the current process
+    Returns:
+        Megabytes, None if the platform does not report it
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+class Histogram:
+    """
+    Counts observed values falling into buckets, like a Prometheus histogram
+    Args:
+        buckets: sorted upper bounds of buckets, an infinite one is added
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> Dict[str, int]:
+        """Returns counts of values not above every bucket bound, keyed by it"""
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative["+Inf" if bound == math.inf else repr(bound)] = total
+        return cumulative
+
+
+class RunMetrics:
+    """
+    Metrics of a single run. Stages are measured with stage() or timed(); a stage
+    may run many times, e.g. once per city, then its time and rows are summed up.
+    Times of stages running concurrently overlap, so they may add up to more than
+    the time of the run. HTTP clients report every request with
+    observe_request().
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.requests: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[dict]:
+        """
+        Measures a stage run in a "with" block. The record also keeps the peak
+        resident set size the process has reached by the end of the last run of
+        the stage. It is not a peak of the stage itself: stages run after the peak
+        of the process all report that peak.
+        Args:
+            name: name of the stage
+            rows: amount of rows processed, may also be added to "rows" of the
+                yielded record inside the block
+
+        Yields:
+            The record of the stage
+        """
+        record = self.stages.setdefault(
+            name,
+            {
+                "seconds": 0.0,
+                "calls": 0,
+                "rows": 0,
+                "process_peak_rss_mb_so_far": None,
+            },
+        )
+        record["rows"] += rows or 0
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            record["calls"] += 1
+            record["process_peak_rss_mb_so_far"] = peak_rss_mb()
+
+    async def timed(
+        self, name: str, awaitable: Awaitable, rows: Optional[int] = None
+    ) -> Any:
+        """
+        Measures a stage run by an awaitable, e.g. one of several gathered at once
+        Args:
+            name: name of the stage
+            awaitable: a coroutine or a future running the stage
+            rows: amount of rows processed
+
+        Returns:
+        The result of awaitable
+        """
+        with self.stage(name, rows):
+            return await awaitable
+
+    def observe_request(self, endpoint: str, seconds: float, error=False):
+        """
+        Records a single HTTP request
+        Args:
+            endpoint: a short name of the API endpoint
+            seconds: time the request took
+            error: whether the request failed
+
+        Returns:
+            None
+        """
+        record = self._request_record(endpoint)
+        record["requests"] += 1
+        record["errors"] += bool(error)
+        record["latency"].observe(seconds)
+
+    @contextmanager
+    def request(self, endpoint: str) -> Iterator[None]:
+        """
+        Measures an HTTP request sent in a "with" block, an exception raised in it
+        counts as an error
+        Args:
+            endpoint: a short name of the API endpoint
+        """
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe_request(endpoint, time.perf_counter() - start, error)
+
+    def add_retries(self, endpoint: str, retries: int):
+        """Records retries of requests to an endpoint, e.g. done by a rate limiter"""
+        self._request_record(endpoint)["retries"] += retries
+
+    def _request_record(self, endpoint: str) -> Dict[str, Any]:
+        return self.requests.setdefault(
+            endpoint, {"requests": 0, "errors": 0, "retries": 0, "latency": Histogram()}
+        )
+
+    def to_dict(self) -> dict:
+        """Returns metrics as a JSON-serializable dictionary"""
+        return {
+            "started_at": self.started_at,
+            "wall_seconds": time.perf_counter() - self._started,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+            "requests": {
+                endpoint: {
+                    "requests": record["requests"],
+                    "errors": record["errors"],
+                    "retries": record["retries"],
+                    "latency_seconds_sum": record["latency"].sum,
+                    "latency_buckets": record["latency"].cumulative_counts(),
+                }
+                for endpoint, record in self.requests.items()
+            },
+        }
+
+    def save_json(self, path: Union[str, PathLike]):
+        """Writes metrics into a JSON file"""
+        _write_atomically(path, json.dumps(self.to_dict(), indent=2))
+
+    def save_prometheus(self, path: Union[str, PathLike]):
+        """
+        Writes metrics into a textfile of the Prometheus node exporter textfile
+        collector
+        """
+        prefix = PROMETHEUS_PREFIX
+        lines = [
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {time.perf_counter() - self._started}",
+        ]
+        stage_metrics = [
+            ("stage_seconds", "seconds"),
+            ("stage_calls", "calls"),
+            ("stage_rows", "rows"),
+            (
+                "stage_process_peak_rss_so_far_megabytes",
+                "process_peak_rss_mb_so_far",
+            ),
+        ]
+        for metric, key in stage_metrics:
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            lines.extend(
+                f'{prefix}_{metric}{{stage="{name}"}} {record[key]}'
+                for name, record in self.stages.items()
+                if record[key] is not None
+            )
+        for metric in ["requests", "errors", "retries"]:
+            lines.append(f"# TYPE {prefix}_http_{metric}_total counter")
+            lines.extend(
+                f'{prefix}_http_{metric}_total{{endpoint="{endpoint}"}} '
+                f"{record[metric]}"
+                for endpoint, record in self.requests.items()
+            )
+        lines.append(f"# TYPE {prefix}_http_request_duration_seconds histogram")
+        for endpoint, record in self.requests.items():
+            histogram = record["latency"]
+            lines.extend(
+                f"{prefix}_http_request_duration_seconds_bucket"
+                f'{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                for bound, count in histogram.cumulative_counts().items()
+            )
+            lines.append(
+                f'{prefix}_http_request_duration_seconds_sum{{endpoint="{endpoint}"}} '
+                f"{histogram.sum}"
+            )
+            lines.append(
+                f"{prefix}_http_request_duration_seconds_count"
+                f'{{endpoint="{endpoint}"}} {histogram.count}'
+            )
+        _write_atomically(path, "\n".join(lines) + "\n")
+
+
+# Metrics of the current run, reported to by the HTTP clients and the pipeline
+METRICS = RunMetrics()
+
+
+def run_profiled(
+    func: Callable, output_dir: Union[str, PathLike], *args, top=40, **kwargs
+) -> Any:
+    """
+    Runs a function under cProfile and tracemalloc and saves their reports into
+    output_dir: "profile.pstats" to be loaded with pstats or snakeviz,
+    "profile.txt" with the functions taking the most cumulative time and
+    "memory.txt" with the peak traced memory and the largest allocation sites.
+    Args:
+        func: a function to be run
+        output_dir: a directory for the reports
+        *args: positional arguments for func
+        top: amount of functions and allocation sites listed in the reports
+        **kwargs: keyword arguments for func
+
+    Returns:
+    The result of func
+    """
+    # Profilers are only needed with --profile, importing them slows startup down
+    import cProfile
+    import pstats
+
+    output_dir = Path(output_dir)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(output_dir / "profile.pstats")
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+        (output_dir / "profile.txt").write_text(report.getvalue())
+
+        lines = [f"Peak traced memory: {peak / 2 ** 20:.1f} MB", ""]
+        lines.extend(
+            str(statistic) for statistic in snapshot.statistics("lineno")[:top]
+        )
+        (output_dir / "memory.txt").write_text("\n".join(lines) + "\n")
+
+
+def _write_atomically(path: Union[str, PathLike], text: str):
+    """Replaces a file at once, so that readers never see a partial one"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as output_file:
+        output_file.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,275 @@
+"""
+This module contains the pipeline fetching remote data for cities and saving their
+outputs as soon as the data of a city is complete
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from os import PathLike
+from typing import Dict, List, Optional, Tuple, Union
+
+import aiohttp
+import pandas as pd
+
+from utils.async_utils import HereBackend, WeatherBatcher, get_addresses
+from utils.dataframe_utils import draw_and_save_temp_graph_timed
+from utils.file_utils import city_output_dir, save_city_output
+from utils.geocoder_utils import FallbackAddress, SharedGeocoderBackend
+from utils.http_utils import make_client_session
+from utils.manifest_utils import (
+    changed_chunks,
+    digest,
+    hotel_row_hashes,
+    known_addresses,
+    load_manifest,
+    make_manifest,
+    manifest_weather,
+    save_manifest,
+)
+from utils.metrics_utils import METRICS
+from utils.weather_utils import build_weather_table, crop_weather_table
+
+
+async def process_city(
+    country: str,
+    city: str,
+    center: Tuple[float, float],
+    city_hotels: pd.DataFrame,
+    session: aiohttp.ClientSession,
+    output_dir: Union[str, PathLike],
+    today: date,
+    executors: Tuple[Executor, Executor],
+    weather_batcher: WeatherBatcher,
+    geocoding_kwargs: dict,
+    resume=True,
+    chunk_size=100,
+) -> Tuple[pd.DataFrame, Optional[float]]:
+    """
+    Fetches weather and hotels' addresses of a single city concurrently, then saves
+    its hotels, center coordinates and temperature plot.
+
+    Outputs are described by a manifest in the city directory. When resuming, only
+    the work invalidated since the previous run is done: weather fetched today is
+    reused along with its plot, only hotels not saved before are geocoded and only
+    the chunk files whose hotels changed are rewritten.
+    Args:
+        country: country code
+        city: city name
+        center: latitude and longitude of the city center
+        city_hotels: a DataFrame with "Name", "Latitude" and "Longitude" of hotels
+        session: an HTTP session shared by all the cities
+        output_dir: the root output directory
+        today: the current UTC date, weather is cropped with a 5-day window around it
+        executors: a pool for writing files and a pool for rendering plots
+        weather_batcher: fetches weather of the city along with the other cities
+            asking for it at the same time
+        geocoding_kwargs: keyword arguments for async_utils.get_addresses()
+        resume: whether to reuse outputs of a previous run, if False everything is
+            fetched and written anew
+        chunk_size: maximal amount of hotels in a single file
+
+    Returns:
+    Weather of the city and the time spent on rendering its plot in seconds, None
+        if the plot was not rendered
+    """
+    loop = asyncio.get_running_loop()
+    writer, renderer = executors
+
+    save_dir = city_output_dir(output_dir, country, city)
+    manifest = load_manifest(save_dir) if resume else {}
+    row_hashes = hotel_row_hashes(city_hotels)
+    stale_chunks = changed_chunks(manifest, row_hashes, chunk_size, save_dir)
+    hotels_changed = (
+        manifest.get("hotels_hash") != digest(row_hashes)
+        or manifest.get("center") != list(center)
+        or bool(stale_chunks)
+    )
+    weather = manifest_weather(manifest, today)
+    weather_changed = (
+        weather is None
+        or not (save_dir / f"weather_{city.lower()}_{country.lower()}.png").exists()
+    )
+
+    addresses, unknown_rows = None, []
+    if hotels_changed:
+        chunk_count = -(-len(row_hashes) // chunk_size)
+        saved_addresses = known_addresses(
+            manifest, save_dir, set(range(chunk_count)).difference(stale_chunks)
+        )
+        addresses = [saved_addresses.get(row_hash) for row_hash in row_hashes.tolist()]
+        unknown_rows = [
+            row
+            for chunk_id in stale_chunks
+            for row in range(
+                chunk_id * chunk_size, min((chunk_id + 1) * chunk_size, len(addresses))
+            )
+            if row_hashes[row] not in saved_addresses
+        ]
+    if weather is None:
+        weather_fetched_at = datetime.utcnow()
+    else:
+        weather_fetched_at = datetime.fromisoformat(manifest["weather_fetched_at"])
+    if not hotels_changed and not weather_changed:
+        return weather, None
+
+    fetched_weather, new_addresses = await asyncio.gather(
+        METRICS.timed("weather", weather_batcher(*center), rows=1)
+        if weather is None
+        else asyncio.sleep(0),
+        METRICS.timed(
+            "geocode",
+            get_addresses(
+                city_hotels[["Latitude", "Longitude"]].values[unknown_rows],
+                session=session,
+                **geocoding_kwargs,
+            ),
+            rows=len(unknown_rows),
+        )
+        if unknown_rows
+        else asyncio.sleep(0, []),
+    )
+    if weather is None:
+        weather = fetched_weather
+    for row, address in zip(unknown_rows, new_addresses):
+        addresses[row] = address
+
+    save_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    if hotels_changed:
+        jobs.append(
+            METRICS.timed(
+                "write",
+                loop.run_in_executor(
+                    writer,
+                    partial(save_city_output, chunk_ids=stale_chunks),
+                    city_hotels.assign(Address=addresses),
+                    center,
+                    save_dir,
+                    chunk_size,
+                ),
+                rows=len(city_hotels),
+            )
+        )
+    if weather_changed:
+        city_weather = crop_weather_table(
+            build_weather_table({(country, city): weather}), today, days=5
+        )
+        jobs.append(
+            METRICS.timed(
+                "plot",
+                loop.run_in_executor(
+                    renderer,
+                    draw_and_save_temp_graph_timed,
+                    (city_weather, save_dir, f"{city}_{country}", today),
+                ),
+                rows=len(city_weather),
+            )
+        )
+    results = await asyncio.gather(*jobs)
+
+    # Fallback answers are saved, but the hotels are geocoded again by the next run
+    manifest = make_manifest(
+        row_hashes,
+        chunk_size,
+        weather,
+        weather_fetched_at,
+        today,
+        provisional_rows=[
+            row
+            for row, address in zip(unknown_rows, new_addresses)
+            if isinstance(address, FallbackAddress)
+        ],
+    )
+    manifest["center"] = list(center)
+    save_manifest(save_dir, manifest)
+    return weather, results[-1] if weather_changed else None
+
+
+async def process_cities(
+    hotels: pd.DataFrame,
+    centers: pd.DataFrame,
+    output_dir: Union[str, PathLike],
+    today: date,
+    session_settings: dict,
+    weather_kwargs: dict,
+    geocoding_kwargs: dict,
+    writer_threads=8,
+    workers=1,
+    resume=True,
+) -> Tuple[Dict[Tuple[str, str], pd.DataFrame], List[float]]:
+    """
+    Runs process_city() for all the cities in a single event loop. Weather and
+    geocoding requests of all the cities run concurrently through one HTTP session,
+    and outputs of a city are written as soon as its data is complete. Weather of
+    the cities starting at once is fetched in a batch and parsed together, see
+    async_utils.WeatherBatcher. All the cities share a single geocoding backend,
+    see geocoder_utils.SharedGeocoderBackend.
+    Args:
+        hotels: a DataFrame with "Country", "City", "Name", "Latitude" and
+            "Longitude" columns
+        centers: a DataFrame with "Country", "City", "Latitude" and "Longitude"
+            columns, one row per city
+        output_dir: the root output directory
+        today: the current date
+        session_settings: keyword arguments for http_utils.make_client_session()
+        weather_kwargs: keyword arguments for async_utils.get_weather_bulk()
+        geocoding_kwargs: keyword arguments for async_utils.get_addresses(). Pass a
+            rate limiter here, so that the rate is shared by all the cities.
+        writer_threads: amount of threads writing output files
+        workers: amount of processes rendering plots, 1 renders them in a thread
+        resume: whether to reuse outputs of a previous run, see process_city()
+
+    Returns:
+    A dictionary of {(country, city): weather_in_city_df} in the order of centers
+        and rendering time of every rendered plot in seconds
+    """
+    hotel_rows = hotels.groupby(["Country", "City"], sort=False, observed=True).indices
+    city_keys = list(zip(centers["Country"], centers["City"]))
+    city_centers = list(zip(centers["Latitude"], centers["Longitude"]))
+
+    # Matplotlib is not thread-safe, so plots are never rendered by several threads.
+    # Renderer processes are spawned, since forking a process already running the
+    # writer threads and the event loop may deadlock.
+    renderer = (
+        ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        if workers > 1
+        else ThreadPoolExecutor(1)
+    )
+    with ThreadPoolExecutor(writer_threads) as writer, renderer:
+        async with make_client_session(**session_settings) as session:
+            weather_batcher = WeatherBatcher(session, **weather_kwargs)
+            backend = SharedGeocoderBackend(
+                session, geocoding_kwargs.get("backend_factory", HereBackend)
+            )
+            city_geocoding_kwargs = {
+                **geocoding_kwargs,
+                "backend_factory": lambda session: backend,
+            }
+            try:
+                results = await asyncio.gather(
+                    *[
+                        process_city(
+                            country,
+                            city,
+                            center,
+                            hotels.iloc[hotel_rows[(country, city)]],
+                            session,
+                            output_dir,
+                            today,
+                            (writer, renderer),
+                            weather_batcher,
+                            city_geocoding_kwargs,
+                            resume,
+                        )
+                        for (country, city), center in zip(city_keys, city_centers)
+                    ]
+                )
+            finally:
+                await backend.close()
+
+    weather_per_city = {key: weather for key, (weather, _) in zip(city_keys, results)}
+    chart_times = [chart_time for _, chart_time in results if chart_time is not None]
+    return weather_per_city, chart_times
@@ -0,0 +1,171 @@
+"""This module contains an adaptive rate limiter for API calls"""
+
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+# Set by report_bypass() while AdaptiveRateLimiter runs a call: False if the call
+# bypassed the limited service, True if it did so after being throttled
+_bypass: ContextVar[Optional[bool]] = ContextVar("bypass", default=None)
+
+
+def report_bypass(throttled=False):
+    """
+    Tells the limiter running the current call that the call was not answered by
+    the limited service, e.g. it was answered by a fallback. The rate is not
+    increased by such a call, and unless throttled, its token is given back. Does
+    nothing outside of a limiter call.
+    Args:
+        throttled: whether the service was throttling or failing before the call
+            bypassed it. The rate is then cut as if the call was throttled.
+
+    Returns:
+        None
+    """
+    if throttled or _bypass.get() is None:
+        _bypass.set(throttled)
+
+
+class AdaptiveRateLimiter:
+    """
+    A token bucket rate limiter which adjusts its rate with AIMD (additive
+    increase, multiplicative decrease) control. Every successful call raises the
+    rate so that it grows by increase_step requests per second each second. A
+    throttled call (one raising any of retry_on exceptions) or a call slower than
+    latency_target cuts the rate by decrease_factor, at most once per window of
+    calls already in flight. Throttled calls are retried with exponential backoff.
+    A call answered without the limited service reports it with report_bypass(),
+    so that the rate follows the service only.
+
+    Being independent from the event loop until the first call, a limiter can be
+    created outside of asyncio.run() and inspected after it.
+
+    Args:
+        initial_rate: starting rate in requests per second
+        min_rate: the rate never goes below this value
+        max_rate: the rate never goes above this value
+        max_in_flight: maximal amount of calls running at the same time
+        increase_step: additive increase of the rate per second of successful calls
+        decrease_factor: the rate is multiplied by this value on throttling
+        latency_target: calls slower than this amount of seconds count as throttled
+        max_retries: amount of retries of a throttled call before giving up
+        backoff: delay before the first retry in seconds, doubled on each next one
+        retry_on: exceptions signalling throttling or a timeout
+    """
+
+    def __init__(
+        self,
+        initial_rate=1.0,
+        min_rate=0.1,
+        max_rate=50.0,
+        max_in_flight=10,
+        increase_step=0.5,
+        decrease_factor=0.5,
+        latency_target=5.0,
+        max_retries=3,
+        backoff=1.0,
+        retry_on: Tuple[Type[BaseException], ...] = (asyncio.TimeoutError,),
+    ):
+        self.rate = float(initial_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_in_flight = max_in_flight
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+
+        self._tokens = 1.0
+        self._refilled_at = None
+        self._decreased_at_request = -1
+        self._lock = None
+        self._semaphore = None
+
+    async def __call__(self, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Calls a coroutine function respecting the current rate.
+        Args:
+            func: a coroutine function, e.g. geolocator.reverse
+            *args: positional arguments for func
+            **kwargs: keyword arguments for func
+
+        Returns:
+        The result of func
+        """
+        if self._semaphore is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire()
+                request_number = self.requests
+                self.requests += 1
+                started_at = time.monotonic()
+                bypass_token = _bypass.set(None)
+                try:
+                    result = await func(*args, **kwargs)
+                    bypass = _bypass.get()
+                except self.retry_on as err:
+                    self.throttled += 1
+                    self._decrease(request_number)
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    retry_after = getattr(err, "retry_after", None) or 0
+                    await asyncio.sleep(max(self.backoff * 2 ** attempt, retry_after))
+                else:
+                    if bypass:
+                        self.throttled += 1
+                        self._decrease(request_number)
+                    elif bypass is None:
+                        if time.monotonic() - started_at > self.latency_target:
+                            self._decrease(request_number)
+                        else:
+                            self._increase()
+                    else:
+                        # The limited service was not called, the token is unused
+                        self._tokens = min(1.0, self._tokens + 1.0)
+                    return result
+                finally:
+                    _bypass.reset(bypass_token)
+
+    async def _acquire(self):
+        """Waits until the bucket has a token and takes it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._refilled_at is not None:
+                    self._tokens = min(
+                        1.0, self._tokens + (now - self._refilled_at) * self.rate
+                    )
+                self._refilled_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def _increase(self):
+        self.rate = min(self.max_rate, self.rate + self.increase_step / self.rate)
+
+    def _decrease(self, request_number: int):
+        # Calls sent before the previous decrease reflect the old rate, so they must
+        # not cut the rate once again
+        if request_number <= self._decreased_at_request:
+            return
+        self._decreased_at_request = self.requests - 1
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def stats(self) -> str:
+        """Returns a human-readable line with the settled rate and counters"""
+        return (
+            f"settled at {self.rate:.2f} requests/s, {self.requests} requests, "
+            f"{self.throttled} throttled, {self.retries} retries"
+        )
@@ -0,0 +1,131 @@
+"""This module contains a columnar weather table and vectorized statistics over it"""
+
+from typing import Mapping, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class WeatherStatistics(NamedTuple):
+    """
+    Results of compute_weather_statistics(). Every field is a DataFrame with one or
+    (extremely rarely) more rows.
+
+    Attributes:
+        max_temp: "date", "temp", "Country", "City" of the maximal temperature
+        min_temp: "date", "temp", "Country", "City" of the minimal temperature
+        max_temp_diff: "date", "temp_diff", "Country", "City" of the maximal
+            difference between max and min temperatures of a day
+        max_temp_delta: "temp_delta", "Country", "City" of the largest positive
+            change of mean temperature between the first and the last day
+    """
+
+    max_temp: pd.DataFrame
+    min_temp: pd.DataFrame
+    max_temp_diff: pd.DataFrame
+    max_temp_delta: pd.DataFrame
+
+
+def build_weather_table(
+    weather_dict: Mapping[Tuple[str, str], pd.DataFrame]
+) -> pd.DataFrame:
+    """
+    Stacks weather of many cities into a single long-format table.
+
+    Args:
+        weather_dict: A dictionary of {(country, city): weather_in_city_df}. Where
+            weather_in_city_df contains date, max_temp, min_temp for a city. This
+            data is supposed to be gotten from async_utils.get_weather
+
+    Returns:
+    A DataFrame with "city_id", "Country", "City", "date", "max_temp" and
+        "min_temp" columns, where "city_id" is the position of a city in
+        weather_dict and "date" is datetime64. Rows of a city keep their order and
+        index of weather_in_city_df.
+    """
+    city_keys = list(weather_dict)
+    frames = [weather_dict[key][["date", "max_temp", "min_temp"]] for key in city_keys]
+    city_ids = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+    countries = np.array([country for country, _ in city_keys], dtype=object)
+    cities = np.array([city for _, city in city_keys], dtype=object)
+
+    table = pd.concat(frames)
+    table["date"] = pd.to_datetime(table["date"])
+    table.insert(0, "city_id", city_ids)
+    table.insert(1, "Country", countries[city_ids])
+    table.insert(2, "City", cities[city_ids])
+    return table
+
+
+def crop_weather_table(weather_table: pd.DataFrame, today, days=5) -> pd.DataFrame:
+    """
+    Keeps only the rows of a weather table within a window around a date.
+
+    Args:
+        weather_table: a table built with build_weather_table()
+        today: the center of the window
+        days: half-width of the window in days
+
+    Returns:
+    Rows of weather_table not farther than days from today
+    """
+    distance = (weather_table["date"] - pd.Timestamp(today)).abs()
+    return weather_table[distance <= pd.Timedelta(days=days)]
+
+
+def compute_weather_statistics(weather_table: pd.DataFrame) -> WeatherStatistics:
+    """
+    Finds extreme temperatures across all the cities of a weather table at once.
+    Ties are kept, so any result may have several rows.
+
+    Args:
+        weather_table: a table built with build_weather_table()
+
+    Returns:
+    WeatherStatistics with the city and date of the maximal and minimal
+        temperature, the maximal daily temperature difference and the city with the
+        largest mean temperature change over the period.
+    """
+    max_temps = weather_table["max_temp"].to_numpy()
+    min_temps = weather_table["min_temp"].to_numpy()
+    temp_diffs = max_temps - min_temps
+
+    # The first and the last rows of every city are the start and the end of the
+    # period, as rows of a city are in date order
+    city_ids = weather_table["city_id"].to_numpy()
+    _, first_rows = np.unique(city_ids, return_index=True)
+    _, last_rows_reversed = np.unique(city_ids[::-1], return_index=True)
+    last_rows = len(city_ids) - 1 - last_rows_reversed
+    mean_temps = weather_table[["max_temp", "min_temp"]].mean(axis=1).to_numpy()
+    temp_deltas = mean_temps[last_rows] - mean_temps[first_rows]
+
+    max_delta_cities = temp_deltas == np.nanmax(temp_deltas)
+    max_temp_delta = (
+        weather_table.iloc[first_rows[max_delta_cities]][["Country", "City"]]
+        .assign(temp_delta=temp_deltas[max_delta_cities])
+        .reset_index(drop=True)
+    )
+
+    return WeatherStatistics(
+        max_temp=_select_rows(
+            weather_table, max_temps == np.nanmax(max_temps), "temp", max_temps
+        ),
+        min_temp=_select_rows(
+            weather_table, min_temps == np.nanmin(min_temps), "temp", min_temps
+        ),
+        max_temp_diff=_select_rows(
+            weather_table, temp_diffs == np.nanmax(temp_diffs), "temp_diff", temp_diffs
+        ),
+        max_temp_delta=max_temp_delta,
+    )
+
+
+def _select_rows(
+    weather_table: pd.DataFrame, rows: np.ndarray, column: str, values: np.ndarray
+) -> pd.DataFrame:
+    """
+    Takes "date", "Country" and "City" of selected rows and adds a column of values
+    """
+    return weather_table.loc[rows, ["date", "Country", "City"]].assign(
+        **{column: values[rows]}
+    )